@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# Expressions used for benchmarking, by category. Keep the lists
+# stable, or results stop being comparable with older runs.
+
+functions = {
+    'polynomial': ['x', '3x^2+2x-4', '3x^3-8x^2+2x-1',
+                   'x^4-3x^2+5x-3', '-(x-5)^3 x^2', '(x-1)^12',
+                   'x^7-3x^5+x^2-1'],
+    'rational': ['1/x', 'x/(2x+3)', '(x^2+1)/(x-1)', '(x-1)/(x^2+1)',
+                 '4/(x^2+1)', '(x^3-1)/(x^2-4)'],
+    'trigonometric': ['sin(x)', 'sin(2x)', 'cos(x)', 'tan(x)', 'sec(x)',
+                      'csc(x)', 'x-cos(x)', 'sin(x)/x',
+                      'sin(x)+cos(2x)'],
+    'logarithmic': ['log(x)', 'log(x-1)', 'xlog(x)', 'log(x)ln(x)',
+                    'log(abs(x))', 'x^2/log(x)'],
+    'exponential': ['2^x', '-2^(-x)', 'exp(x)', 'x^x', 'x exp(-x^2)'],
+    'root': ['sqrt(x)', 'sqrt(-x)', 'sqrt(x^2+3)', 'sqrt(1-x^2)',
+             'xsqrt(x^2-4)'],
+    'absolute': ['abs(x+2)-1', 'abs(x^3)']
+}
+
+# functions plotted together, like adding several of the example
+# functions to the same graph. Used for intersections and limits.
+graphs = {
+    'lines': ['x', '2x', '-x', 'x-1', '-x+3'],
+    'parabolas': ['x^2', '2x^2', '-x^2', '3x^2+2x-4', '(x-1)^2'],
+    'cubics': ['x^3', '2x^3', '-x^3', '(x+2)(x-1)(x-3)'],
+    'hyperbolas': ['1/x', '-1/x', '1/(x+2)', '2/x'],
+    'exponentials': ['2^x', '2^(-x)', 'exp(x)', '3^x'],
+    'logarithms': ['log(x)', 'log(x+1)', 'ln(x)', 'log(x)-2'],
+    'trigonometric': ['sin(x)', 'cos(x)', 'tan(x)', 'sin(2x)'],
+    'roots': ['sqrt(x)', 'sqrt(2x)', '-sqrt(x)', 'sqrt(x-1)'],
+    'mixed': ['x^2', 'sin(x)', 'log(x)', '1/x', 'sqrt(x)']
+}
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# Runs the benchmark corpus through every stage of the analysis and
+# writes the measurements as JSON. Run it from the top directory:
+#
+#   python -m benchmarks.run -o results.json
+#   python -m benchmarks.run --baseline results.json
+#
+# The expression cache is cleared before every stage, unless --warm
+# is given, so that sympy does its work for real.
+
+from __future__ import division
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import numpy
+import sympy
+from functionplot.Function import Function
+from functionplot.FunctionGraph import FunctionGraph
+from functionplot.ExprCache import cache
+from functionplot.WorkerPool import set_pool
+from benchmarks import corpus
+
+
+def _cpu():
+    t = os.times()
+    return t[0] + t[1]
+
+
+def _calls(before, after, i):
+    calls = {}
+    for name, counts in after.items():
+        n = counts[i] - before.get(name, (0, 0))[i]
+        if n:
+            calls[name] = n
+    return calls
+
+
+def _clear_cache():
+    cache.clear()
+
+
+def measure(pool, record, stage, warm=False):
+    """
+    Runs stage, a callable that returns a point count, and fills in
+    record with the measurements. An exception in stage is recorded
+    too, it doesn't stop the run.
+    """
+    if not warm:
+        cache.clear()
+        # workers have caches of their own. Idle workers take one task
+        # each, so this reaches all of them.
+        pool.run([(_clear_cache, ())] * pool.processes)
+    stats = cache.stats()
+    worker_cpu = pool.cpu_time
+    cpu = _cpu()
+    start = time.time()
+    try:
+        points = stage()
+    except Exception, e:
+        record['error'] = repr(e)
+        points = None
+    record['wall'] = time.time() - start
+    record['cpu'] = _cpu() - cpu
+    record['worker_cpu'] = pool.cpu_time - worker_cpu
+    record['peak_rss_kb'] = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, pool.max_rss)
+    record['points'] = points
+    after = cache.stats()
+    # misses are the calls sympy actually had to do
+    record['sympy_calls'] = _calls(stats, after, 1)
+    record['cache_hits'] = _calls(stats, after, 0)
+    return record
+
+
+def bench_function(pool, category, expr, warm=False):
+    fg = FunctionGraph()
+    xylimits = [fg.x_min, fg.x_max, fg.y_min, fg.y_max]
+    records = []
+    f = []
+
+    # the analysis is timed as a stage of its own
+    def create():
+        f.append(Function(expr, xylimits, lazy=True))
+        if not f[0].valid:
+            return 0
+        return len(f[0].graph_points[0])
+
+    def sample():
+        f[0].sample_cache.clear()
+        f[0].update_function_points(xylimits)
+        return len(f[0].graph_points[0])
+
+    def poi():
+        f[0].calc_poi()
+        return len(f[0].poi)
+
+    for name, stage in [('function', create), ('sample', sample),
+                        ('poi', poi)]:
+        record = {'kind': 'function', 'category': category,
+                  'name': expr, 'stage': name}
+        records.append(measure(pool, record, stage, warm))
+        if not f or not f[0].valid:
+            break
+    return records
+
+
+def bench_graph(pool, name, exprs, warm=False):
+    fg = FunctionGraph()
+    xylimits = [fg.x_min, fg.x_max, fg.y_min, fg.y_max]
+    for expr in exprs:
+        f = Function(expr, xylimits, fg.logscale)
+        if f.valid:
+            fg.functions.append(f)
+
+    def intersections():
+        fg.intersections = {}
+        fg.calc_intersections()
+        return len(fg.poi)
+
+    def limits_of():
+        fg.update_xylimits()
+        return sum(len(f.graph_points[0]) for f in fg.functions)
+
+    records = []
+    for stage_name, stage in [('intersections', intersections),
+                              ('xylimits', limits_of)]:
+        record = {'kind': 'graph', 'category': 'graph', 'name': name,
+                  'stage': stage_name}
+        records.append(measure(pool, record, stage, warm))
+    return records
+
+
+def run(categories=None, processes=None, warm=False):
+    """
+    Runs the corpus and returns the results. categories limits the
+    run to some of the corpus categories, 'graph' being the one of
+    the graphs.
+    """
+    pool = set_pool(processes)
+    results = []
+    for category in sorted(corpus.functions):
+        if categories and category not in categories:
+            continue
+        for expr in corpus.functions[category]:
+            results.extend(bench_function(pool, category, expr, warm))
+    if not categories or 'graph' in categories:
+        for name in sorted(corpus.graphs):
+            results.extend(bench_graph(pool, name, corpus.graphs[name],
+                                       warm))
+    meta = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'sympy': sympy.__version__,
+            'platform': platform.platform(),
+            'processes': pool.processes,
+            'warm': warm}
+    return {'meta': meta, 'results': results}
+
+
+def compare(baseline, current, out):
+    """
+    Writes a table of the wall time of every stage in current
+    compared to baseline.
+    """
+    old = {}
+    for r in baseline['results']:
+        old[(r['kind'], r['name'], r['stage'])] = r
+    out.write('%-40s %-14s %10s %10s %7s\n' %
+              ('name', 'stage', 'baseline', 'current', 'ratio'))
+    total_old = total_new = 0
+    for r in current['results']:
+        o = old.get((r['kind'], r['name'], r['stage']))
+        if o is None:
+            continue
+        total_old += o['wall']
+        total_new += r['wall']
+        ratio = r['wall'] / o['wall'] if o['wall'] else float('inf')
+        out.write('%-40s %-14s %10.4f %10.4f %7.2f\n' %
+                  (r['name'][:40], r['stage'], o['wall'], r['wall'],
+                   ratio))
+    if total_old:
+        out.write('%-40s %-14s %10.4f %10.4f %7.2f\n' %
+                  ('total', '', total_old, total_new,
+                   total_new / total_old))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the functionplot analysis pipeline.')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='write the results to FILE ' +
+                        '(default: stdout)')
+    parser.add_argument('-c', '--category', action='append',
+                        help='only run this corpus category, ' +
+                        'can be repeated. "graph" runs the graphs.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('--warm', action='store_true',
+                        help="don't clear the expression cache " +
+                        'between stages')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare wall times with an earlier run')
+    args = parser.parse_args(argv)
+    results = run(args.category, args.jobs, args.warm)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(json.load(f), results, sys.stderr)
+
+if __name__ == "__main__":
+    main()
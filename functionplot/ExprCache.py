@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+from sympy import Basic, srepr
+from collections import OrderedDict
+from logging import debug
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+
+class CacheMiss(Exception):
+    """
+    Raised by memoized functions in cached_only mode, when the result
+    is not in the cache.
+    """
+    pass
+
+
+class Uncached:
+    """
+    A memoized function can return its result wrapped in this, when
+    the result should not be cached.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _Raised:
+    # wraps an exception that a memoized function raised, so that it
+    # can be raised again on a cache hit
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _key(name, args):
+    k = [name]
+    for a in args:
+        if isinstance(a, Basic):
+            k.append(srepr(a))
+        else:
+            k.append(repr(a))
+    return tuple(k)
+
+
+class ExprCache:
+    """
+    Memoizes the results of slow sympy calls (simplify, diff, solve,
+    limit, pod...), keyed by the srepr of their arguments. Results
+    are kept in memory, in an LRU of max_entries entries, and
+    optionally in a directory on disk, so that they survive
+    restarts. The disk store is shared by all processes.
+    """
+
+    def memoize(self, name, exceptions=(NotImplementedError,),
+                key_args=None):
+        """
+        Returns a decorator that memoizes a function under the given
+        name. Any of the given exceptions raised by the function is
+        cached like a result. If key_args is given, only that many of
+        the first arguments are part of the key.
+        """
+        def decorator(f):
+            def wrapper(*args):
+                key = _key(name, args[:key_args])
+                found, value = self.get(key)
+                if not found:
+                    if self.is_cached_only():
+                        # not counted as a miss, whoever runs this
+                        # for real will count it
+                        raise CacheMiss(name)
+                    try:
+                        value = f(*args)
+                    except exceptions, e:
+                        value = _Raised(e)
+                    if isinstance(value, Uncached):
+                        return value.value
+                    self.put(key, value)
+                if isinstance(value, _Raised):
+                    raise value.exception
+                return value
+            wrapper.__name__ = f.__name__
+            wrapper.__doc__ = f.__doc__
+            return wrapper
+        return decorator
+
+    def get(self, key):
+        """
+        Returns (True, value) for a cached key, (False, None)
+        otherwise.
+        """
+        name = key[0]
+        with self._lock:
+            if key in self._entries:
+                value = self._entries.pop(key)
+                self._entries[key] = value
+                self._count(name, 0)
+                return True, value
+        if self.directory is not None:
+            try:
+                f = open(self._path(key), 'rb')
+                try:
+                    stored_key, value = pickle.load(f)
+                finally:
+                    f.close()
+                if stored_key == key:
+                    self._remember(key, value)
+                    self._count(name, 0)
+                    return True, value
+            except Exception:
+                pass
+        if not self.is_cached_only():
+            self._count(name, 1)
+        return False, None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((key, value))
+        if self.directory is not None:
+            try:
+                fd, tmp = tempfile.mkstemp(dir=self.directory)
+                f = os.fdopen(fd, 'wb')
+                try:
+                    pickle.dump((key, value), f, 2)
+                finally:
+                    f.close()
+                # rename is atomic, readers never see half a file
+                os.rename(tmp, self._path(key))
+            except Exception, e:
+                debug('Could not store cache entry: %r', e)
+
+    def cached_only(self):
+        """
+        Returns a context manager. Inside it, memoized functions
+        called from this thread raise CacheMiss instead of computing
+        results that are not cached.
+        """
+        return _CachedOnly(self._local)
+
+    def is_cached_only(self):
+        return getattr(self._local, 'cached_only', False)
+
+    def stats(self):
+        """
+        Returns a dict of name: (hits, misses)
+        """
+        with self._lock:
+            return dict((k, tuple(v)) for k, v in self._stats.items())
+
+    def set_directory(self, directory):
+        """
+        Sets the directory of the on-disk store. None disables it.
+        """
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._stats = {}
+
+    # worker processes keep a journal of the entries they add and of
+    # their hits and misses. It's sent back to the parent process
+    # along with every task result and merged into its cache.
+    def start_journal(self):
+        with self._lock:
+            self._journal = []
+            self._journal_stats = {}
+
+    def drain(self):
+        with self._lock:
+            if self._journal is None:
+                return None
+            journal = self._journal, self._journal_stats
+            self._journal = []
+            self._journal_stats = {}
+            return journal
+
+    def merge(self, journal):
+        if journal is None:
+            return
+        entries, stats = journal
+        for key, value in entries:
+            self._remember(key, value)
+        with self._lock:
+            for name, counts in stats.items():
+                total = self._stats.setdefault(name, [0, 0])
+                total[0] += counts[0]
+                total[1] += counts[1]
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, name, i):
+        with self._lock:
+            self._stats.setdefault(name, [0, 0])[i] += 1
+            if self._journal is not None:
+                self._journal_stats.setdefault(name, [0, 0])[i] += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(repr(key)).hexdigest())
+
+    def __init__(self, max_entries=10000, directory=None):
+        self.max_entries = max_entries
+        self.directory = None
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._journal = None
+        self.clear()
+        self.set_directory(directory)
+
+
+class _CachedOnly:
+
+    def __init__(self, local):
+        self.local = local
+
+    def __enter__(self):
+        self.previous = getattr(self.local, 'cached_only', False)
+        self.local.cached_only = True
+
+    def __exit__(self, *args):
+        self.local.cached_only = self.previous
+
+
+# the cache shared by everything in this process
+cache = ExprCache()
+memoize = cache.memoize
@@ -3,94 +3,86 @@
 
 from __future__ import division
 import numpy as np
-from sympy import diff, limit, simplify, latex, pi
+from sympy import latex, Poly, Symbol, E, PolynomialError
 from sympy.functions import Abs
 from PointOfInterest import PointOfInterest as POI
-from helpers import pod, fsolve, rfc, log10, sample, keep10
+from helpers import pod, fsolve, rfc, log10, keep10, compile_expr, \
+    add_edge_points, simplify, diff, limit, has_period, trig_period, \
+    solve_deadline
+from WorkerPool import get_pool
+from ExprCache import cache, CacheMiss
+from Report import Report, Phase, recording, phase, timed
+from SampleCache import SampleCache
+from roots import find_roots, real_roots
+from intervals import isolate_roots
 from logging import debug
 import re
+import time
+import types
 
-win32 = True
-try:
-    import winshell
-except ImportError:
-    win32 = False
+# seconds to wait for a single POI job before its worker is killed
+poi_timeout = 60
 
-# don't use multiprocessing on win32. It causes huge slowdowns
-# because of the lack of os.fork()
-if win32:
-    from threading import Thread as fProcess
-    from Queue import Queue as fQueue
-else:
-    from multiprocessing import Process as fProcess
-    from multiprocessing import Queue as fQueue
+# seconds that all the sympy solves of a function's analysis can take
+# together. Solves still running when it runs out are stopped, the
+# ones that didn't start yet are cancelled.
+solve_budget = 10
+
+# interval evaluations that isolating the roots of an expression can
+# take, before falling back to sampling it
+isolate_work = 20000
+
+# bump it when the analysis changes, so that the results saved in
+# graph files by older versions are worked out again
+analysis_version = 1
 
 
 class Function:
 
     def update_function_points(self, xylimits):
+        points = self.calc_function_points(xylimits)
+        if points is None:
+            return False
+        self.graph_points = points
+        return True
+
+    def calc_function_points(self, xylimits):
+        """
+        Returns the x and y values of the graph points for xylimits,
+        or None if sampling fails. The graph points are not changed,
+        so it can run in another thread while the graph is drawn.
+        """
         x_min, x_max, y_min, y_max = xylimits
-        x_initial = np.linspace(x_min, x_max, self.resolution)
         try:
-            x, y_arr = sample(self.np_expr, x_initial)
-            y = y_arr[0]
+            # only the parts of the graph that were not sampled
+            # before are actually sampled
+            with recording(self.report), phase('sample') as p:
+                x, y = self.sample_cache.get(self.np_func, x_min, x_max,
+                                             self.resolution)
+                p.size = len(x)
         except IndexError:
             # if f(x)=a, make sure that y is an array with the
             # same size as x and with a constant value.
-            debug('This looks like a constant function: ' +
-                  self.np_expr)
+            debug('This looks like a constant function: %s', self.simp_expr)
             self.constant = True
             # 2 graph points are enough for a constant function
             x = np.array([x_min, x_max])
-            this_y = eval(self.np_expr)
+            this_y = self.np_func(x_min)
             y = np.array([this_y, this_y])
         except Exception, e:
-            debug('Exception caught.' +
-                  'This should not have happened here: ' + e)
-            return False
+            debug('Exception caught. This should not have happened '
+                  'here: %s', e)
+            return None
         # no need to calculate values that are off the displayed
         # scale. This fixes some trouble with asymptotes like in
         # tan(x).
         if not self.constant:
             y[y > y_max] = np.inf
             y[y < y_min] = -np.inf
-        y_mean = (y_max + y_min) / 2
-        # delete consecutive inf or -inf values
-        delete = []
-        for i in xrange(1, len(x)):
-            if y[i] == np.inf and y[i - 1] == np.inf:
-                delete.append(i)
-            if y[i] == -np.inf and y[i - 1] == -np.inf:
-                delete.append(i)
-        x = np.delete(x, delete)
-        y = np.delete(y, delete)
         # add points at the edge of the graph
-        addyinf = []
-        addx = []
-        for i in xrange(1, len(x)):
-            if y[i] == np.inf and y[i - 1] > y_mean:
-                addyinf.append(i)
-                addx.append(x[i - 1])
-            if y[i] > y_mean and y[i - 1] == np.inf:
-                addyinf.append(i)
-                addx.append(x[i])
-        x = np.insert(x, addyinf, addx)
-        y = np.insert(y, addyinf, y_max)
-        addyinf = []
-        addx = []
-        for i in xrange(1, len(x)):
-            if y[i] == -np.inf and y[i - 1] < y_mean:
-                addyinf.append(i)
-                addx.append(x[i - 1])
-            if y[i] < y_mean and y[i - 1] == -np.inf:
-                addyinf.append(i)
-                addx.append(x[i])
-        x = np.insert(x, addyinf, addx)
-        y = np.insert(y, addyinf, y_min)
-
-        self.graph_points = x, y
-        debug('Number of points calculated:' + str(len(x)))
-        return True
+        x, y = add_edge_points(x, y, y_min, y_max)
+        debug('Number of points calculated:%s', len(x))
+        return x, y
 
     def _get_expr(self, expr):
         # caps to lowercase
@@ -127,29 +119,6 @@ class Function:
         expr = expr.replace('ep(', 'exp(')
         return expr
 
-    def _get_np_expr(self, expr):
-        # add "np." prefix to trig functions
-        expr = expr.replace('sin(', 'np.sin(')
-        expr = expr.replace('cos(', 'np.cos(')
-        expr = expr.replace('tan(', 'np.tan(')
-        expr = expr.replace('cot(', '1/np.tan(')  # no cot in numpy
-        expr = expr.replace('sec(', '1/np.cos(')  # no sec,
-        expr = expr.replace('csc(', '1/np.sin(')  # and no csc either
-        # correct log functions
-        expr = expr.replace('log10(', 'np.log10(')
-        expr = expr.replace('log(', 'np.log(')
-        # square root
-        expr = expr.replace('sqrt(', 'np.sqrt(')
-        # absolute value. For numpy, turn the sympy Abs function
-        # to np.abs
-        expr = expr.replace('Abs(', 'np.abs(')
-        # pi and e (e also covers exp->np.exp)
-        expr = expr.replace('pi', 'np.pi')
-        expr = expr.replace('e', 'np.e')
-        # powers
-        expr = expr.replace('^', '**')
-        return expr
-
     def _simplify_expr(self, expr):
         # sympy.functions.Abs is imported as Abs so we're using it
         # that way with sympy
@@ -166,8 +135,7 @@ class Function:
         expr = expr.replace('ln(', 'log(')
 
         simp_expr = simplify(expr)
-        debug('"' + expr + '" has been simplified to "' +
-              str(simp_expr) + '"')
+        debug('"%s" has been simplified to "%s"', expr, simp_expr)
         return simp_expr
 
     def _get_mathtex_expr(self, expr):
@@ -181,161 +149,150 @@ class Function:
         e = '$' + e + '$'
         return e
 
-    def _calc_y_intercept(self, q, expr):
-        debug('Looking for the y intercept for: ' + str(expr))
+    def _calc_y_intercept(self, expr):
+        debug('Looking for the y intercept for: %s', expr)
         y = expr.subs('x', 0)
+        poi = None
         if str(y) == 'zoo' or str(y) == 'nan':
             # 'zoo' is imaginary infinity
             debug('The Y axis is actually a vertical asymptote.')
             debug('Added vertical asymptote (0,0)')
-            q.put(POI(0, 0, 6))
+            poi = POI(0, 0, 6)
         else:
             yc = rfc(y)
             if yc is not None and 'inf' not in str(yc):
-                debug('Added y intercept at (0,' + str(yc) + ')')
-                q.put(POI(0, yc, 3))
-            else:
-                q.put(None)
+                debug('Added y intercept at (0,%s)', yc)
+                poi = POI(0, yc, 3)
         debug('Done calculating y intercept')
+        return poi
 
-    def _calc_x_intercepts(self, q, expr):
-        debug('Looking for x intercepts for: ' + str(expr))
+    def _calc_x_intercepts(self, expr):
+        debug('Looking for x intercepts for: %s', expr)
         x = fsolve(expr)
         poi = []
-        manual = False
         if x is None:
-            manual = True
-            x = self._calc_x_intercepts_manually()
+            x = self._calc_x_intercepts_manually(expr)
         for xc in x:
             poi.append(POI(xc, 0, 2))
-            debug('Added x intercept at (' + str(xc) + ',0)')
-        # try to find if the function is periodic using the
-        # distance between the x intercepts
-        if self.trigonometric and not self.periodic and \
-                not self.polynomial and not manual and x != []:
-            debug('Checking if function is periodic using' +
-                  ' x intercepts.')
-            if not manual:
-                self.check_periodic(x)
+            debug('Added x intercept at (%s,0)', xc)
         if poi == []:
             debug('Done calculating x intercepts. None found.')
         else:
             debug('Done calculating x intercepts')
-        q.put(poi)
+        return poi
 
-    def _calc_x_intercepts_manually(self):
+    @timed('manual fallback')
+    def _calc_x_intercepts_manually(self, expr):
         debug('Calculating x intercepts manually')
-        x = np.linspace(self.x_min_manual, self.x_max_manual, 10000)
-        y = eval(self.np_expr)
-        sol = []
-        for i in xrange(2, len(y) - 1):
-            if ((y[i] == 0) or
-                    (y[i - 2] < y[i - 1] < 0 and y[i + 1] > y[i] > 0) or
-                    (y[i - 2] > y[i - 1] > 0 and y[i + 1] < y[i] < 0)):
-                sol.append(x[i])
+        sol = self._find_roots(expr, diff(expr, 'x'), self.np_func)
         sol = keep10(sol)
         return sol
 
-    def _calc_min_max(self, q, f1, expr):
-        debug('Looking for local min/max for: ' + str(expr))
+    def _compile(self, expr):
+        # compile_expr, but returns None if expr can't be evaluated
+        try:
+            func = compile_expr(expr)
+            # unevaluated derivatives only fail when called
+            with np.errstate(all='ignore'):
+                func(np.array([self.x_min_manual]))
+        except NameError:
+            return None
+        return func
+
+    def _find_roots(self, expr, df=None, func=None, jumps=False):
+        # roots of expr within the manual search limits. df is the
+        # derivative of expr, if there's one at hand. Interval root
+        # isolation finds them all. If expr is not supported, or it
+        # takes too long, func (or expr compiled) is sampled instead.
+        with phase('find_roots', expr) as p:
+            sol = isolate_roots(expr, self.x_min_manual,
+                                self.x_max_manual, df, isolate_work,
+                                jumps=jumps)
+            if sol is None:
+                p.outcome = 'sampled'
+                if func is None:
+                    func = compile_expr(expr)
+                dfunc = None
+                if df is not None:
+                    dfunc = self._compile(df)
+                sol = find_roots(func, self.x_min_manual,
+                                 self.x_max_manual, dfunc=dfunc,
+                                 jumps=jumps)
+            else:
+                p.outcome = 'isolated'
+            p.size = len(sol)
+        return list(sol)
+
+    def _calc_min_max(self, f1, expr):
+        debug('Looking for local min/max for: %s', expr)
         x = fsolve(f1)
         poi = []
-        manual = False
         if x is None:
-            manual = True
-            x = self._calc_min_max_manually()
+            x = self._calc_min_max_manually(f1)
         for xc in x:
             y = expr.subs('x', xc)
             yc = rfc(y)
             if yc is not None:
                 poi.append(POI(xc, yc, 4))
-                debug('Added local min/max at (' + str(xc) + ',' +
-                      str(yc) + ')')
-        if self.trigonometric and not self.periodic and \
-                not self.polynomial and not manual and x != []:
-            debug('Checking if function is periodic using' +
-                  ' min/max.')
-            if not manual:
-                self.check_periodic(x)
+                debug('Added local min/max at (%s,%s)', xc, yc)
         if poi == []:
             debug('Done calculating min/max. None found.')
         else:
             debug('Done calculating min/max')
-        q.put(poi)
+        return poi
 
-    def _calc_min_max_manually(self):
+    @timed('manual fallback')
+    def _calc_min_max_manually(self, f1):
         debug('Calculating local min/max manually')
-        x = np.linspace(self.x_min_manual, self.x_max_manual, 10000)
-        y = eval(self.np_expr)
-        sol = []
-        for i in xrange(2, len(y) - 2):
-            dx = x[i - 1] - x[i]
-            dy = y[i - 1] - y[i]
-            if y[i - 2] > y[i - 1] > y[i] < y[i + 1] < y[i + 2] and \
-                    0 <= abs(dy / dx) < 10:
-                sol.append(x[i])
-            elif y[i - 2] < y[i - 1] < y[i] > y[i + 1] > y[i + 2] and\
-                    0 <= abs(dy / dx) < 10:
-                sol.append(x[i])
+        # local min/max are where the first derivative changes sign,
+        # either going through zero or jumping, like at the corner of
+        # abs(x)
+        f1_func = self._compile(f1)
+        if f1_func is None:
+            debug('Not possible to evaluate first derivative. ' +
+                  'Using central differences.')
+            h = 1e-7
+            f1_func = lambda x: (self.np_func(x + h) -
+                                 self.np_func(x - h)) / (2 * h)
+        sol = self._find_roots(f1, diff(f1, 'x'), f1_func, jumps=True)
         sol = keep10(sol)
         return sol
 
-    def _calc_inflection(self, q, f2, expr):
-        debug('Looking for inflection points for: ' + str(expr))
+    def _calc_inflection(self, f2, expr):
+        debug('Looking for inflection points for: %s', expr)
         x = fsolve(f2)
         poi = []
-        manual = False
         if x is None:
-            manual = True
             x = self._calc_inflection_manually(f2)
         for xc in x:
             y = expr.subs('x', xc)
             yc = rfc(y)
             if yc is not None:
                 poi.append(POI(xc, yc, 5))
-                debug('Added inflection point at (' +
-                      str(xc) + ',' + str(yc) + ')')
-        if self.trigonometric and not self.periodic and \
-                not self.polynomial and not manual and x != []:
-            debug('Checking if function is periodic using' +
-                  ' inflection points.')
-            if not manual:
-                self.check_periodic(x)
+                debug('Added inflection point at (%s,%s)', xc, yc)
         if poi == []:
             debug('Done calculating inflection points. None found.')
         else:
             debug('Done calculating inflection points')
-        q.put(poi)
+        return poi
 
+    @timed('manual fallback')
     def _calc_inflection_manually(self, f2):
         debug('Calculating inflection points manually')
-        npexpr = self._get_np_expr(str(f2))
-        x = np.linspace(self.x_min_manual, self.x_max_manual, 10000)
         sol = []
         try:
-            y = eval(npexpr)
-            for i in xrange(2, len(y) - 1):
-                if ((y[i] == 0) or
-                        (y[i - 2] < y[i - 1] < 0 and y[i] > 0) or
-                        (y[i - 2] > y[i - 1] > 0 and y[i] < 0)):
-                    sol.append(x[i])
+            sol = self._find_roots(f2, diff(f2, 'x'))
         except NameError:
             debug('Not possible to evaluate second derivative')
-        except TypeError:
-            debug('Second derivative is probably constant. ' +
-                  'No inflection points found.')
         sol = keep10(sol)
         return sol
 
-    def _calc_slope_45(self, q, f1, expr):
-        debug('Looking for points where slope is 45 degrees for: ' +
-              str(expr))
+    def _calc_slope_45(self, f1, expr):
+        debug('Looking for points where slope is 45 degrees for: %s', expr)
         x1 = fsolve(f1 - 1)
         x2 = fsolve(f1 + 1)
         poi = []
-        manual = False
         if x1 is None and x2 is None:
-            manual = True
             x = self._calc_slope45_manually(f1)
         elif x1 is None:
             x = x2
@@ -348,45 +305,32 @@ class Function:
             yc = rfc(y)
             if yc is not None:
                 poi.append(POI(xc, yc, 8))
-                debug('Added slope45 point at (' +
-                      str(xc) + ',' + str(yc) + ')')
-        if self.trigonometric and not self.periodic and \
-                not self.polynomial and x != []:
-            debug('Checking if function is periodic using' +
-                  ' slope45 points.')
-            if not manual:
-                self.check_periodic(x)
+                debug('Added slope45 point at (%s,%s)', xc, yc)
         if poi == []:
             debug('Done calculating slope45 points. None found.')
         else:
             debug('Done calculating slope45 points')
-        q.put(poi)
+        return poi
 
+    @timed('manual fallback')
     def _calc_slope45_manually(self, f1):
         debug('Calculating slope45 points manually')
-        npexpr = self._get_np_expr(str(f1))
-        x = np.linspace(self.x_min_manual, self.x_max_manual, 10000)
         sol = []
         try:
-            y = eval(npexpr)
-            for i in xrange(1, len(y) - 1):
-                if ((y[i] == 1) or (y[i] == -1) or
-                        (y[i - 1] < 1 and y[i] > 1) or
-                        (y[i - 1] > 1 and y[i] < 1) or
-                        (y[i - 1] < -1 and y[i] > -1) or
-                        (y[i - 1] > -1 and y[i] < -1)):
-                    sol.append(x[i])
+            f2 = diff(f1, 'x')
+            sol = self._find_roots(f1 - 1, f2) + \
+                self._find_roots(f1 + 1, f2)
+            sol.sort()
         except NameError:
             debug('Not possible to evaluate first derivative')
-        except TypeError:
-            debug('First derivative is probably constant. ' +
-                  'No slope45 points found.')
         sol = keep10(sol)
         return sol
 
-    def _calc_vertical_asym(self, q, expr):
-        debug('Looking for vertical asymptotes for: ' + str(expr))
-        x = pod(expr, 'x')
+    def _calc_vertical_asym(self, expr):
+        debug('Looking for vertical asymptotes for: %s', expr)
+        with phase('pod', expr) as p:
+            x = pod(expr, 'x')
+            p.size = len(x)
         poi = []
         for i in x:
             y = expr.subs('x', i)
@@ -396,193 +340,299 @@ class Function:
             if xc is not None:
                 yc = 0
                 poi.append(POI(xc, yc, 6))
-                debug('Added vertical asymptote (' + str(xc) + ',' +
-                      str(yc) + ')')
-        if self.trigonometric and not self.periodic and \
-                not self.polynomial and x != []:
-            debug('Checking if function is periodic using' +
-                  ' vertical asymptotes.')
-            self.check_periodic(x)
+                debug('Added vertical asymptote (%s,%s)', xc, yc)
         if poi == []:
             debug('Done calculating vertical asymptotes.' +
                   'None found.')
         else:
             debug('Done calculating vertical asymptotes')
-        q.put(poi)
+        return poi
 
-    def _calc_horizontal_asym(self, q, expr):
+    def _calc_horizontal_asym(self, expr):
         # if the limit(x->+oo)=a, or limit(x->-oo)=a, then
         # y=a is a horizontal asymptote.
-        debug('Looking for horizontal asymptotes for: ' +
-              str(expr))
+        debug('Looking for horizontal asymptotes for: %s', expr)
+        poi = []
         try:
-            poi = []
             lr = limit(expr, 'x', 'oo')
             ll = limit(expr, 'x', '-oo')
             if 'oo' not in str(lr):
-                debug('Found a horizontal asymptote at y=' +
-                      str(lr) + ' as x->+oo.')
+                debug('Found a horizontal asymptote at y=%s as x->+oo.', lr)
                 poi.append(POI(0, lr, 7))
             if 'oo' not in str(ll):
                 if ll == lr:
                     debug('Same horizontal asymptote as x->-oo.')
                 else:
-                    debug('Found a horizontal asymptote at y=' +
-                          str(ll) + ' as x->-oo')
+                    debug('Found a horizontal asymptote at y=%s as x->-oo', ll)
                     poi.append(POI(0, ll, 7))
-            q.put(poi)
+            return poi
         except NotImplementedError:
-            debug('NotImplementedError for finding limit of "' +
-                  str(expr) + '"')
+            debug('NotImplementedError for finding limit of "%s"', expr)
         if poi == []:
             debug('Done calculating horizontal asymptotes.' +
                   'None found.')
         else:
             debug('Done calculating horizontal asymptotes')
+        return poi
 
-    def calc_poi(self):
+    def _poly_coeffs(self, expr):
+        # the coefficients of a polynomial as floats, highest power
+        # first, or None if they're not all numbers. Constants like
+        # sqrt(2) or pi don't count: their multiple roots can't be
+        # told from close ones once they're floats.
+        try:
+            coeffs = Poly(expr, Symbol('x')).all_coeffs()
+        except PolynomialError:
+            return None
+        if not all(c.is_Number for c in coeffs):
+            return None
+        return np.array([float(c) for c in coeffs])
+
+    def _rational_coeffs(self, expr):
+        # the coefficients of the numerator and the denominator of a
+        # ratio of polynomials, without common factors, or None if
+        # expr is something else
+        x = Symbol('x')
+        n, d = expr.as_numer_denom()
+        try:
+            n, d = Poly(n, x), Poly(d, x)
+            if d.degree() < 1:
+                return None
+            g = n.gcd(d)
+            n = self._poly_coeffs(n.quo(g).as_expr())
+            d = self._poly_coeffs(d.quo(g).as_expr())
+        except PolynomialError:
+            return None
+        # coefficients that aren't numbers are left to the generic
+        # asymptote jobs
+        if n is None or d is None:
+            return None
+        return n, d
+
+    def _calc_asym_rational(self, n, d):
+        # the vertical asymptotes of a rational function are the real
+        # roots of its denominator, n and d having no common factors.
+        # Its limit at both infinities depends only on the leading
+        # terms.
+        debug('Calculating asymptotes of rational function: %s / %s',
+              n, d)
+        poi = [POI(rfc(xc), 0, 6) for xc in real_roots(d)]
+        if len(n) < len(d):
+            poi.append(POI(0, 0, 7))
+        elif len(n) == len(d):
+            poi.append(POI(0, rfc(n[0] / d[0]), 7))
+        return poi
+
+    def _calc_poi_polynomial(self, c):
+        # all the POIs of a polynomial come from the real roots of
+        # polynomials derived from its coefficients, c. No sympy
+        # solving and no workers needed.
+        debug('Calculating POIs of polynomial: %s', c)
+        c1 = np.polyder(c)
+        c2 = np.polyder(c1)
+        poi = [POI(0, rfc(np.polyval(c, 0)), 3)]
+        for xc in real_roots(c):
+            poi.append(POI(rfc(xc), 0, 2))
+        for point_type, roots in [
+                (4, real_roots(c1)),
+                (5, real_roots(c2)),
+                (8, np.concatenate([real_roots(np.polysub(c1, [1])),
+                                    real_roots(np.polyadd(c1, [1]))]))]:
+            for xc in roots:
+                poi.append(POI(rfc(xc), rfc(np.polyval(c, xc)),
+                               point_type))
+        return poi
+
+    def analyse(self, publish=None):
+        """
+        Finds the POIs of the function. publish, if given, is called
+        with the POIs of every job as soon as the job is done. They
+        are in poi by then, so the function can be drawn with the
+        POIs found so far.
+        """
+        with recording(self.report):
+            self.calc_poi(publish)
+        self.analysed = True
+
+    def set_analysis(self, f):
+        """
+        Takes the POIs and everything else analyse() found from f, a
+        copy of the function that was analysed in another thread.
+        """
+        for k in ['period', 'periodic', 'x_min_manual', 'x_max_manual',
+                  'solve_deadline', 'analysed']:
+            if k in f.__dict__:
+                setattr(self, k, getattr(f, k))
+        for i in f.poi:
+            i.function = self
+        self.poi = f.poi
+        self.report.extend(f.report.phases)
+
+    def calc_poi(self, publish=None):
         expr = self.simp_expr
         self.poi = []
-        # for trig functions, test common periods first
+        if self.polynomial and not self.constant:
+            c = self._poly_coeffs(expr)
+            if c is not None:
+                with phase('_calc_poi_polynomial', expr) as p:
+                    poi = self._calc_poi_polynomial(c)
+                    p.size = len(poi)
+                self._merge(poi, publish)
+                return
+        # all solves of all jobs share the same time budget
+        self.solve_deadline = time.time() + self.solve_budget
+        # for trig functions, find the period first. The manual POI
+        # searches then only need to cover one period.
         if self.trigonometric and not self.polynomial:
-            self._test_common_periods()
-        #
-        # y intercept
-        #
-        q_y = fQueue()
-        p_y = fProcess(target=self._calc_y_intercept,
-                       args=(q_y, expr,))
-        p_y.start()
+            self._find_period()
+        # asymptotes of rational functions are found right here,
+        # without pod and limit
+        rational = None
+        if not self.constant:
+            rational = self._rational_coeffs(expr)
+        if rational is not None:
+            with phase('_calc_asym_rational', expr) as p:
+                poi = self._calc_asym_rational(*rational)
+                p.size = len(poi)
+            self._merge(poi, publish)
+        base = self.poi
+        # every POI type is a separate job. All jobs are handed to
+        # the worker pool together and run in parallel.
+        jobs = [('_calc_y_intercept', expr)]
         if not self.constant:
             # calculate 1st and 2nd derivatives
             f1 = diff(expr, 'x')
             f2 = diff(f1, 'x')
-            #
-            # x intercepts
-            #
-            q_x = fQueue()
-            p_x = fProcess(target=self._calc_x_intercepts,
-                           args=(q_x, expr,))
-            #
-            # min/max
-            #
-            q_min_max = fQueue()
-            p_min_max = fProcess(target=self._calc_min_max,
-                                 args=(q_min_max, f1, expr,))
-            #
-            # inflection points
-            #
-            q_inflection = fQueue()
-            p_inflection = fProcess(target=self._calc_inflection,
-                                    args=(q_inflection, f2, expr,))
-            #
-            # vertical asymptotes
-            #
-            q_vertical_asym = fQueue()
-            p_vertical_asym = \
-                fProcess(target=self._calc_vertical_asym,
-                         args=(q_vertical_asym, expr,))
-            #
-            # horizontal asymptotes
-            #
-            q_horizontal_asym = fQueue()
-            p_horizontal_asym = \
-                fProcess(target=self._calc_horizontal_asym,
-                         args=(q_horizontal_asym, expr,))
-            #
-            # points where the slope is 45 degrees
-            #
-            q_slope_45 = fQueue()
-            p_slope_45 = fProcess(target=self._calc_slope_45,
-                                  args=(q_slope_45, f1, expr,))
-            # start processes, different process for each POI type
-            p_x.start()
-            p_min_max.start()
-            p_inflection.start()
-            p_vertical_asym.start()
-            p_horizontal_asym.start()
-            p_slope_45.start()
-            # get the processes output
-            poi_x = q_x.get()
-            poi_min_max = q_min_max.get()
-            poi_inflection = q_inflection.get()
-            poi_vertical_asym = q_vertical_asym.get()
-            poi_horizontal_asym = q_horizontal_asym.get()
-            poi_slope_45 = q_slope_45.get()
-            # wait until all processes are done
-            p_x.join()
-            p_min_max.join()
-            p_inflection.join()
-            p_vertical_asym.join()
-            p_horizontal_asym.join()
-            p_slope_45.join()
-            # gather POIs
-            for i in poi_x:
-                self.poi.append(i)
-            for i in poi_min_max:
-                self.poi.append(i)
-            for i in poi_inflection:
-                self.poi.append(i)
-            for i in poi_vertical_asym:
-                self.poi.append(i)
-            for i in poi_horizontal_asym:
-                self.poi.append(i)
-            for i in poi_slope_45:
-                self.poi.append(i)
+            jobs.append(('_calc_x_intercepts', expr))
+            jobs.append(('_calc_min_max', f1, expr))
+            jobs.append(('_calc_inflection', f2, expr))
+            if rational is None:
+                jobs.append(('_calc_vertical_asym', expr))
+                jobs.append(('_calc_horizontal_asym', expr))
+            jobs.append(('_calc_slope_45', f1, expr))
+        results = self._run_cached(jobs)
+        pending = [i for i, r in enumerate(results) if r is CacheMiss]
+        for r in results:
+            if r is not CacheMiss:
+                self._merge(r[0], publish)
+        if pending:
+            for k, r in get_pool().imap(
+                    [(self._run_job, jobs[i]) for i in pending],
+                    poi_timeout):
+                i = pending[k]
+                if r is None:
+                    # the worker was killed
+                    r = None, [Phase(jobs[i][0], duration=poi_timeout,
+                                     outcome='timed out')]
+                results[i] = r
+                self._merge(r[0], publish)
+        # phases recorded by the jobs go to the report of this function
+        for poi, phases in results:
+            self.report.extend(phases)
+        results = [poi for poi, phases in results]
+        poi_y = results[0]
+        # gather POIs in the order of the jobs, however they finished
+        poi = list(base)
+        for i in results[1:]:
+            if i is not None:
+                poi.extend(i)
         # Add y intercept to POIs (if any)
-        poi_y = q_y.get()
-        p_y.join()
         if poi_y is not None:
-            self.poi.append(poi_y)
-        # assign all POI to the present function
-        for i in self.poi:
+            poi.append(poi_y)
+        self.poi = poi
+
+    def _merge(self, poi, publish):
+        # adds the POIs of a job to poi and assigns them to the
+        # present function. poi is replaced rather than changed, as
+        # it may be read in another thread meanwhile.
+        if poi is None:
+            return
+        if not isinstance(poi, list):
+            poi = [poi]
+        for i in poi:
             i.function = self
+        self.poi = self.poi + poi
+        if publish is not None and poi:
+            publish(poi)
+
+    def _run_cached(self, jobs):
+        # if an expression was analysed before, the sympy results all
+        # jobs need are cached, so there's no need to hand them to the
+        # pool. Try running every job here, in cached only mode. Jobs
+        # that need something that's not cached are left as CacheMiss.
+        # Jobs run on a copy, as they would in a worker, so that they
+        # don't change self. Jobs don't change the functions they run
+        # on, so a single copy does for all of them, and it shares the
+        # compiled function instead of compiling it again.
+        f = types.InstanceType(Function, self.__getstate__())
+        f.np_func = self.np_func
+        results = []
+        for job in jobs:
+            try:
+                with cache.cached_only():
+                    results.append(f._run_job(*job))
+            except CacheMiss:
+                results.append(CacheMiss)
+        return results
 
-    def check_periodic(self, x):
-        l = len(x)
-        if l > 1:
-            for i in xrange(0, l - 1):
-                if not self.periodic:
-                    for j in xrange(1, l):
-                        if not self.periodic:
-                            for n in xrange(1, 11):
-                                if not self.periodic:
-                                    period = abs(n * (x[j] - x[i]))
-                                    self._test_period(period)
-
-    def _test_period(self, period):
-        if period != 0:
-            debug('Trying period: ' + str(period))
-            pf = self.simp_expr.subs('x', 'x+period')
-            # instead of testing if f(x)==f(x+period)
-            # we're testing if f(x+period)==f(x+2*period)
-            # solves problems like with sec(x) where otherwise it
-            # would not find the equality
-            f = pf.subs('period', period)
-            g = pf.subs('period', 2 * period)
-            if f - g == 0:
-                debug('Function is periodic and has a period of ' +
-                      str(period) + '. Smaller periods may exist.')
-                self.periodic = True
-                self.period = period
-                margin = float(self.period * 0.6)
-                self.x_min_manual = -margin
-                self.x_max_manual = margin
-
-    # checks the functions for some common periods
-    # multiples of 0.25 (up to 1)
-    # multiples of 1 (up to 4)
-    # multiples of pi/4 (up to 2*pi)
-    # multiples of pi (up to 4*pi)
-    def _test_common_periods(self):
-        debug('Trying some common periods to determine if ' +
-              'function is periodic')
-        period_list = [pi / 4, pi / 2, 2 * pi / 3, 3 * pi / 4, pi,
-                       2 * pi, 3 * pi / 2, 3 * pi, 4 * pi,
-                       0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4]
-        for period in period_list:
-            if not self.periodic:
-                self._test_period(period)
+    def _run_job(self, name, *args):
+        # runs a _calc_* job and returns its result, along with the
+        # phases recorded while running it. Jobs usually run in a
+        # worker, so they can't record in self.report directly.
+        report = Report()
+        value = None
+        with recording(report), solve_deadline(self.solve_deadline):
+            try:
+                with phase(name) as p:
+                    value = getattr(self, name)(*args)
+                    if isinstance(value, list):
+                        p.size = len(value)
+                    else:
+                        p.size = int(value is not None)
+            except CacheMiss:
+                raise
+            except Exception, e:
+                debug('Exception in job: %r', e)
+        return value, list(report.phases)
+
+    def _find_period(self):
+        # the period worked out from the expression tree is checked
+        # once with sympy, and numerically if sympy can't tell
+        expr = self.simp_expr
+        with phase('_find_period', expr) as p:
+            period = trig_period(expr)
+            if period is None or not (has_period(expr, period) or
+                                      self._numeric_period(period)):
+                p.outcome = 'not periodic'
+                return
+            # it may be a multiple of the smallest period, like 2*pi
+            # is for sin(x)**2
+            for n in xrange(12, 1, -1):
+                if self._numeric_period(period / n):
+                    period = period / n
+                    break
+            p.outcome = 'periodic'
+        debug('Function is periodic and has a period of %s.', period)
+        self.periodic = True
+        self.period = period
+        margin = float(self.period * 0.6)
+        self.x_min_manual = -margin
+        self.x_max_manual = margin
+
+    def _numeric_period(self, period):
+        # compares the function at some points with a period later
+        try:
+            period = float(period.subs(Symbol('e'), E))
+        except TypeError:
+            return False
+        x = np.linspace(-10, 10, 101) + 0.123
+        with np.errstate(all='ignore'):
+            y1 = self.np_func(x)
+            y2 = self.np_func(x + period)
+        finite = np.isfinite(y1) & np.isfinite(y2)
+        if finite.sum() < len(x) / 2:
+            return False
+        return np.allclose(y1[finite], y2[finite], rtol=1e-6, atol=1e-9)
 
     def _check_trigonometric(self):
         e = str(self.simp_expr)
@@ -595,10 +645,34 @@ class Function:
             self.trigonometric = False
             debug('Function cannot be periodic.')
 
-    def __init__(self, expr, xylimits, logscale=False):
+    # compiled functions can't be pickled. Leave it out and compile
+    # it again when unpickling. The sample cache and the report are
+    # left out too, to keep things small.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('np_func', None)
+        state.pop('sample_cache', None)
+        state.pop('report', None)
+        state.pop('_poi_table', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.sample_cache = SampleCache()
+        self.report = Report()
+        if self.valid:
+            self.np_func = compile_expr(self.simp_expr)
+
+    # if lazy is True, the function is not analysed until analyse() is
+    # called, so that it can be drawn before its POIs are found
+    def __init__(self, expr, xylimits, logscale=False, lazy=False):
         # the number of points to calculate within the graph using
         # the function
         self.resolution = 1000
+        self.solve_budget = solve_budget
+        self.sample_cache = SampleCache()
+        # timings of the analysis phases
+        self.report = Report()
         self.visible = True
         self.constant = False
         self.valid = True
@@ -606,6 +680,7 @@ class Function:
         self.trigonometric = False
         self.periodic = False
         self.period = None
+        self.analysed = False
         self.expr = self._get_expr(expr)
         # the min and max values to use for manual POI searching
         self.x_min_manual = -20
@@ -615,9 +690,11 @@ class Function:
         # actually just y=x. Doesn't hurt in any case.
         # Also throws an error in case there are syntax problems
         try:
-            self.simp_expr = self._simplify_expr(self.expr)
-            # expression as used by numpy
-            self.np_expr = self._get_np_expr(str(self.simp_expr))
+            with recording(self.report), phase('_simplify_expr',
+                                                self.expr):
+                self.simp_expr = self._simplify_expr(self.expr)
+            # vectorized numpy function, used for sampling
+            self.np_func = compile_expr(self.simp_expr)
             self.valid = self.update_function_points(xylimits)
         except:
             self.valid = False
@@ -629,4 +706,5 @@ class Function:
             self.polynomial = self.simp_expr.is_polynomial()
             if not self.polynomial:
                 self._check_trigonometric()
-            self.calc_poi()
+            if not lazy:
+                self.analyse()
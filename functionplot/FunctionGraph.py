@@ -3,13 +3,134 @@
 
 from __future__ import division
 import numpy as np
-from sympy import simplify, pi
+from sympy import pi, srepr
 from sympy.functions import Abs
 from Function import Function
-from PointOfInterest import PointOfInterest as POI
-from helpers import fsolve, rfc, remove_outliers, BreakLoop
+from PointOfInterest import PointOfInterest as POI, POITable, \
+    table_of, concat
+from helpers import fsolve, rfc, remove_outliers, simplify, \
+    compile_expr, solve_deadline
 from logging import debug
 from helpers import keep10
+from roots import find_roots
+from intervals import isolate_roots
+from WorkerPool import get_pool
+from ExprCache import cache, CacheMiss
+from Report import Report, Phase, recording, phase, timed
+from functools import partial
+from copy import copy
+import time
+
+# seconds to wait for the intersections of a pair of functions
+intersection_timeout = 60
+
+# seconds that the solves of all the pairs can take together. Solves
+# still running when it runs out are stopped and the pairs fall back
+# to numeric root finding.
+intersection_budget = 30
+
+
+def _pair_key(f, g):
+    # intersections are stored by the unordered pair of expressions
+    return frozenset([srepr(f.simp_expr), srepr(g.simp_expr)])
+
+
+def _clusters(x, y, dx, dy):
+    # groups the points that are closer than dx and dy to each other,
+    # along with the points that are close to those and so on. Points
+    # go in a grid of dx by dy cells, so close points can only be in
+    # the same or in neighbouring cells. Returns lists of indices, in
+    # the order of the first point of every cluster.
+    parent = range(len(x))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    finite = np.isfinite(x) & np.isfinite(y)
+    cx = np.zeros(len(x), dtype=int)
+    cy = np.zeros(len(y), dtype=int)
+    cx[finite] = np.floor(x[finite] / dx)
+    cy[finite] = np.floor(y[finite] / dy)
+    grid = {}
+    for i in np.nonzero(finite)[0]:
+        for nx in (cx[i] - 1, cx[i], cx[i] + 1):
+            for ny in (cy[i] - 1, cy[i], cy[i] + 1):
+                for j in grid.get((nx, ny), ()):
+                    if abs(x[i] - x[j]) < dx and abs(y[i] - y[j]) < dy:
+                        a, b = root(i), root(j)
+                        # the earlier point stays the root
+                        parent[max(a, b)] = min(a, b)
+        grid.setdefault((cx[i], cy[i]), []).append(i)
+    clusters = {}
+    for i in xrange(len(x)):
+        clusters.setdefault(root(i), []).append(i)
+    return [clusters[i] for i in sorted(clusters)]
+
+
+def _pair_poi(pairs, keys, found):
+    # the intersection POIs of the pairs whose keys are in found
+    poi = []
+    for (f, g), key in zip(pairs, keys):
+        for xc, yc in found.get(key, []):
+            poi.append(POI(xc, yc, 1, function=[f, g]))
+    return poi
+
+
+def _complex(x, y):
+    # points as complex numbers, so that duplicates can be found with
+    # numpy
+    c = np.empty(len(x), dtype=complex)
+    c.real = x
+    c.imag = y
+    return c
+
+
+@timed('manual fallback')
+def _calc_intersections_manually(d):
+    debug('Calculating intersections manually')
+    # d is f - g. Interval isolation finds all the roots, if it can
+    # handle d, sampling otherwise.
+    sol = isolate_roots(d, -20, 20)
+    if sol is None:
+        try:
+            sol = find_roots(compile_expr(d), -20, 20)
+        except NameError:
+            debug('Not possible to evaluate %s', d)
+            sol = []
+    sol = list(sol)
+    sol = keep10(sol)
+    return sol
+
+
+def _intersect(f_expr, g_expr, deadline=None):
+    # the intersections of two functions as a list of (x, y), along
+    # with the phases recorded while looking for them. It runs in a
+    # worker.
+    report = Report()
+    points = []
+    with recording(report), solve_deadline(deadline):
+        # FIXME: maybe I can do away with simplify here?
+        d = str(f_expr) + '-(' + str(g_expr) + ')'
+        try:
+            ds = simplify(d)
+            x = fsolve(ds)
+            if x is None:
+                x = _calc_intersections_manually(ds)
+            for i in x:
+                y = f_expr.subs('x', i)
+                xc = rfc(i)
+                yc = rfc(y)
+                if xc is not None and yc is not None:
+                    points.append((xc, yc))
+                    debug('New intersection point: (%s,%s)', xc, yc)
+        except CacheMiss:
+            raise
+        except ValueError:
+            debug('ValueError exception. Probably a ' +
+                  'bug in sympy.')
+    return points, list(report.phases)
 
 
 class FunctionGraph:
@@ -37,16 +158,18 @@ class FunctionGraph:
         self.auto = False
         self._zoom(zoom_out=True, zoom_x=False, zoom_y=True)
 
-    def zoom_in(self):
+    # with resample=False, the graph points are left for the caller to
+    # update, with calc_graph_points() for example
+    def zoom_in(self, resample=True):
         self.auto = False
-        self._zoom(zoom_out=False)
+        self._zoom(zoom_out=False, resample=resample)
 
-    def zoom_out(self):
+    def zoom_out(self, resample=True):
         self.auto = False
-        self._zoom(zoom_out=True)
+        self._zoom(zoom_out=True, resample=resample)
 
     def _zoom(self, zoom_out=False, zoom_x=True, zoom_y=True,
-              multiplier=1):
+              multiplier=1, resample=True):
         if zoom_out:
             sf = self.scale_factor * multiplier
         else:
@@ -68,86 +191,162 @@ class FunctionGraph:
                 self.x_min = 0
             if self.y_min < 0:
                 self.y_min = 0
-        self.update_graph_points()
+        if resample:
+            self.update_graph_points()
 
     def update_graph_points(self):
-        for f in self.functions:
+        xylimits = [self.x_min, self.x_max, self.y_min, self.y_max]
+        self.set_graph_points(self.calc_graph_points(xylimits))
+
+    def calc_graph_points(self, xylimits, functions=None):
+        """
+        Returns a list of (function, graph points) for the visible
+        functions, or the visible ones of functions if it's given, for
+        xylimits. Nothing is changed, so it can run in another thread.
+        set_graph_points() puts the points in place.
+        """
+        if functions is None:
+            functions = self.functions
+        points = []
+        for f in functions:
             if f.visible:
-                f.update_function_points([self.x_min, self.x_max,
-                                       self.y_min, self.y_max])
+                p = f.calc_function_points(xylimits)
+                if p is not None:
+                    points.append((f, p))
+        return points
 
-    def add_function(self, expr):
-        debug('Adding function: ' + expr)
+    def set_graph_points(self, points):
+        for f, p in points:
+            f.graph_points = p
+
+    def add_function(self, expr, progress=None):
+        debug('Adding function: %s', expr)
         xylimits = [self.x_min, self.x_max, self.y_min, self.y_max]
         f = Function(expr, xylimits, self.logscale)
         if f.valid:
+            # only the pairs of the new function are new
+            pairs = [(f, g) for g in self.functions]
             self.functions.append(f)
-            self.calc_intersections()
+            with recording(self.report), \
+                    phase('calc_intersections') as p:
+                self.poi = self.poi + \
+                    self._calc_intersections_pairs(pairs, progress)
+                p.size = len(self.poi)
             self.update_xylimits()
             return True
         else:
             return False
 
+    # A function can also be added in the background, so that it's
+    # drawn before it's analysed. new_function() and
+    # analyse_function() run in the background thread and change
+    # nothing. What they find is handed over as callables that change
+    # the graph, to be called in the thread that draws it.
+
+    def new_function(self, expr):
+        """
+        Returns the function of expr, sampled but not analysed, or
+        None if expr is not a valid function. Pass it on to
+        analyse_function().
+        """
+        debug('Adding function: %s', expr)
+        xylimits = [self.x_min, self.x_max, self.y_min, self.y_max]
+        f = Function(expr, xylimits, self.logscale, lazy=True)
+        if f.valid:
+            return f
+        return None
+
+    def analyse_function(self, f, publish, progress=None):
+        """
+        Finds the POIs of f, a function from new_function(), and its
+        intersections with the functions of the graph. Nothing is
+        changed: publish is called with callables that add f to the
+        graph, then its POIs and intersections as they're found, and
+        update the limits. Call them in order, in the thread the graph
+        is drawn in. progress is passed on to calc_intersections().
+        """
+        others = list(self.functions)
+        publish(partial(self._insert_function, f))
+        # the analysis runs on a copy of f, and the intersections on a
+        # copy of the graph
+        work = copy(f)
+        work.analyse(lambda points:
+                     publish(partial(self._merge_poi, f, points)))
+        publish(partial(self._set_analysis, f, work))
+        scratch = copy(self)
+        scratch.intersections = dict(self.intersections)
+        with recording(scratch.report), \
+                phase('calc_intersections') as p:
+            poi = scratch._calc_intersections_pairs(
+                [(f, g) for g in others], progress,
+                lambda points: publish(partial(self._merge_poi, None,
+                                               points)))
+            p.size = len(poi)
+        publish(partial(self._set_intersections, f, scratch, poi))
+
+    def _insert_function(self, f):
+        self.functions.append(f)
+        self.update_xylimits()
+
+    # adds POIs found so far, of f, or intersections if f is None
+    def _merge_poi(self, f, points):
+        if f is None:
+            self.poi = self.poi + points
+        else:
+            for p in points:
+                p.function = f
+            f.poi = f.poi + points
+        self.update_xylimits()
+
+    def _set_analysis(self, f, work):
+        f.set_analysis(work)
+        self.update_xylimits()
+
+    def _set_intersections(self, f, scratch, poi):
+        self.intersections.update(scratch.intersections)
+        self.report.extend(scratch.report.phases)
+        # replaces the intersections of f added so far
+        self.poi = [p for p in self.poi if f not in p.function] + poi
+        self.update_xylimits()
+
+    def remove_function(self, index):
+        f = self.functions.pop(index)
+        self.poi = [p for p in self.poi if f not in p.function]
+        # drop the stored intersections of f, unless an identical
+        # function is still there
+        key = srepr(f.simp_expr)
+        if key not in [srepr(g.simp_expr) for g in self.functions]:
+            for pair in self.intersections.keys():
+                if key in pair:
+                    del self.intersections[pair]
+
     def update_xylimits(self):
+        with recording(self.report), phase('update_xylimits'):
+            self._update_xylimits()
+
+    def _update_xylimits(self):
         if self.auto:
-            vertical_asymptotes = False
-            horizontal_asymptotes = False
             debug('Calculating xylimits.')
-            xl = []
-            yl = []
-            points = []
-            # add function specific POIs
-            for f in self.functions:
-                if f.visible:
-                    for p in f.poi:
-                        if self.point_type_enabled[p.point_type]:
-                            # don't add vertical or horizontal
-                            # asymptotes here
-                            if p.point_type < 6 or p.point_type > 7:
-                                point = [p.x, p.y]
-                                if point not in points:
-                                    points.append([p.x, p.y])
-            # add graph POIs (function intersections)
-            for p in self.poi:
-                if p.function[0].visible and p.function[1].visible \
-                        and self.point_type_enabled[p.point_type]:
-                    point = [p.x, p.y]
-                    if point not in points:
-                        points.append([p.x, p.y])
-            # asymptotes
+            t = self.poi_table()
+            x, y = t.x, t.y
             # we need a trick to put asymptotes far away, but also
             # show them on the x axis. So, if there are any
             # asymptotes, we increase the size of the respective
-            # axis 2 times.
-            for f in self.functions:
-                if f.visible:
-                    for p in f.poi:
-                        # vertical asymptotes
-                        if p.point_type == 6:
-                            if self.point_type_enabled[p.point_type]:
-                                vertical_asymptotes = True
-                                point = [p.x, 0]
-                                if point not in points:
-                                    points.append([p.x, 0])
-                        # horizontal asymptotes
-                        elif p.point_type == 7:
-                            if self.point_type_enabled[p.point_type]:
-                                horizontal_asymptotes = True
-                                point = [0, p.y]
-                                if point not in points:
-                                    points.append([p.x, 0])
+            # axis 2 times. Their POIs go on the x axis.
+            vertical_asymptotes = (t.point_type == 6).any()
+            horizontal_asymptotes = (t.point_type == 7).any()
+            y = np.where((t.point_type == 6) | (t.point_type == 7), 0, y)
+            finite = np.isfinite(x) & np.isfinite(y)
+            points = np.unique(_complex(x[finite], y[finite]))
             # add default POIs (origin (0,0) etc)
             # only if other POIs are less than 3
             if len(points) < 3:
-                for p in self.poi_defaults:
-                    if self.point_type_enabled[p.point_type]:
-                        point = [p.x, p.y]
-                        if point not in points:
-                            points.append([p.x, p.y])
+                d = POITable(self.poi_defaults)
+                d = d.take(d.mask(self.point_type_enabled))
+                points = np.union1d(points, _complex(d.x, d.y))
             # gather everything together
-            for point in points:
-                xl.append(point[0])
-                yl.append(point[1])
+            xl = points.real
+            yl = points.imag
             # remove outliers
             if not self.outliers:
                 # we need at least 9 points to detect outliers
@@ -156,11 +355,11 @@ class FunctionGraph:
                     xl = remove_outliers(xl)
                     debug('Trying to find outliers in Y axis.')
                     yl = remove_outliers(yl)
-            x_min = min(xl)
-            x_max = max(xl)
+            x_min = float(xl.min())
+            x_max = float(xl.max())
             x_range = x_max - x_min
-            y_min = min(yl)
-            y_max = max(yl)
+            y_min = float(yl.min())
+            y_max = float(yl.max())
             y_range = y_max - y_min
             # take care of edge cases, where all poi in an axis have
             # the same coordinate.
@@ -210,10 +409,8 @@ class FunctionGraph:
                     y_range = y_max - y_min
             except OverflowError:
                 pass
-            debug('Setting X limits to ' +
-                  str(x_min) + ' and ' + str(x_max))
-            debug('Setting Y limits to ' +
-                  str(y_min) + ' and ' + str(y_max))
+            debug('Setting X limits to %s and %s', x_min, x_max)
+            debug('Setting Y limits to %s and %s', y_min, y_max)
             self.x_min = x_min
             self.x_max = x_max
             self.y_min = y_min
@@ -230,129 +427,119 @@ class FunctionGraph:
                 self.y_max = 100 * self.y_max
 
     def grouped_poi(self, points):
-        l = len(points)
-        if l < 50:
-            # max distance for grouped points is graph diagonal size /100
-            x_range = self.x_max - self.x_min
-            y_range = self.y_max - self.y_min
-            # temp list of grouped points. Every group is a sublist
-            c = []
-            for p in points:
-                # for intersection points, check for grouping only
-                # if their respective functions are both visible
-                # and only if the point type is enabled
-                if p.point_type == 1 and p.function[0].visible \
-                        and p.function[1].visible \
-                        and self.point_type_enabled[p.point_type]:
-                    c.append([p])
-                # for non-intersection points, check for grouping
-                # only if the respective function is visible and
-                # only if the point type is enabled
-                elif p.point_type != 1 and p.function.visible \
-                        and self.point_type_enabled[p.point_type]:
-                    c.append([p])
-            done = False
-            while not done:
-                try:
-                    l = len(c)
-                    for i in xrange(0, l - 1):
-                        for j in xrange(1, l):
-                            if i != j:
-                                for m in c[i]:
-                                    for n in c[j]:
-                                        if abs(m.x - n.x) < x_range / 100 and \
-                                                abs(m.y - n.y) < y_range / 100:
-                                            for k in c[j]:
-                                                c[i].append(k)
-                                            c.pop(j)
-                                            raise BreakLoop
-                    done = True
-                except BreakLoop:
-                    pass
-            # final list of grouped points. For groups, return a single
-            # point with coordinates the mean values of the coordinates
-            # of the points that are grouped
-            grouped = []
-            for i in c:
-                l = len(i)
-                if l == 1:
-                    grouped.append(i[0])
-                else:
-                    x_sum = 0
-                    y_sum = 0
-                    for j in i:
-                        x_sum += j.x
-                        y_sum += j.y
-                    x = x_sum / l
-                    y = y_sum / l
-                    grouped.append(POI(x, y, 9, size=l))
-        else:
-            debug('Too many POI (' + str(l) + '). Disabling grouping.')
-            grouped = points
+        with recording(self.report), phase('grouped_poi') as p:
+            grouped = self._grouped_poi(points)
+            p.size = len(grouped)
         return grouped
 
-    def calc_intersections(self):
-        self.poi = []
+    def _grouped_poi(self, points):
+        # max distance for grouped points is graph diagonal size /100
+        x_range = self.x_max - self.x_min
+        y_range = self.y_max - self.y_min
+        # only POIs of visible functions and enabled types are grouped
+        if not isinstance(points, POITable):
+            points = POITable(points)
+        t = points.take(points.mask(self.point_type_enabled))
+        # final list of grouped points. For groups, return a single
+        # point with coordinates the mean values of the coordinates
+        # of the points that are grouped
+        grouped = []
+        for c in _clusters(t.x, t.y, float(x_range) / 100,
+                           float(y_range) / 100):
+            if len(c) == 1:
+                grouped.append(t.point(c[0]))
+            else:
+                grouped.append(POI(t.x[c].mean(), t.y[c].mean(), 9,
+                                   size=len(c)))
+        return grouped
+
+    def poi_table(self):
+        """
+        Returns a POITable with the POIs of the visible functions and
+        their intersections, whose types are enabled.
+        """
+        # the tables of the functions and of the intersections are
+        # only made again when their POIs change
+        t = concat([table_of(f) for f in self.functions] +
+                   [table_of(self)])
+        return t.take(t.mask(self.point_type_enabled))
+
+    def calc_intersections(self, progress=None):
+        """
+        Calculates the intersections of all the pairs of functions.
+        progress, if given, is called with the number of pairs done
+        and the total, every time a pair is done.
+        """
         l = len(self.functions)
-        for i in xrange(0, l - 1):
-            f = self.functions[i]
-            for j in xrange(i + 1, l):
-                g = self.functions[j]
-                self._calc_intersections_functions(f, g)
-
-    # calculates the intersections between two functions
-    def _calc_intersections_functions(self, f, g):
-        debug('Looking for intersections between "' + f.expr +
-              '" and "' + g.expr + '".')
-        stored = False
-        for i in self.intersections:
-            f1 = i[0]
-            f2 = i[1]
-            px = i[2]
-            py = i[3]
-            if (f1 == f.simp_expr and f2 == g.simp_expr) or \
-                    (f1 == g.simp_expr and f2 == f.simp_expr):
-                p = POI(px, py, 1, function=[f, g])
-                self.poi.append(p)
-                stored = True
-                debug('Stored intersection point: (' +
-                      str(px) + ',' + str(py) + ')')
-        if not stored:
-            # FIXME: maybe I can do away with simplify here?
-            d = str(f.simp_expr) + '-(' + str(g.simp_expr) + ')'
+        pairs = [(self.functions[i], self.functions[j])
+                 for i in xrange(0, l - 1) for j in xrange(i + 1, l)]
+        with recording(self.report), phase('calc_intersections') as p:
+            self.poi = self._calc_intersections_pairs(pairs, progress)
+            p.size = len(self.poi)
+
+    # calculates the intersections of pairs of functions. Stored
+    # intersections are reused, the rest are calculated in parallel,
+    # in the worker pool. POIs come out in the order of pairs, however
+    # the workers finish. publish, if given, is called with the POIs
+    # of every pair as soon as they're found.
+    def _calc_intersections_pairs(self, pairs, progress=None,
+                                  publish=None):
+        deadline = time.time() + intersection_budget
+        keys = [_pair_key(f, g) for f, g in pairs]
+        found = {}
+        todo = {}
+        for (f, g), key in zip(pairs, keys):
+            if key in found or key in todo:
+                continue
+            if key in self.intersections:
+                found[key] = self.intersections[key]
+                continue
+            debug('Looking for intersections between "%s" and "%s".',
+                  f.expr, g.expr)
             try:
-                ds = simplify(d)
-                x = fsolve(ds)
-                if x is None:
-                    dnp = str(f.np_expr) + '-(' + str(g.np_expr) + ')'
-                    x = self._calc_intersections_manually(dnp)
-                for i in x:
-                    y = f.simp_expr.subs('x', i)
-                    xc = rfc(i)
-                    yc = rfc(y)
-                    if xc is not None and yc is not None:
-                        p = POI(xc, yc, 1, function=[f, g])
-                        self.poi.append(p)
-                        self.intersections.append([f.simp_expr,
-                                                   g.simp_expr, xc, yc])
-                        debug('New intersection point: (' +
-                              str(xc) + ',' + str(yc) + ')')
-            except ValueError:
-                debug('ValueError exception. Probably a ' +
-                      'bug in sympy.')
-
-    def _calc_intersections_manually(self, npexpr):
-        debug('Calculating intersections manually')
-        x = np.linspace(-20, 20, 10000)
-        y = eval(npexpr)
-        sol = []
-        for i in xrange(2, len(y) - 1):
-            if ((y[i] == 0) or
-                    (y[i - 2] < y[i - 1] < 0 and y[i + 1] > y[i] > 0) or
-                    (y[i - 2] > y[i - 1] > 0 and y[i + 1] < y[i] < 0)):
-                sol.append(x[i])
-        sol = keep10(sol)
-        return sol
+                # if the sympy results are cached, there's no need for
+                # a worker
+                with cache.cached_only():
+                    points, phases = _intersect(f.simp_expr, g.simp_expr,
+                                                deadline)
+                found[key] = self._store(key, points, phases, deadline)
+            except CacheMiss:
+                todo[key] = (_intersect, (f.simp_expr, g.simp_expr,
+                                          deadline))
+        total = len(found) + len(todo)
+        if progress is not None:
+            progress(len(found), total)
+        if publish is not None and found:
+            publish(_pair_poi(pairs, keys, found))
+        if todo:
+            pending = todo.keys()
+            for i, r in get_pool().imap([todo[key] for key in pending],
+                                        intersection_timeout):
+                if r is None:
+                    # the worker was killed
+                    r = [], [Phase('_intersect',
+                                   duration=intersection_timeout,
+                                   outcome='timed out')]
+                    self.report.extend(r[1])
+                    found[pending[i]] = []
+                else:
+                    found[pending[i]] = self._store(pending[i], r[0],
+                                                    r[1], deadline)
+                if progress is not None:
+                    progress(len(found), total)
+                if publish is not None:
+                    publish(_pair_poi(pairs, keys,
+                                      {pending[i]: found[pending[i]]}))
+        return _pair_poi(pairs, keys, found)
+
+    def _store(self, key, points, phases, deadline):
+        # pairs that were done after the deadline may have skipped
+        # solves. They are not stored, so that they are tried again
+        # next time.
+        self.report.extend(phases)
+        if time.time() <= deadline:
+            self.intersections[key] = points
+        return points
 
     def clear(self):
         self.x_min = -1.2
@@ -396,5 +583,27 @@ class FunctionGraph:
             True,  # 8: slope is 45 or -45 degrees
             True  # 9: grouped POIs
         ]
-        self.intersections = []
+        # intersection points by the unordered pair of expressions
+        self.intersections = {}
+        # timings of the analysis phases of the graph. The phases of
+        # every function are in its own report.
+        self.report = Report()
         self.new()
+
+    # the report is not saved with the graph
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('report', None)
+        state.pop('_poi_table', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.report = Report()
+        if isinstance(self.intersections, list):
+            # older files have a list of [f, g, x, y]
+            intersections = {}
+            for f, g, xc, yc in self.intersections:
+                key = frozenset([srepr(f), srepr(g)])
+                intersections.setdefault(key, []).append((xc, yc))
+            self.intersections = intersections
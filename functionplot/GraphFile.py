@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# The FunctionPlot file format. A graph is saved as gzipped JSON: the
+# settings of the graph, and for every function its expression in
+# canonical form along with the results of its analysis, so that
+# opening a file doesn't analyse anything again. The sampled points
+# may be saved too, otherwise they are sampled again on load. Unlike
+# pickles, loading a file never runs code from it. Pickled graphs of
+# older versions can still be opened, once, to be saved again.
+
+import base64
+import binascii
+import collections
+import copy_reg
+import gzip
+import importlib
+import json
+import pickle
+import re
+import types
+import numpy as np
+from sympy import sympify, Basic
+from sympy.core.assumptions import StdFactKB
+from sympy.core.facts import FactRules
+from logging import debug
+from FunctionGraph import FunctionGraph, _pair_key
+from Function import Function, analysis_version
+from PointOfInterest import PointOfInterest as POI
+
+# bump it whenever the format changes in a way older versions can't
+# read
+version = 1
+
+# the names that may appear in the expressions of a file
+_names = set(['x', 'e', 'E', 'pi', 'I', 'oo', 'zoo', 'nan', 'sin', 'cos',
+              'tan', 'cot', 'sec', 'csc', 'asin', 'acos', 'atan', 'acot',
+              'asec', 'acsc', 'sinh', 'cosh', 'tanh', 'coth', 'sech',
+              'csch', 'asinh', 'acosh', 'atanh', 'acoth', 'exp', 'log',
+              'log10', 'sqrt', 'Abs', 'sign', 'floor', 'ceiling',
+              'LambertW'])
+
+
+_numbers = (int, long, float)
+
+# the settings of a function, by type. Anything else is left out.
+_function_settings = {
+    'expr': basestring, 'mathtex_expr': basestring, 'valid': bool,
+    'visible': bool, 'constant': bool, 'polynomial': bool,
+    'trigonometric': bool, 'periodic': bool, 'analysed': bool,
+    'resolution': (int, long), 'solve_budget': _numbers,
+    'solve_deadline': _numbers, 'x_min_manual': _numbers,
+    'x_max_manual': _numbers}
+
+# the globals that pickled graphs are made of, besides the classes of
+# FunctionPlot and sympy
+_legacy_globals = {
+    ('__builtin__', 'dict'): dict,
+    ('__builtin__', 'object'): object,
+    ('__builtin__', 'set'): set,
+    ('collections', 'defaultdict'): collections.defaultdict,
+    ('copy_reg', '_reconstructor'): copy_reg._reconstructor,
+    ('numpy', 'dtype'): np.dtype,
+    ('numpy', 'ndarray'): np.ndarray,
+    ('numpy.core.multiarray', '_reconstruct'):
+        np.core.multiarray._reconstruct,
+    ('sympy.core.assumptions', 'StdFactKB'): StdFactKB,
+    ('sympy.core.facts', 'FactRules'): FactRules}
+
+# strings that may be passed to sympy classes when unpickling. Symbol
+# names and the digits of Floats are, code is not.
+_legacy_string = re.compile(r'^[\w.+\-]*$')
+
+
+class FormatError(ValueError):
+    """
+    Raised when a file is not a FunctionPlot file, or was saved by a
+    newer version.
+    """
+    pass
+
+
+def _simple(value):
+    # values that are saved as they are
+    if isinstance(value, list):
+        return all(_simple(v) for v in value)
+    return isinstance(value, (bool, int, long, float, basestring,
+                              types.NoneType))
+
+
+def _is(value, kind):
+    # bools are ints in python, but not in a file
+    if isinstance(value, bool):
+        return kind is bool
+    return isinstance(value, kind)
+
+
+def _get(d, key, kind):
+    # d[key], if d has it and it's a kind
+    if not isinstance(d, dict) or key not in d or not _is(d[key], kind):
+        raise FormatError('Bad or missing ' + key)
+    return d[key]
+
+
+def _compatible(value, default):
+    # whether value can replace default
+    if isinstance(default, list):
+        return isinstance(value, list) and len(value) == len(default) \
+            and all(_compatible(v, d) for v, d in zip(value, default))
+    if isinstance(default, bool):
+        return _is(value, bool)
+    if isinstance(default, (int, long)):
+        return _is(value, (int, long))
+    if isinstance(default, float):
+        return _is(value, _numbers)
+    return False
+
+
+def _graph_settings(fg, settings):
+    # copies the settings that fg has too, if their types match
+    for k, v in _attributes(settings).items():
+        if k not in fg.__dict__:
+            continue
+        if not _compatible(v, fg.__dict__[k]):
+            raise FormatError('Bad setting ' + k)
+        setattr(fg, k, v)
+
+
+def _settings(obj, skip):
+    return dict((k, v) for k, v in obj.__dict__.items()
+                if k not in skip and _simple(v))
+
+
+def _str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_str(v) for v in value]
+    return value
+
+
+def _attributes(settings):
+    # JSON strings are unicode, attribute names and expressions are
+    # utf-8 encoded
+    return dict((str(k), _str(v)) for k, v in settings.items())
+
+
+def _expr(s):
+    # sympify runs python code, so only expressions made of numbers,
+    # operators and known names are parsed
+    if not re.match(r'^[0-9A-Za-z_ .+\-*/()^,]*$', s):
+        raise FormatError('Bad expression: ' + s)
+    for name in re.findall(r'[A-Za-z_][A-Za-z_0-9]*', s):
+        if name not in _names:
+            raise FormatError('Bad expression: ' + s)
+    return sympify(s)
+
+
+def _float(n):
+    try:
+        return float(n)
+    except TypeError:
+        return float('nan')
+
+
+def _array(a):
+    return base64.b64encode(np.asarray(a, dtype='<f8').tostring())
+
+
+def _from_array(s):
+    return np.frombuffer(base64.b64decode(s), dtype='<f8').copy()
+
+
+def _save_function(f, samples):
+    d = {'settings': _settings(f, ['simp_expr', 'period', 'poi',
+                                   'graph_points'])}
+    if f.valid:
+        d['simp_expr'] = str(f.simp_expr)
+        d['period'] = None if f.period is None else str(f.period)
+        d['poi'] = [[_float(p.x), _float(p.y), p.point_type, p.size]
+                    for p in f.poi]
+        if samples:
+            x, y = f.graph_points
+            d['samples'] = [_array(x), _array(y)]
+    return d
+
+
+def _function_state(settings):
+    state = dict((k, v) for k, v in _attributes(settings).items()
+                 if k in _function_settings)
+    for k, v in state.items():
+        _get(state, k, _function_settings[k])
+    for k in ['expr', 'valid', 'visible']:
+        _get(state, k, _function_settings[k])
+    return state
+
+
+def _load_poi(d, f):
+    poi = []
+    for p in _get(d, 'poi', list):
+        if not isinstance(p, list) or len(p) != 4 or \
+                not all(_is(n, _numbers) for n in p[:2]) or \
+                not all(_is(n, (int, long)) for n in p[2:]) or \
+                not 0 <= p[2] <= 9:
+            raise FormatError('Bad POI')
+        x, y, t, size = p
+        poi.append(POI(x, y, t, size=size, function=f))
+    return poi
+
+
+def _load_samples(d):
+    samples = _get(d, 'samples', list)
+    if len(samples) != 2:
+        raise FormatError('Bad samples')
+    try:
+        x, y = [_from_array(str(a)) for a in samples]
+    except (TypeError, ValueError, binascii.Error):
+        raise FormatError('Bad samples')
+    if len(x) != len(y):
+        raise FormatError('Bad samples')
+    return x, y
+
+
+def _load_function(d, xylimits, logscale, stale):
+    state = _function_state(_get(d, 'settings', dict))
+    if not state['valid']:
+        raise FormatError('Invalid function: ' + state['expr'])
+    # functions saved before their analysis was done, or without the
+    # flag, are analysed again
+    if stale or not state.get('analysed'):
+        debug('Analysing "%s" again.', state['expr'])
+        f = Function(state['expr'], xylimits, logscale)
+        if not f.valid:
+            raise FormatError('Invalid function: ' + state['expr'])
+        f.visible = state['visible']
+        return f
+    state['simp_expr'] = _expr(_get(d, 'simp_expr', basestring))
+    state['period'] = None
+    if d.get('period') is not None:
+        state['period'] = _expr(_get(d, 'period', basestring))
+    # like unpickling, the analysis is not done again
+    f = types.InstanceType(Function)
+    f.__setstate__(state)
+    f.poi = _load_poi(d, f)
+    if 'samples' in d:
+        f.graph_points = _load_samples(d)
+    else:
+        f.update_function_points(xylimits)
+    return f
+
+
+def _load_intersections(fg, intersections):
+    n = len(fg.functions)
+    for pair in intersections:
+        if not isinstance(pair, list) or len(pair) != 3 or \
+                not all(_is(i, (int, long)) for i in pair[:2]) or \
+                not 0 <= pair[0] < pair[1] < n or \
+                not isinstance(pair[2], list):
+            raise FormatError('Bad intersections')
+        i, j, points = pair
+        for p in points:
+            if not isinstance(p, list) or len(p) != 2 or \
+                    not all(_is(c, _numbers) for c in p):
+                raise FormatError('Bad intersections')
+        key = _pair_key(fg.functions[i], fg.functions[j])
+        fg.intersections[key] = [tuple(p) for p in points]
+
+
+def _legacy_class(module, name):
+    # what a pickled graph may be made of. FunctionPlot's own modules
+    # were imported without the package.
+    app = {'FunctionGraph': FunctionGraph, 'Function': Function,
+           'PointOfInterest': POI}
+    if name in app and module in (name, 'functionplot.' + name):
+        return app[name]
+    if (module, name) in _legacy_globals:
+        return _legacy_globals[(module, name)]
+    if module.split('.')[0] == 'sympy':
+        cls = getattr(importlib.import_module(module), name, None)
+        if isinstance(cls, type) and issubclass(cls, Basic):
+            return _legacy_sympy(cls)
+    raise FormatError('Not a FunctionPlot file')
+
+
+def _legacy_strings(args):
+    for a in args:
+        if isinstance(a, (tuple, list)):
+            _legacy_strings(a)
+        elif isinstance(a, basestring) and not _legacy_string.match(a):
+            raise FormatError('Not a FunctionPlot file')
+
+
+def _legacy_sympy(cls):
+    # sympy objects are unpickled by calling their class, which may
+    # sympify strings. Only strings without code in them get there.
+    def construct(*args):
+        _legacy_strings(args)
+        return cls(*args)
+    return construct
+
+
+def _load_legacy(filename):
+    f = open(filename, 'rb')
+    try:
+        unpickler = pickle.Unpickler(f)
+        unpickler.find_class = _legacy_class
+        old = unpickler.load()
+    except FormatError:
+        raise
+    except Exception, e:
+        debug('Could not unpickle %s: %r', filename, e)
+        raise FormatError('Not a FunctionPlot file')
+    finally:
+        f.close()
+    if not isinstance(old, FunctionGraph):
+        raise FormatError('Not a FunctionPlot file')
+    # only the settings and the expressions are kept. The functions
+    # are analysed again.
+    fg = FunctionGraph()
+    _graph_settings(fg, dict((k, v) for k, v in old.__dict__.items()
+                             if _simple(v)))
+    for f in old.functions:
+        expr = _get(f.__dict__, 'expr', basestring)
+        if not fg.add_function(expr):
+            raise FormatError('Invalid function: ' + expr)
+        fg.functions[-1].visible = bool(getattr(f, 'visible', True))
+    return fg
+
+
+def save(fg, filename, samples=False):
+    """
+    Saves fg in filename. If samples is True, the graph points of the
+    functions are saved too.
+    """
+    functions = fg.functions
+    index = dict((_pair_key(f, g), (i, j))
+                 for i, f in enumerate(functions)
+                 for j, g in enumerate(functions) if i < j)
+    intersections = []
+    for key, points in fg.intersections.items():
+        if key in index:
+            intersections.append(list(index[key]) +
+                                 [[[_float(x), _float(y)]
+                                   for x, y in points]])
+    d = {'format': 'functionplot',
+         'version': version,
+         'analysis': analysis_version,
+         'graph': _settings(fg, ['functions', 'poi', 'poi_defaults',
+                                 'intersections']),
+         'functions': [_save_function(f, samples) for f in functions],
+         'intersections': intersections}
+    f = gzip.open(filename, 'wb')
+    try:
+        json.dump(d, f)
+    finally:
+        f.close()
+
+
+def load(filename):
+    """
+    Returns the FunctionGraph saved in filename. Raises FormatError
+    if it's not a FunctionPlot file, or it's from a newer version.
+    Functions that were analysed by an older version are analysed
+    again, and so are all the functions of pickled graphs, which
+    older versions saved.
+    """
+    f = open(filename, 'rb')
+    try:
+        magic = f.read(2)
+    finally:
+        f.close()
+    if magic != '\x1f\x8b':
+        return _load_legacy(filename)
+    f = gzip.open(filename, 'rb')
+    try:
+        d = json.load(f)
+    except (IOError, ValueError, EOFError):
+        raise FormatError('Not a FunctionPlot file')
+    finally:
+        f.close()
+    if not isinstance(d, dict) or d.get('format') != 'functionplot':
+        raise FormatError('Not a FunctionPlot file')
+    if _get(d, 'version', (int, long)) > version:
+        raise FormatError('Saved by a newer version of FunctionPlot')
+    stale = _get(d, 'analysis', (int, long)) != analysis_version
+    fg = FunctionGraph()
+    _graph_settings(fg, _get(d, 'graph', dict))
+    xylimits = [fg.x_min, fg.x_max, fg.y_min, fg.y_max]
+    functions = _get(d, 'functions', list)
+    fg.functions = [_load_function(fd, xylimits, fg.logscale, stale)
+                    for fd in functions]
+    intersections = _get(d, 'intersections', list)
+    if not stale:
+        _load_intersections(fg, intersections)
+    # stored intersections are not solved again
+    fg.calc_intersections()
+    return fg
@@ -1,10 +1,34 @@
 #!/usr/bin/env python
 # vim:et:sta:sts=4:sw=4:ts=8:tw=79:
 
+import numpy as np
 
-class PointOfInterest:
 
-    def __init__(self, x, y, point_type=None, size=1,
+def _float(n):
+    # coordinates may be sympy numbers, complex infinity too
+    try:
+        return float(n)
+    except TypeError:
+        return np.nan
+
+
+class PointOfInterest(object):
+
+    # there may be thousands of them, so they don't get a __dict__
+    __slots__ = ('x', 'y', 'point_type', 'size', 'function', 'color')
+
+    # slots need these to be pickled. Older files have the __dict__ of
+    # the old class as the state.
+    def __getstate__(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        for k in self.__slots__:
+            setattr(self, k, state.get(k))
+
+    # x and y have defaults, because unpickling instances of the old
+    # class calls this without arguments
+    def __init__(self, x=0, y=0, point_type=None, size=1,
                  function=None, color=None):
         self.x = x
         self.y = y
@@ -25,3 +49,119 @@ class PointOfInterest:
         # 9: POI group
 
         self.point_type = point_type
+
+
+class POITable:
+    """
+    A list of POIs, column by column. x, y, point_type and size are
+    numpy arrays. functions has the functions the POIs belong to and
+    owner, an n by 2 array, the indices of the two functions of every
+    POI in functions. For POIs of a single function both are the
+    same. For POIs of no function they are -1. The PointOfInterest
+    objects are made from the columns when asked for.
+    """
+
+    def mask(self, point_type_enabled):
+        """
+        Returns a boolean array, True for the POIs whose type is
+        enabled and whose functions are visible.
+        """
+        visible = np.array([f.visible for f in self.functions] + [True])
+        enabled = np.array(point_type_enabled, dtype=bool)
+        return enabled[self.point_type] & visible[self.owner].all(axis=1)
+
+    def take(self, mask):
+        """
+        Returns a POITable with the POIs where mask is True.
+        """
+        t = POITable()
+        t.functions = self.functions
+        t.x = self.x[mask]
+        t.y = self.y[mask]
+        t.point_type = self.point_type[mask]
+        t.size = self.size[mask]
+        t.owner = self.owner[mask]
+        return t
+
+    def point(self, i):
+        """
+        Returns the i-th POI as a PointOfInterest.
+        """
+        a, b = self.owner[i]
+        if a < 0:
+            function = None
+        elif self.point_type[i] == 1:
+            function = [self.functions[a], self.functions[b]]
+        else:
+            function = self.functions[a]
+        return PointOfInterest(float(self.x[i]), float(self.y[i]),
+                               int(self.point_type[i]), int(self.size[i]),
+                               function)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.point(i)
+
+    def __init__(self, points=()):
+        self.functions = []
+        index = {}
+        owner = []
+        for p in points:
+            if p.function is None:
+                owner.append((-1, -1))
+                continue
+            if p.point_type == 1:
+                fs = p.function
+            else:
+                fs = [p.function, p.function]
+            for f in fs:
+                if id(f) not in index:
+                    index[id(f)] = len(self.functions)
+                    self.functions.append(f)
+            owner.append((index[id(fs[0])], index[id(fs[1])]))
+        n = len(owner)
+        self.x = np.array([_float(p.x) for p in points]).reshape(n)
+        self.y = np.array([_float(p.y) for p in points]).reshape(n)
+        self.point_type = np.array([p.point_type for p in points],
+                                   dtype=int).reshape(n)
+        self.size = np.array([p.size for p in points],
+                             dtype=int).reshape(n)
+        self.owner = np.array(owner, dtype=int).reshape(n, 2)
+
+
+def table_of(owner):
+    """
+    Returns a POITable of owner.poi, a function or a graph. It is kept
+    in owner and made again only after owner.poi is replaced or grows.
+    """
+    points, n, t = getattr(owner, '_poi_table', (None, 0, None))
+    if points is not owner.poi or n != len(owner.poi):
+        t = POITable(owner.poi)
+        owner._poi_table = (owner.poi, len(owner.poi), t)
+    return t
+
+
+def concat(tables):
+    """
+    Returns a POITable with the POIs of all the tables, in order.
+    """
+    t = POITable()
+    index = {}
+    owners = [t.owner]
+    for s in tables:
+        remap = []
+        for f in s.functions:
+            if id(f) not in index:
+                index[id(f)] = len(t.functions)
+                t.functions.append(f)
+            remap.append(index[id(f)])
+        # -1, no function, stays -1
+        owners.append(np.array(remap + [-1], dtype=int)[s.owner])
+    for name in ['x', 'y', 'point_type', 'size']:
+        setattr(t, name, np.concatenate([getattr(t, name)] +
+                                        [getattr(s, name) for s in tables]))
+    t.owner = np.concatenate(owners)
+    return t
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# Draws a FunctionGraph on matplotlib axes. The artists are made once
+# and updated in place: a line for every visible function and a single
+# collection for every style of POI, however many POIs there are.
+# While panning, only the axes are drawn again, on top of a saved
+# background, and blitted. Lines get no more points than the axes
+# have pixels to show them.
+
+import numpy as np
+import matplotlib.ticker
+from PointOfInterest import POITable
+from helpers import decimate
+
+
+class CenteredFormatter(matplotlib.ticker.ScalarFormatter):
+    """Acts exactly like the default Scalar Formatter, but yields an
+    empty label for ticks at the origin."""
+
+    def __call__(self, value, pos=None):
+        if value == 0:
+            return ''
+        else:
+            return matplotlib.ticker.ScalarFormatter.__call__(self,
+                                                              value, pos)
+
+
+def _offsets(x, y):
+    return np.column_stack([x, y]).reshape(len(x), 2)
+
+
+class Renderer:
+    """
+    Keeps the artists of a graph on ax. colors are the colors of the
+    visible functions, in turn.
+    """
+
+    def update(self, fg):
+        """
+        Updates every artist to fg and draws the whole canvas.
+        """
+        self.background = None
+        self._update_axes(fg)
+        self._update_lines(fg)
+        self._update_poi(fg)
+        self._update_legend(fg)
+        self.ax.figure.canvas.draw()
+
+    def export(self, fg, filename, dpi):
+        """
+        Saves the graph in filename, with lines as detailed as dpi
+        needs.
+        """
+        self._update_lines(fg, dpi / self.ax.figure.dpi)
+        try:
+            self.ax.figure.savefig(filename, dpi=dpi)
+        finally:
+            self._update_lines(fg)
+
+    def start_pan(self):
+        """
+        Saves the figure without the contents of the axes, so that
+        pan() only has to draw those.
+        """
+        canvas = self.ax.figure.canvas
+        self.ax.set_visible(False)
+        canvas.draw()
+        self.background = canvas.copy_from_bbox(self.ax.figure.bbox)
+        self.ax.set_visible(True)
+
+    def pan(self, fg):
+        """
+        Moves the view to the limits of fg and updates the lines to
+        its graph points. POIs and spines are in data coordinates, so
+        they move along. Everything else waits for the next update().
+        """
+        if self.background is None:
+            self.update(fg)
+            return
+        self.ax.set_xlim(float(fg.x_min), float(fg.x_max))
+        self.ax.set_ylim(float(fg.y_min), float(fg.y_max))
+        self._update_lines(fg)
+        canvas = self.ax.figure.canvas
+        canvas.restore_region(self.background)
+        artists = [self.ax.patch, self.ax.xaxis, self.ax.yaxis] + \
+            self.ax.spines.values() + self.lines + \
+            self.collections.values() + [self.origin]
+        if self.ax.legend_ is not None:
+            artists.append(self.ax.legend_)
+        for a in artists:
+            if a.get_visible():
+                self.ax.draw_artist(a)
+        canvas.blit(self.ax.figure.bbox)
+
+    def _update_axes(self, fg):
+        ax = self.ax
+        x_min, x_max = fg.x_min, fg.x_max
+        y_min, y_max = fg.y_min, fg.y_max
+        ax.grid(True)
+        self.origin.set_visible(False)
+        if fg.logscale:
+            ax.set_xscale('log')
+            ax.set_yscale('log')
+            for spine in ax.spines.values():
+                spine.set_color('black')
+                spine.set_position(('outward', 0))
+            ax.xaxis.set_ticks_position('default')
+            ax.yaxis.set_ticks_position('default')
+        else:
+            ax.set_xscale('linear')
+            ax.set_yscale('linear')
+            # put axes in center instead of the sides
+            # when axes are off screen, put them on the edges
+            if x_min < 0 and x_max > 0:
+                self._spine('left', 'right', ('data', 0))
+                ax.yaxis.set_ticks_position('left')
+            elif x_min >= 0:
+                self._spine('left', 'right', ('data', x_min))
+                ax.yaxis.set_ticks_position('left')
+            else:
+                self._spine('right', 'left', ('data', x_max))
+                ax.yaxis.set_ticks_position('right')
+            if y_min < 0 and y_max > 0:
+                self._spine('bottom', 'top', ('data', 0))
+                ax.xaxis.set_ticks_position('bottom')
+            elif y_min >= 0:
+                self._spine('bottom', 'top', ('data', y_min))
+                ax.xaxis.set_ticks_position('bottom')
+            else:
+                self._spine('top', 'bottom', ('data', y_max))
+                ax.xaxis.set_ticks_position('top')
+            # we don't need the origin annotated in both axes
+            if x_min < 0 and x_max > 0 and y_min < 0 and y_max > 0:
+                formatter = CenteredFormatter(useMathText=True)
+                formatter.center = 0
+                ax.xaxis.set_major_formatter(formatter)
+                ax.yaxis.set_major_formatter(formatter)
+                self.origin.set_visible(True)
+        ax.set_xlim(float(x_min), float(x_max))
+        ax.set_ylim(float(y_min), float(y_max))
+
+    def _spine(self, shown, hidden, position):
+        spine = self.ax.spines[shown]
+        spine.set_color('black')
+        spine.set_position(position)
+        spine.set_smart_bounds(False)
+        self.ax.spines[hidden].set_color('none')
+
+    def _update_lines(self, fg, scale=1):
+        # the width of the axes in pixels, scale times the dpi of the
+        # figure
+        columns = int(np.ceil(self.ax.bbox.width * scale))
+        visible = [f for f in fg.functions if f.visible]
+        for i, f in enumerate(visible):
+            x, y = f.graph_points
+            x, y = decimate(x, y, fg.x_min, fg.x_max, columns,
+                            fg.logscale)
+            color = self.colors[i % len(self.colors)]
+            if i < len(self.lines):
+                self.lines[i].set_data(x, y)
+                self.lines[i].set_color(color)
+            else:
+                self.lines.extend(self.ax.plot(x, y, linewidth=2,
+                                               color=color))
+        while len(self.lines) > len(visible):
+            self.lines.pop().remove()
+
+    def _update_poi(self, fg):
+        t = fg.poi_table()
+        if not fg.show_poi:
+            t = t.take(np.zeros(len(t), dtype=bool))
+        elif fg.grouped:
+            t = POITable(fg.grouped_poi(t))
+        # POIs are colored like their functions
+        colors = {}
+        for f in fg.functions:
+            if f.visible:
+                colors[id(f)] = self.colors[len(colors) % len(self.colors)]
+        c = np.array([colors.get(id(f), 'black') for f in t.functions] +
+                     ['black'])[t.owner[:, 0]]
+        ptype = t.point_type
+        # vertical asymptotes are plotted on the x axis, as 'x', and
+        # horizontal ones on the y axis, as '+'
+        points = (ptype > 1) & (ptype < 9) & (ptype != 6) & (ptype != 7)
+        vertical = ptype == 6
+        horizontal = ptype == 7
+        for name, mask, x, y in [
+                ('points', points, t.x, t.y),
+                ('vertical', vertical, t.x, np.zeros(len(t))),
+                ('horizontal', horizontal, np.zeros(len(t)), t.y),
+                ('intersections', ptype == 1, t.x, t.y),
+                ('groups', (ptype == 9) & fg.point_type_enabled[9],
+                 t.x, t.y)]:
+            collection = self.collections[name]
+            collection.set_offsets(_offsets(x[mask], y[mask]))
+            if name in ('points', 'vertical', 'horizontal'):
+                collection.set_color(list(c[mask]))
+            elif name == 'groups':
+                collection.set_sizes(t.size[mask] * 80)
+
+    def _update_legend(self, fg):
+        if self.ax.legend_ is not None:
+            self.ax.legend_.remove()
+        if fg.show_legend and self.lines:
+            if fg.legend_location == 1:
+                anchor = (1, 1)
+            elif fg.legend_location == 2:
+                anchor = (0, 1)
+            elif fg.legend_location == 3:
+                anchor = (0, 0)
+            else:
+                anchor = (1, 0)
+            legend = [f.mathtex_expr for f in fg.functions if f.visible]
+            self.ax.legend(self.lines, legend, loc=fg.legend_location,
+                           bbox_to_anchor=anchor, fontsize=18)
+
+    def __init__(self, ax, colors):
+        self.ax = ax
+        self.colors = colors
+        self.lines = []
+        self.background = None
+        self.origin = ax.annotate('(0,0)', (0, 0), xytext=(-4, -4),
+                                  textcoords='offset points', ha='right',
+                                  va='top', visible=False)
+        empty = np.zeros((0, 2))
+        self.collections = {
+            'points': ax.scatter(empty[:, 0], empty[:, 1], s=80,
+                                 linewidths=0),
+            'vertical': ax.scatter(empty[:, 0], empty[:, 1], s=80,
+                                   marker='x', linewidths=2),
+            'horizontal': ax.scatter(empty[:, 0], empty[:, 1], s=80,
+                                     marker='+', linewidths=2),
+            'intersections': ax.scatter(empty[:, 0], empty[:, 1], s=80,
+                                        alpha=0.5, c='black',
+                                        linewidths=0),
+            'groups': ax.scatter(empty[:, 0], empty[:, 1], s=80,
+                                 alpha=0.8, c='orange', linewidths=0)
+        }
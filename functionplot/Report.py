@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+from collections import deque
+import threading
+import time
+
+# phases are recorded in the report at the top of the current
+# thread's stack
+_local = threading.local()
+# callables that are called with every phase that ends
+_hooks = []
+# a cProfile.Profile (or anything with enable() and disable()) that
+# runs while a report is recorded
+_profiler = None
+
+
+class Phase:
+    """
+    A single timed phase of the analysis. outcome says how it ended
+    (solved, timed out, manual fallback...) and size how much it
+    produced (solutions, points, POIs...). detail is what the phase
+    worked on, usually an expression. It's only turned into a string
+    when the report is printed.
+    """
+
+    def __str__(self):
+        s = self.name + ' ' + ('%.4f' % self.duration) + 's'
+        if self.outcome is not None:
+            s += ' ' + self.outcome
+        if self.size is not None:
+            s += ' size=' + str(self.size)
+        if self.detail is not None:
+            s += ' [' + str(self.detail) + ']'
+        return s
+
+    def __init__(self, name, detail=None, duration=0.0, outcome=None,
+                 size=None):
+        self.name = name
+        self.detail = detail
+        self.duration = duration
+        self.outcome = outcome
+        self.size = size
+
+
+class _Timer:
+
+    def __enter__(self):
+        self.start = time.time()
+        return self.phase
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.phase.duration = time.time() - self.start
+        if exc_type is not None and self.phase.outcome is None:
+            self.phase.outcome = 'error'
+        if self.report is not None:
+            self.report.add(self.phase)
+        for hook in _hooks:
+            hook(self.phase)
+
+    def __init__(self, report, phase):
+        self.report = report
+        self.phase = phase
+
+
+class _Recording:
+
+    def __enter__(self):
+        stack = _stack()
+        stack.append(self.report)
+        if len(stack) == 1 and _profiler is not None:
+            _profiler.enable()
+        return self.report
+
+    def __exit__(self, *args):
+        stack = _stack()
+        stack.pop()
+        if not stack and _profiler is not None:
+            _profiler.disable()
+
+    def __init__(self, report):
+        self.report = report
+
+
+class Report:
+    """
+    Records how long every phase of the analysis of a Function or a
+    FunctionGraph took and how it ended. Only the last max_phases
+    phases are kept.
+    """
+
+    def add(self, phase):
+        self.phases.append(phase)
+
+    def extend(self, phases):
+        self.phases.extend(phases)
+
+    def phase(self, name, detail=None):
+        """
+        Returns a context manager that times a phase and adds it to
+        this report. Set outcome and size on the Phase it returns.
+        """
+        return _Timer(self, Phase(name, detail))
+
+    def summary(self):
+        """
+        Returns a dict of phase name: (count, total time, {outcome:
+        count})
+        """
+        summary = {}
+        for p in self.phases:
+            count, total, outcomes = summary.get(p.name, (0, 0.0, {}))
+            outcomes[p.outcome] = outcomes.get(p.outcome, 0) + 1
+            summary[p.name] = (count + 1, total + p.duration, outcomes)
+        return summary
+
+    def slowest(self, n=10):
+        return sorted(self.phases, key=lambda p: p.duration,
+                      reverse=True)[:n]
+
+    def find(self, name=None, outcome=None):
+        return [p for p in self.phases
+                if (name is None or p.name == name) and
+                (outcome is None or p.outcome == outcome)]
+
+    def clear(self):
+        self.phases = deque(maxlen=self.max_phases)
+
+    def __str__(self):
+        lines = []
+        for name, (count, total, outcomes) in \
+                sorted(self.summary().items(), key=lambda i: -i[1][1]):
+            o = ', '.join(str(k) + ': ' + str(v)
+                          for k, v in sorted(outcomes.items()) if k)
+            lines.append('%-30s %5d %9.4fs  %s' % (name, count, total, o))
+        return '\n'.join(lines)
+
+    def __init__(self, max_phases=1000):
+        self.max_phases = max_phases
+        self.clear()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def recording(report):
+    """
+    Returns a context manager. Phases that start inside it, in this
+    thread, are added to report.
+    """
+    return _Recording(report)
+
+
+def current():
+    """
+    Returns the report phases are being recorded in, or None.
+    """
+    stack = _stack()
+    if stack:
+        return stack[-1]
+    return None
+
+
+def phase(name, detail=None):
+    """
+    Times a phase and adds it to the current report, if there's one.
+    """
+    return _Timer(current(), Phase(name, detail))
+
+
+def timed(outcome=None):
+    """
+    Decorator that records every call of a method as a phase, named
+    after it. Its size is the length of what it returns.
+    """
+    def decorator(f):
+        def wrapper(*args):
+            with phase(f.__name__) as p:
+                p.outcome = outcome
+                value = f(*args)
+                if value is not None:
+                    p.size = len(value)
+                return value
+        wrapper.__name__ = f.__name__
+        wrapper.__doc__ = f.__doc__
+        return wrapper
+    return decorator
+
+
+def add_hook(hook):
+    """
+    hook is called with every Phase that ends, in the process and
+    thread it ran in.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def set_profiler(profiler):
+    """
+    profiler, a cProfile.Profile for example, is enabled whenever a
+    report is recorded. None turns profiling off.
+    """
+    global _profiler
+    _profiler = profiler
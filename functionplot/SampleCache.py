@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+from __future__ import division
+import numpy as np
+import threading
+from collections import OrderedDict
+from helpers import sample
+from logging import debug
+
+
+def _uncovered(pieces, lo, hi):
+    """
+    Returns the parts of the [lo, hi] interval that are not covered
+    by any of the (lo, hi, key) pieces.
+    """
+    parts = []
+    for p_lo, p_hi, key in sorted(pieces):
+        if p_hi <= lo:
+            continue
+        if p_lo >= hi:
+            break
+        if p_lo > lo:
+            parts.append((lo, p_lo))
+        lo = max(lo, p_hi)
+    if lo < hi:
+        parts.append((lo, hi))
+    return parts
+
+
+class SampleCache:
+    """
+    Keeps the sampled points of a function in segments, keyed by
+    their resolution level and x interval. When the graph is panned
+    or zoomed, only the parts of the new x range that are not
+    covered by a segment that is fine enough are sampled.
+    Least recently used segments are dropped when the cache holds
+    more than max_points points. It may be used from more than one
+    thread.
+    """
+
+    def get(self, func, x_min, x_max, resolution):
+        """
+        Returns the x and y values of func sampled over [x_min,
+        x_max], with about resolution points over the whole range
+        before adaptive refinement. One point outside the range on
+        each side is included, if there is one in the cache, so that
+        the curve reaches the edges of the graph.
+        """
+        with self.lock:
+            return self._get(func, x_min, x_max, resolution)
+
+    def _get(self, func, x_min, x_max, resolution):
+        width = x_max - x_min
+        level = self._level(width)
+        # a segment sampled at the same or a finer level is good
+        # enough. Prefer the coarsest, they have fewer points.
+        pieces = []
+        for key in sorted(self.segments, reverse=True):
+            seg_level, lo, hi = key
+            if seg_level > level:
+                continue
+            for part in _uncovered(pieces, max(lo, x_min),
+                                   min(hi, x_max)):
+                pieces.append(part + (key,))
+        for lo, hi in _uncovered(pieces, x_min, x_max):
+            # ignore gaps that are only there because of rounding
+            if hi - lo < width * 1e-9:
+                continue
+            n = max(int(np.ceil(resolution * (hi - lo) / width)) + 1, 2)
+            x, y = sample(func, np.linspace(lo, hi, n))
+            key = (level, lo, hi)
+            self._store(key, x, y[0])
+            pieces.append((lo, hi, key))
+            debug('Sampled %s new points in [%s,%s]', len(x), lo, hi)
+        pieces.sort()
+        xs = []
+        ys = []
+        last = None
+        for k, (lo, hi, key) in enumerate(pieces):
+            x, y = self.segments.pop(key)
+            # put it back at the end, as the most recently used
+            self.segments[key] = x, y
+            if last is None:
+                i = max(np.searchsorted(x, lo, 'left') - 1, 0)
+            else:
+                i = np.searchsorted(x, last, 'right')
+            j = np.searchsorted(x, hi, 'right')
+            if k == len(pieces) - 1:
+                j = min(j + 1, len(x))
+            if j > i:
+                xs.append(x[i:j])
+                ys.append(y[i:j])
+                last = x[j - 1]
+        self._merge(level)
+        # never drop what is on screen right now
+        self._evict([k for k in self.segments if k[0] <= level and
+                     k[1] < x_max and k[2] > x_min])
+        return np.concatenate(xs), np.concatenate(ys)
+
+    def clear(self):
+        self.segments = OrderedDict()
+        self.points = 0
+
+    def _level(self, width):
+        # views of the same width, within a factor of 2, share the
+        # same level
+        return int(np.floor(np.log2(width)))
+
+    def _store(self, key, x, y):
+        self.segments[key] = x, y
+        self.points += len(x)
+
+    def _merge(self, level):
+        # join segments of the same level that touch, so that panning
+        # around doesn't leave lots of small segments behind
+        keys = sorted(k for k in self.segments if k[0] == level)
+        run = []
+        for key in keys + [None]:
+            if run and (key is None or key[1] != run[-1][2]):
+                if len(run) > 1:
+                    self._join(run)
+                run = []
+            if key is not None:
+                run.append(key)
+
+    def _join(self, keys):
+        xs = []
+        ys = []
+        for key in keys:
+            x, y = self.segments.pop(key)
+            # the point on the common edge is in both segments
+            if xs and x[0] == xs[-1][-1]:
+                x = x[1:]
+                y = y[1:]
+                self.points -= 1
+            xs.append(x)
+            ys.append(y)
+        self.segments[(keys[0][0], keys[0][1], keys[-1][2])] = \
+            np.concatenate(xs), np.concatenate(ys)
+
+    def _evict(self, keep):
+        for key in list(self.segments):
+            if self.points <= self.max_points:
+                break
+            if key not in keep:
+                x, y = self.segments.pop(key)
+                self.points -= len(x)
+
+    def __init__(self, max_points=200000):
+        self.max_points = max_points
+        self.lock = threading.Lock()
+        self.clear()
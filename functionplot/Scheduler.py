@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# Runs work in a background thread, for the latest request only. Used
+# for resampling the graph while it's panned or zoomed: mouse events
+# come a lot faster than the graph can be sampled, so only the view
+# the mouse is at when the thread gets to it is sampled.
+
+import threading
+import time
+from logging import debug
+
+
+class Scheduler:
+    """
+    Runs job in a background thread, with the arguments of the latest
+    submit(). A submit() that comes while job is running replaces any
+    other that is waiting, and job waits for delay seconds without a
+    new submit() before it runs, so bursts are coalesced into a single
+    run. done is called in the background thread with the ticket of
+    the submit() and the result of job, unless a newer submit() came
+    while job was running. Check is_latest(ticket) before using the
+    result in another thread, since newer submits may come after done
+    is called.
+    """
+
+    def submit(self, *args):
+        """
+        Asks for job to run with args. Returns a ticket for it.
+        """
+        with self.cond:
+            self.ticket += 1
+            self.pending = self.ticket, args
+            self.submitted = time.time()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify_all()
+            return self.ticket
+
+    def is_latest(self, ticket):
+        return ticket == self.ticket
+
+    def wait(self):
+        """
+        Waits until there's nothing left to run.
+        """
+        with self.cond:
+            while self.pending is not None or self.running:
+                self.cond.wait()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                # wait for the burst to end
+                left = self.submitted + self.delay - time.time()
+                if left > 0:
+                    self.cond.wait(left)
+                    continue
+                ticket, args = self.pending
+                self.pending = None
+                self.running = True
+            try:
+                result = self.job(*args)
+                if self.is_latest(ticket):
+                    self.done(ticket, result)
+                else:
+                    debug('Dropping stale result %s', ticket)
+            except Exception, e:
+                debug('Exception caught in scheduled job: %s', e)
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+
+    def __init__(self, job, done, delay=0.03):
+        self.job = job
+        self.done = done
+        self.delay = delay
+        self.cond = threading.Condition()
+        self.ticket = 0
+        self.pending = None
+        self.submitted = 0
+        self.running = False
+        self.thread = None
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+from ExprCache import cache
+from logging import debug
+import threading
+import time
+
+win32 = True
+try:
+    import winshell
+except ImportError:
+    win32 = False
+
+# don't use multiprocessing on win32. It causes huge slowdowns
+# because of the lack of os.fork()
+if win32:
+    from threading import Thread as fProcess
+    from Queue import Queue as fQueue
+    from Queue import Empty as qEmpty
+else:
+    import os
+    import resource
+    import select
+    from multiprocessing import Process as fProcess
+    from multiprocessing import Pipe, cpu_count
+
+# True inside a worker process. Tasks submitted to the pool from a
+# worker are run inline. fsolve checks it too, to time out sympy with
+# an alarm signal instead.
+_in_worker = False
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def in_worker():
+    return _in_worker
+
+
+def get_pool():
+    """
+    Returns the shared WorkerPool, creating it on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+        return _pool
+
+
+def set_pool(processes=None):
+    """
+    Replaces the shared WorkerPool with a new one using the given
+    number of worker processes. Workers of the old pool are shut
+    down.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = WorkerPool(processes)
+        return _pool
+
+
+def _pack(func):
+    # bound methods can't be pickled in python 2. Send the instance
+    # and the method name instead and look it up in the worker.
+    obj = getattr(func, 'im_self', None)
+    if obj is not None:
+        return obj, func.__name__
+    return None, func
+
+
+def _unpack(obj, func):
+    if obj is not None:
+        return getattr(obj, func)
+    return func
+
+
+def _worker_loop(conn):
+    global _in_worker
+    _in_worker = True
+    # sympy results cached while running a task are sent back with
+    # its result, so that the parent process learns them too. So are
+    # the cache hit and miss counts.
+    cache.start_journal()
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, IOError):
+            break
+        if task is None:
+            break
+        obj, func, args = task
+        start = os.times()
+        try:
+            ok, value = True, _unpack(obj, func)(*args)
+        except Exception, e:
+            debug('Exception in worker: %r', e)
+            ok, value = False, None
+        # the CPU time the task took and the peak memory use of the
+        # worker, so that the parent can keep track of them
+        end = os.times()
+        usage = (end[0] + end[1] - start[0] - start[1],
+                 resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        try:
+            conn.send((ok, value, cache.drain(), usage))
+        except Exception, e:
+            debug('Could not send result back: %r', e)
+            # maybe it's just the cache entries that can't be pickled
+            try:
+                conn.send((ok, value, None, usage))
+            except Exception:
+                conn.send((False, None, None, usage))
+
+
+class _Worker:
+
+    def __init__(self):
+        self.conn, child_conn = Pipe()
+        self.process = fProcess(target=_worker_loop,
+                                args=(child_conn,))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def send(self, func, args):
+        obj, func = _pack(func)
+        self.conn.send((obj, func, args))
+
+    def recv(self):
+        return self.conn.recv()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except IOError:
+            pass
+        self.conn.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    A pool of long-lived worker processes that tasks are submitted
+    to. Workers are started lazily and reused, so process startup
+    is paid only once. A task that runs past its timeout has its
+    worker killed and replaced.
+    """
+
+    def run(self, tasks, timeout=None):
+        """
+        Runs a list of (callable, args) tasks in parallel and returns
+        a list with their results, in the same order. The result of
+        a task that raised an exception or timed out is None.
+        timeout is per task, in seconds, counting from the moment the
+        task is handed to a worker.
+        """
+        results = [None] * len(tasks)
+        for i, value in self.imap(tasks, timeout):
+            results[i] = value
+        return results
+
+    def imap(self, tasks, timeout=None):
+        """
+        Like run, but yields (index, result) pairs as soon as every
+        task finishes, in the order they finish.
+        """
+        if _in_worker:
+            # a worker can't have workers of its own. Run nested
+            # tasks inline.
+            return self._run_inline(tasks)
+        if win32:
+            return self._run_threads(tasks, timeout)
+        return self._run_processes(tasks, timeout)
+
+    def _run_processes(self, tasks, timeout):
+        pending = list(enumerate(tasks))
+        # worker -> (task index, deadline)
+        busy = {}
+        try:
+            while pending or busy:
+                while pending:
+                    worker = self._acquire(block=not busy)
+                    if worker is None:
+                        break
+                    i, (func, args) = pending.pop(0)
+                    try:
+                        worker.send(func, args)
+                    except Exception, e:
+                        debug('Could not submit task: %r', e)
+                        self._discard(worker)
+                        yield i, None
+                        continue
+                    if timeout is None:
+                        deadline = None
+                    else:
+                        deadline = time.time() + timeout
+                    busy[worker] = (i, deadline)
+                if not busy:
+                    continue
+                deadlines = [d for i, d in busy.values() if d is not None]
+                wait = None
+                if deadlines:
+                    wait = max(0, min(deadlines) - time.time())
+                if pending:
+                    # we're waiting for a free worker too
+                    wait = 0.05 if wait is None else min(wait, 0.05)
+                ready = select.select(busy.keys(), [], [], wait)[0]
+                for worker in ready:
+                    i, deadline = busy.pop(worker)
+                    try:
+                        ok, value, entries, usage = worker.recv()
+                    except (EOFError, IOError):
+                        debug('Worker died while running a task.')
+                        self._discard(worker)
+                        yield i, None
+                        continue
+                    cache.merge(entries)
+                    self.cpu_time += usage[0]
+                    self.max_rss = max(self.max_rss, usage[1])
+                    self._release(worker)
+                    yield i, value if ok else None
+                now = time.time()
+                for worker, (i, deadline) in busy.items():
+                    if deadline is not None and now >= deadline:
+                        debug('Task timed out. Replacing worker.')
+                        del busy[worker]
+                        self._discard(worker)
+                        yield i, None
+        finally:
+            # the caller stopped early. Don't leave workers behind
+            # running tasks nobody waits for.
+            for worker in busy:
+                self._discard(worker)
+
+    def apply(self, func, args=(), timeout=None):
+        """
+        Runs a single task and returns its result (None on error or
+        timeout).
+        """
+        return self.run([(func, args)], timeout)[0]
+
+    def _run_inline(self, tasks):
+        for i, (func, args) in enumerate(tasks):
+            try:
+                value = func(*args)
+            except Exception, e:
+                debug('Exception in task: %r', e)
+                value = None
+            yield i, value
+
+    def _run_threads(self, tasks, timeout):
+        # threads can't be killed, so on timeout we just stop waiting
+        # for them, like fsolve always did on win32.
+        queues = []
+        for func, args in tasks:
+            q = fQueue()
+            t = fProcess(target=self._thread_task,
+                         args=(q, func, args))
+            t.daemon = True
+            t.start()
+            queues.append(q)
+        for i, q in enumerate(queues):
+            try:
+                yield i, q.get(True, timeout)
+            except qEmpty:
+                debug('Task timed out.')
+                yield i, None
+
+    def _thread_task(self, q, func, args):
+        try:
+            q.put(func(*args))
+        except Exception, e:
+            debug('Exception in worker: %r', e)
+            q.put(None)
+
+    def _acquire(self, block=True):
+        with self._cond:
+            while not self._idle and self._count >= self.processes:
+                if not block:
+                    return None
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._count += 1
+        try:
+            return _Worker()
+        except Exception:
+            with self._cond:
+                self._count -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, worker):
+        with self._cond:
+            if self._closed:
+                worker.close()
+                self._count -= 1
+            else:
+                self._idle.append(worker)
+            self._cond.notify()
+
+    def _discard(self, worker):
+        worker.kill()
+        with self._cond:
+            self._count -= 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for worker in self._idle:
+                worker.close()
+            self._count -= len(self._idle)
+            self._idle = []
+
+    def __init__(self, processes=None):
+        # on single core machines still use two workers, so that a
+        # single slow job doesn't hold back all the rest
+        if processes is None:
+            if win32:
+                processes = 2
+            else:
+                processes = max(cpu_count(), 2)
+        self.processes = processes
+        # CPU seconds spent by workers on tasks that finished, and
+        # the peak memory use (ru_maxrss) of any worker
+        self.cpu_time = 0.0
+        self.max_rss = 0
+        self._idle = []
+        self._count = 0
+        self._closed = False
+        self._cond = threading.Condition()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# Headless batch analysis. Reads expressions, one per line, and writes
+# the results of the full POI and auto-limits analysis of every one
+# of them as JSON Lines. No gtk needed, PNGs are rendered with Agg.
+
+from __future__ import division
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from FunctionGraph import FunctionGraph
+from Function import Function
+from WorkerPool import set_pool
+from ExprCache import cache
+from helpers import decimate
+
+# seconds to wait for the analysis of a single expression
+expr_timeout = 120
+
+poi_names = ['axis', 'intersection', 'x_intercept', 'y_intercept',
+             'min_max', 'inflection', 'vertical_asymptote',
+             'horizontal_asymptote', 'slope_45', 'group']
+
+
+def _number(n):
+    # POI coordinates may be python, numpy or sympy numbers. JSON
+    # has no inf or nan, so those are kept as strings.
+    try:
+        f = float(n)
+    except (TypeError, ValueError):
+        return str(n)
+    if math.isinf(f) or math.isnan(f):
+        return str(f)
+    return f
+
+
+def render_png(fg, f, filename):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.grid(True)
+    ax.set_xlim(float(fg.x_min), float(fg.x_max))
+    ax.set_ylim(float(fg.y_min), float(fg.y_max))
+    x, y = decimate(f.graph_points[0], f.graph_points[1],
+                    float(fg.x_min), float(fg.x_max),
+                    int(np.ceil(ax.bbox.width)), fg.logscale)
+    ax.plot(x, y, linewidth=2)
+    for p in f.poi:
+        # asymptotes are not points on the graph
+        if p.point_type not in (6, 7):
+            ax.plot(float(p.x), float(p.y), 'o', color='black')
+    ax.set_title(f.mathtex_expr)
+    fig.savefig(filename)
+
+
+def analyse(expr, png=None):
+    """
+    Runs the full analysis of expr and returns the results in a
+    dict. If png is given, the graph is also rendered in that file.
+    """
+    result = {'expr': expr}
+    try:
+        start = time.time()
+        fg = FunctionGraph()
+        f = Function(expr, [fg.x_min, fg.x_max, fg.y_min, fg.y_max],
+                     fg.logscale)
+        analysed = time.time()
+        result['valid'] = f.valid
+        if not f.valid:
+            return result
+        fg.functions.append(f)
+        fg.update_xylimits()
+        done = time.time()
+        poi = {}
+        for p in f.poi:
+            poi.setdefault(poi_names[p.point_type], []).append(
+                [_number(p.x), _number(p.y)])
+        result['poi'] = poi
+        result['limits'] = [[_number(fg.x_min), _number(fg.x_max)],
+                            [_number(fg.y_min), _number(fg.y_max)]]
+        result['periodic'] = f.periodic
+        if f.periodic:
+            result['period'] = _number(f.period)
+        result['timings'] = {'analysis': analysed - start,
+                             'limits': done - analysed}
+        phases = {}
+        for name, (count, total, outcomes) in f.report.summary().items():
+            phases[name] = {'count': count, 'time': total,
+                            'outcomes': dict((k, v) for k, v in
+                                             outcomes.items() if k)}
+        result['phases'] = phases
+        if png is not None:
+            try:
+                render_png(fg, f, png)
+                result['png'] = png
+            except Exception, e:
+                result['png_error'] = repr(e)
+            result['timings']['png'] = time.time() - done
+    except Exception, e:
+        result['error'] = repr(e)
+    return result
+
+
+def run(lines, out, processes=None, timeout=expr_timeout, png_dir=None):
+    """
+    Analyses the expressions in lines in parallel and writes a JSON
+    line for each one to out, as soon as it's done. Empty lines and
+    lines starting with # are skipped. Returns the number of
+    expressions that failed.
+    """
+    exprs = [l.strip() for l in lines]
+    exprs = [e for e in exprs if e and not e.startswith('#')]
+    tasks = []
+    for i, expr in enumerate(exprs):
+        png = None
+        if png_dir is not None:
+            png = os.path.join(png_dir, str(i + 1) + '.png')
+        tasks.append((analyse, (expr, png)))
+    failed = 0
+    pool = set_pool(processes)
+    for i, result in pool.imap(tasks, timeout):
+        if result is None:
+            result = {'expr': exprs[i], 'error': 'timeout'}
+        result['index'] = i + 1
+        if 'error' in result or not result.get('valid'):
+            failed += 1
+        out.write(json.dumps(result, sort_keys=True) + '\n')
+        out.flush()
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Analyse functions without the GUI and print ' +
+        'the results as JSON Lines.')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='file with one expression per line ' +
+                        '(default: stdin)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('-t', '--timeout', type=float,
+                        default=expr_timeout,
+                        help='seconds to wait for each expression')
+    parser.add_argument('--png', metavar='DIR',
+                        help='render a PNG for every expression in DIR')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='keep sympy results in DIR between runs')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print debug messages')
+    args = parser.parse_args(argv)
+    if args.verbose:
+        level = logging.DEBUG
+    else:
+        level = logging.WARNING
+    logging.basicConfig(stream=sys.stderr, level=level,
+                        format='(%(processName)-10s) %(message)s')
+    if args.cache_dir is not None:
+        cache.set_directory(args.cache_dir)
+    if args.png is not None and not os.path.isdir(args.png):
+        os.makedirs(args.png)
+    if args.input == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.input) as f:
+            lines = f.readlines()
+    failed = run(lines, sys.stdout, args.jobs, args.timeout, args.png)
+    if failed:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
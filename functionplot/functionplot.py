@@ -5,7 +5,6 @@ import gtk
 import gobject
 import sys
 import threading
-import pickle
 import os
 import matplotlib.ticker
 from matplotlib.figure import Figure
@@ -18,6 +17,9 @@ from matplotlib.backends.backend_gtkagg import FigureCanvasGTKAgg \
 # from matplotlib.backends.backend_gtkcairo import \
 #    FigureCanvasGTKCairo as FigureCanvas
 from FunctionGraph import FunctionGraph
+import GraphFile
+from Renderer import Renderer
+from Scheduler import Scheduler
 
 # on windows, import the winshell module
 win32 = True
@@ -70,18 +72,6 @@ def threaded(f):
     return wrapper
 
 
-class CenteredFormatter(matplotlib.ticker.ScalarFormatter):
-    """Acts exactly like the default Scalar Formatter, but yields an
-    empty label for ticks at the origin."""
-
-    def __call__(self, value, pos=None):
-        if value == 0:
-            return ''
-        else:
-            return matplotlib.ticker.ScalarFormatter.__call__(self,
-                                                              value, pos)
-
-
 class GUI:
     #
     # Main Window
@@ -240,8 +230,7 @@ class GUI:
         self.ls_functions, iter = selected_line.get_selected()
         if iter is not None:
             index = self.ls_functions.get_value(iter, 3)
-            self.fg.functions.pop(index)
-            self.fg.calc_intersections()
+            self.fg.remove_function(index)
             self.update_function_list()
             self.graph_update()
             self.changed = True
@@ -303,14 +292,43 @@ class GUI:
         self.aboutdialog.hide()
         return True
 
-    # zoom in/out with the mouse wheel
+    # zoom in/out with the mouse wheel. The old graph points are
+    # shown scaled, until the new ones are sampled in the background.
     def wheel_zoom(self, event):
         self.changed = True
         if event.button == 'down':
-            self.fg.zoom_out()
+            self.fg.zoom_out(resample=False)
         elif event.button == 'up':
-            self.fg.zoom_in()
-        self.graph_update()
+            self.fg.zoom_in(resample=False)
+        if self.renderer.background is None:
+            self.renderer.start_pan()
+        self.renderer.pan(self.fg)
+        self.btn_auto.set_active(self.fg.auto)
+        self._resample()
+
+    # samples the graph for the current limits in the background
+    def _resample(self):
+        xylimits = [self.fg.x_min, self.fg.x_max, self.fg.y_min,
+                    self.fg.y_max]
+        self.resampler.submit(xylimits, list(self.fg.functions))
+
+    # these two are called in the resampling thread
+    def _sample(self, xylimits, functions):
+        return self.fg.calc_graph_points(xylimits, functions)
+
+    def _resampled(self, ticket, points):
+        gobject.idle_add(self._commit_graph_points, ticket, points)
+
+    def _commit_graph_points(self, ticket, points):
+        # a newer view may have been asked for in the meantime
+        if self.resampler.is_latest(ticket):
+            self.fg.set_graph_points(points)
+            if self.mousebutton_press is None:
+                self.graph_update()
+            else:
+                self.renderer.pan(self.fg)
+        return False
+
     # pan handling
     # when pressing down the mouse button on the graph, record
     # the current mouse coordinates
@@ -320,6 +338,7 @@ class GUI:
         if event.inaxes != self.ax:
             return
         self.mousebutton_press = event.xdata, event.ydata
+        self.renderer.start_pan()
 
     # when releasing the mouse button, stop recording the
     # mouse coordinates and redraw
@@ -344,165 +363,15 @@ class GUI:
         self.fg.x_max -= dx
         self.fg.y_min -= dy
         self.fg.y_max -= dy
-        self.fg.update_graph_points()
-        self.graph_update()
+        self.renderer.pan(self.fg)
+        self.btn_auto.set_active(self.fg.auto)
+        self._resample()
 
     # update the graph
     def graph_update(self):
-        self.ax.clear()
-
         if self.fg.auto:
             self.fg.update_xylimits()
-        x_min, x_max = self.fg.x_min, self.fg.x_max
-        y_min, y_max = self.fg.y_min, self.fg.y_max
-
-        self.ax.grid(True)
-        if self.fg.logscale:
-            self.ax.set_xscale('log')
-            self.ax.set_yscale('log')
-        else:
-            self.ax.set_xscale('linear')
-            self.ax.set_yscale('linear')
-            # put axes in center instead of the sides
-            # when axes are off screen, put them on the edges
-            if x_min < 0 and x_max > 0:
-                self.ax.spines['left'].set_color('black')
-                self.ax.spines['left'].set_position(('data', 0))
-                self.ax.spines['left'].set_smart_bounds(False)
-                self.ax.spines['right'].set_color('none')
-                self.ax.yaxis.set_ticks_position('left')
-            elif x_min >= 0:
-                self.ax.spines['left'].set_color('black')
-                self.ax.spines['left'].set_position(('data', x_min))
-                self.ax.spines['left'].set_smart_bounds(False)
-                self.ax.spines['right'].set_color('none')
-                self.ax.yaxis.set_ticks_position('left')
-            else:
-                self.ax.spines['right'].set_color('black')
-                self.ax.spines['right'].set_position(('data', x_max))
-                self.ax.spines['right'].set_smart_bounds(False)
-                self.ax.spines['left'].set_color('none')
-                self.ax.yaxis.set_ticks_position('right')
-            if y_min < 0 and y_max > 0:
-                self.ax.spines['bottom'].set_color('black')
-                self.ax.spines['bottom'].set_position(('data', 0))
-                self.ax.spines['bottom'].set_smart_bounds(False)
-                self.ax.spines['top'].set_color('none')
-                self.ax.xaxis.set_ticks_position('bottom')
-            elif y_min >= 0:
-                self.ax.spines['bottom'].set_color('black')
-                self.ax.spines['bottom'].set_position(('data',
-                                                       y_min))
-                self.ax.spines['bottom'].set_smart_bounds(False)
-                self.ax.spines['top'].set_color('none')
-                self.ax.xaxis.set_ticks_position('bottom')
-            else:
-                self.ax.spines['top'].set_color('black')
-                self.ax.spines['top'].set_position(('data', y_max))
-                self.ax.spines['top'].set_smart_bounds(False)
-                self.ax.spines['bottom'].set_color('none')
-                self.ax.xaxis.set_ticks_position('top')
-
-            # we don't need the origin annotated in both axes
-            if x_min < 0 and x_max > 0 and y_min < 0 and y_max > 0:
-                formatter = CenteredFormatter(useMathText=True)
-                formatter.center = 0
-                self.ax.xaxis.set_major_formatter(formatter)
-                self.ax.yaxis.set_major_formatter(formatter)
-                self.ax.annotate('(0,0)', (0, 0), xytext=(-4, -4),
-                                 textcoords='offset points', ha='right',
-                                 va='top')
-        self.ax.set_xlim(float(x_min), float(x_max))
-        self.ax.set_ylim(float(y_min), float(y_max))
-        legend = []
-
-        # draw the functions
-        for f in self.fg.functions:
-            x, y = f.graph_points
-            if f.visible:
-                color = self.color[len(legend) % len(self.color)]
-                self.ax.plot(x, y, linewidth=2, color=color)
-                # add function to legend
-                legend.append(f.mathtex_expr)
-        # create a list of ungrouped POI
-        color_index = 0
-        ungrouped_poi = []
-        for f in self.fg.functions:
-            if f.visible:
-                color = self.color[color_index % len(self.color)]
-                # function POI
-                for p in f.poi:
-                    if self.fg.point_type_enabled[p.point_type]:
-                        p.color = color
-                        ungrouped_poi.append(p)
-                color_index += 1
-        # add function intercepts POI to ungrouped list
-        for p in self.fg.poi:
-            if self.fg.point_type_enabled[p.point_type]:
-                p.color = 'black'
-                ungrouped_poi.append(p)
-        # group POI
-        if self.fg.show_poi:
-            if self.fg.grouped:
-                grouped_poi = self.fg.grouped_poi(ungrouped_poi)
-            else:
-                grouped_poi = ungrouped_poi
-        # draw POI
-            for p in grouped_poi:
-                if p.point_type > 1 and p.point_type < 9:
-                    if p.function.visible:
-                        # don't plot vertical or horizontal
-                        # asymptotes here. We'll do it later
-                        if p.point_type < 6 or p.point_type > 7:
-                            if self.fg.point_type_enabled\
-                                    [p.point_type]:
-                                self.ax.scatter([p.x], [p.y], s=80,
-                                                c=p.color, linewidths=0)
-                        # plot asymptotes now
-                        elif p.point_type == 6:
-                            if self.fg.point_type_enabled\
-                                    [p.point_type]:
-                                # vertical asymptotes are plotted
-                                # as 'x'
-                                self.ax.scatter([p.x], [0], s=80,
-                                                marker='x', c=p.color,
-                                                linewidths=2)
-                        elif p.point_type == 7:
-                            if self.fg.point_type_enabled\
-                                    [p.point_type]:
-                                # horizontal asymptotes are plotted
-                                # as '+'
-                                self.ax.scatter([0], [p.y], s=80,
-                                                marker='+', c=p.color,
-                                                linewidths=2)
-                elif p.point_type == 1:
-                    if p.function[0].visible \
-                            and p.function[1].visible \
-                            and self.fg.point_type_enabled[p.point_type]:
-                        # plot function intercepts
-                        self.ax.scatter([p.x], [p.y], s=80,
-                                        alpha=0.5,
-                                        c='black', linewidths=0)
-                elif p.point_type == 9:
-                    if self.fg.point_type_enabled[p.point_type]:
-                        # plot grouped poi
-                        self.ax.scatter([p.x], [p.y], s=p.size * 80,
-                                        alpha=0.8,
-                                        c='orange', linewidths=0)
-        # show legend
-        if self.fg.show_legend:
-            if self.fg.legend_location == 1:
-                anchor = (1, 1)
-            elif self.fg.legend_location == 2:
-                anchor = (0, 1)
-            elif self.fg.legend_location == 3:
-                anchor = (0, 0)
-            else:
-                anchor = (1, 0)
-            self.ax.legend(legend, loc=self.fg.legend_location,
-                           bbox_to_anchor=anchor, fontsize=18)
-        # show canvas
-        self.ax.figure.canvas.draw()
+        self.renderer.update(self.fg)
         # check/uncheck the toolbutton for auto-adjustment
         self.btn_auto.set_active(self.fg.auto)
 
@@ -649,18 +518,49 @@ class GUI:
 
     @threaded
     def on_button_addf_ok_clicked(self, widget):
-        gobject.idle_add(self.window_calculating.show)
+        self._show_calculating()
         expr = self.entry_function.get_text()
-        f = self.fg.add_function(expr)
+        f = self._add_function(expr)
         if f:
-            gobject.idle_add(self.dialog_add_function.hide)
             gobject.idle_add(self.window_calculating.hide)
-            gobject.idle_add(self.update_function_list)
-            gobject.idle_add(self.graph_update)
         else:
             gobject.idle_add(self.window_calculating.hide)
             gobject.idle_add(self.dialog_add_error.show)
 
+    def _show_calculating(self):
+        gobject.idle_add(self.label_calculating.set_text,
+                         _('Performing calculations. Please wait...'))
+        gobject.idle_add(self.window_calculating.show)
+
+    # runs in the calculating thread. The function is drawn as soon as
+    # it's sampled, and its POIs as they are found.
+    def _add_function(self, expr):
+        f = self.fg.new_function(expr)
+        if f is None:
+            return False
+        self.fg.analyse_function(f, self._show_poi, self._show_progress)
+        return True
+
+    # called from the calculating thread with changes to the graph.
+    # They are made and drawn in the main thread, behind the
+    # calculating window.
+    def _show_poi(self, change):
+        gobject.idle_add(self._apply_change, change)
+
+    def _apply_change(self, change):
+        change()
+        self.dialog_add_function.hide()
+        self.update_function_list()
+        self.graph_update()
+        return False
+
+    # called from the calculating thread, while intersections are
+    # being calculated
+    def _show_progress(self, done, total):
+        gobject.idle_add(self.label_calculating.set_text,
+                         _('Calculating intersections: %d of %d') %
+                         (done, total))
+
     # Error while adding function dialog
     def on_dialog_add_error_delete_event(self, widget, event):
         self.dialog_add_error.hide()
@@ -693,10 +593,8 @@ class GUI:
         folder = self.fcdialog_open.get_current_folder()
         logging.debug('Loading file: ' + filename)
         try:
-            filehandler = open(filename, "rb")
             try:
-                self.fg = pickle.load(filehandler)
-                filehandler.close()
+                self.fg = GraphFile.load(filename)
                 self.folder = folder
                 self.fg.update_xylimits()
                 self._restore_state()
@@ -705,7 +603,7 @@ class GUI:
                 self.fcdialog_open.hide()
                 self.changed = False
                 self.filename = filename
-            except:
+            except GraphFile.FormatError:
                 self.label_open_error.\
                     set_text(
                         _("File doesn't look like a FunctionPlot file."))
@@ -864,11 +762,9 @@ class GUI:
     @threaded
     def _add_example_function(self, expr):
         self.changed = True
-        gobject.idle_add(self.window_calculating.show)
-        f = self.fg.add_function(expr)
+        self._show_calculating()
+        self._add_function(expr)
         gobject.idle_add(self.window_calculating.hide)
-        gobject.idle_add(self.update_function_list)
-        gobject.idle_add(self.graph_update)
 
     def on_button_add_2_clicked(self, widget):
         self._add_example_function('2')
@@ -1125,9 +1021,7 @@ class GUI:
     # save the graph
     def _save(self):
         try:
-            filehandler = open(self.filename, "wb")
-            pickle.dump(self.fg, filehandler)
-            filehandler.close()
+            GraphFile.save(self.fg, self.filename)
             logging.debug('File saved: ' + self.filename)
             self.changed = False
             self.fcdialog_save.hide()
@@ -1140,7 +1034,7 @@ class GUI:
     def _export(self):
         try:
             filename = self.export_filename
-            self.fig.savefig(filename, dpi=300)
+            self.renderer.export(self.fg, filename, 300)
             self.fcdialog_export.hide()
         except:
             self.dialog_file_export_error.show()
@@ -1291,6 +1185,8 @@ class GUI:
         self.fig = Figure(facecolor='w', tight_layout=True)
         self.ax = self.fig.add_subplot(111)
         self.canvas = FigureCanvas(self.fig)
+        self.renderer = Renderer(self.ax, self.color)
+        self.resampler = Scheduler(self._sample, self._resampled)
         self.table.attach(self.canvas, 0, 1, 0, 1)
         # function list
         self.ls_functions = \
@@ -1371,6 +1267,7 @@ class GUI:
         # Calculating... window
         self.window_calculating = \
             builder.get_object('window_calculating')
+        self.label_calculating = builder.get_object('label4')
         # About dialog
         self.aboutdialog = \
             builder.get_object('aboutdialog')
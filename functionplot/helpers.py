@@ -9,32 +9,49 @@
 #
 
 from __future__ import division
-from sympy import Wild, solve, simplify, log, exp, evalf, re, im
+from sympy import Wild, solve, simplify, diff, limit, log, exp, re, \
+    im, lambdify, Symbol, E, Mul, pi, tan, cot, Rational, ilcm, igcd
+from sympy.functions.elementary.trigonometric import \
+    TrigonometricFunction
 from logging import debug
 import numpy as np
-from Queue import Empty as qEmpty
-import random
-from math import sqrt
-
-win32 = True
-try:
-    import winshell
-except ImportError:
-    win32 = False
-
-# don't use multiprocessing on win32. It causes huge slowdowns
-# because of the lack of os.fork()
-if win32:
-    from threading import Thread as fProcess
-    from Queue import Queue as fQueue
-else:
-    from multiprocessing import Process as fProcess
-    from multiprocessing import Queue as fQueue
-
-
-class BreakLoop(Exception):
+import threading
+import time
+from WorkerPool import get_pool, in_worker, win32
+from ExprCache import memoize, Uncached
+from Report import phase
+
+if not win32:
+    import signal
+
+# seconds to wait for sympy to solve an equation before giving up
+solve_timeout = 5
+
+# solves started in this thread give up at _budget.deadline
+_budget = threading.local()
+
+
+# functions that sympy knows about, but numpy doesn't. Everything
+# else is looked up in numpy when compiling expressions.
+np_namespace = {
+    'cot': lambda x: 1 / np.tan(x),
+    'sec': lambda x: 1 / np.cos(x),
+    'csc': lambda x: 1 / np.sin(x),
+    'Abs': np.abs
+}
+
+# the slow sympy calls are memoized, so that analysing an expression
+# again costs next to nothing. pod and fsolve are memoized below.
+simplify = memoize('simplify')(simplify)
+diff = memoize('diff')(diff)
+limit = memoize('limit')(limit)
+
+
+class SolveTimeout(BaseException):
     """
-    An Exception class to help breaking out of nested loops
+    Raised by the alarm signal handler when solving inside a worker
+    takes too long. It's not an Exception subclass, so sympy can't
+    swallow it.
     """
     pass
 
@@ -88,48 +105,220 @@ def pod(expr, sym):
 
     return list(set(pods))  # remove duplicates
 
+pod = memoize('pod')(pod)
 
-def mpsolve(q, expr):
+
+def mpsolve(expr):
+    # returns how solving went and the solutions
     try:
-        x = solve(expr, 'x')
-        q.put(x)
+        return 'solved', solve(expr, 'x')
     except NotImplementedError:
-        debug('NotImplementedError for solving "' + str(expr) + '"')
-        q.put(None)
+        debug('NotImplementedError for solving "%s"', expr)
+        return 'unsolved', None
     except TypeError:
         debug('TypeError exception. This was not supposed to ' +
               'happen. Probably a bug in sympy.')
-        q.put(None)
+        return 'unsolved', None
 
 
-def fsolve(expr):
-    xl = []
+def _raise_solve_timeout(signum, frame):
+    raise SolveTimeout
+
+
+def _solve_inline(expr, timeout):
+    # we're already running inside a pool worker, so we can't hand
+    # this over to another worker. Use an alarm signal to interrupt
+    # sympy instead.
+    handler = signal.signal(signal.SIGALRM, _raise_solve_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
     try:
-        q = fQueue()
-        p = fProcess(target=mpsolve, args=(q, expr,))
-        p.start()
-        # timeout solving after 5 seconds
-        x = q.get(True, 5)
-        p.join()
-        if x is None:
-            xl = None
-        else:
-            for i in x:
-                xc = rfc(i)
-                if xc is not None:
-                    xl.append(xc)
-                    debug('Found solution: ' + str(xc))
-    except qEmpty:
+        return mpsolve(expr)
+    except SolveTimeout:
         debug('Solving timed out.')
-        xl = None
+        return 'timed out', None
+    except Exception, e:
+        debug('Exception while solving: %r', e)
+        return 'error', None
     finally:
-        # if we're on windows and using threading instead
-        # of multiprocessing, terminate() doesn't work
-        if not win32:
-            p.terminate()
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, handler)
+
+
+def _x_kinds(expr, x, kinds):
+    # collects the ways x appears in expr: inside trigonometric
+    # functions, inside other transcendental functions, or on its own
+    if not expr.has(x):
+        return
+    if expr == x:
+        kinds.add('algebraic')
+    elif isinstance(expr, TrigonometricFunction):
+        kinds.add('trigonometric')
+    elif isinstance(expr, (exp, log)) or \
+            (expr.is_Pow and expr.exp.has(x)):
+        kinds.add('transcendental')
+    else:
+        for arg in expr.args:
+            _x_kinds(arg, x, kinds)
+
+
+def hopeless(expr):
+    """
+    A quick look at the expression tree, to tell if sympy has no
+    chance of solving expr=0. Trigonometric functions of x mixed with
+    x outside of them, or with exponentials and logarithms of x, make
+    equations sympy can't solve and only times out on.
+    """
+    x = Symbol('x')
+    # only the numerator matters for the roots. sympy solves products
+    # one factor at a time.
+    for factor in Mul.make_args(expr.as_numer_denom()[0]):
+        if factor.is_Pow and factor.exp.is_Integer and factor.exp > 0:
+            factor = factor.base
+        kinds = set()
+        _x_kinds(factor, x, kinds)
+        if 'trigonometric' in kinds and len(kinds) > 1:
+            return True
+    return False
+
+
+def _solve(expr, timeout):
+    if hopeless(expr):
+        debug('Not even trying to solve "%s"', expr)
+        return 'hopeless', None
+    if timeout <= 0:
+        debug('Out of time, not solving "%s"', expr)
+        return Uncached(('cancelled', None))
+    if in_worker():
+        outcome, x = _solve_inline(expr, timeout)
+    else:
+        result = get_pool().apply(mpsolve, (expr,), timeout)
+        if result is None:
+            # the worker was killed, or crashed
+            result = 'timed out', None
+        outcome, x = result
+    if outcome == 'timed out' and timeout < solve_timeout:
+        # the time budget cut this short. It might get solved if
+        # there's more time next time.
+        return Uncached((outcome, None))
+    if x is None:
+        return outcome, None
+    xl = []
+    for i in x:
+        xc = rfc(i)
+        if xc is not None:
+            xl.append(xc)
+            debug('Found solution: %s', xc)
     if xl == []:
         xl = None
-    return xl
+    return outcome, xl
+
+# timeouts are cached too. An equation that sympy couldn't solve in
+# time once is not worth waiting for again.
+_solve = memoize('solve', key_args=1)(_solve)
+
+
+def fsolve(expr, timeout=None):
+    """
+    Returns the real solutions of expr=0, or None if there are none
+    or sympy can't find them in timeout seconds. Solves inside a
+    solve_deadline() block also give up at its deadline.
+    """
+    if timeout is None:
+        timeout = solve_timeout
+    deadline = getattr(_budget, 'deadline', None)
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.time())
+    with phase('fsolve', expr) as p:
+        p.outcome, x = _solve(expr, timeout)
+        if x is not None:
+            p.size = len(x)
+    return x
+
+
+class _Deadline:
+
+    def __enter__(self):
+        self.previous = getattr(_budget, 'deadline', None)
+        _budget.deadline = self.deadline
+
+    def __exit__(self, *args):
+        _budget.deadline = self.previous
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+
+def solve_deadline(deadline):
+    """
+    Returns a context manager. Solves started inside it, in this
+    thread, give up at deadline (a time.time() value). Once it has
+    passed, they are cancelled without even starting.
+    """
+    return _Deadline(deadline)
+
+
+def has_period(expr, period):
+    """
+    Returns True if period is a period of expr
+    """
+    pf = expr.subs('x', 'x+period')
+    # instead of testing if f(x)==f(x+period)
+    # we're testing if f(x+period)==f(x+2*period)
+    # solves problems like with sec(x) where otherwise it
+    # would not find the equality
+    f = pf.subs('period', period)
+    g = pf.subs('period', 2 * period)
+    return f - g == 0
+
+has_period = memoize('period')(has_period)
+
+
+def trig_period(expr):
+    """
+    Works out a period of expr from the trigonometric functions in it,
+    without solving anything. x may only appear in the arguments of
+    trigonometric functions, and those have to be like a*x+b. The
+    period is the least common multiple of their periods. It is a
+    period of expr, but not always the smallest one. Returns None if
+    expr doesn't look periodic.
+    """
+    x = Symbol('x')
+    expr = expr.subs(Symbol('e'), E)
+    periods = []
+
+    def walk(e):
+        # False if x is found outside a trigonometric function
+        if isinstance(e, TrigonometricFunction):
+            arg = e.args[0]
+            a = arg.diff(x)
+            if a.has(x):
+                return False
+            if a == 0:
+                # a constant, like cos(1) in sin(x)+cos(1)
+                return True
+            if isinstance(e, (tan, cot)):
+                periods.append(pi / abs(a))
+            else:
+                periods.append(2 * pi / abs(a))
+            return True
+        if e == x:
+            return False
+        return all(walk(arg) for arg in e.args)
+
+    if not walk(expr) or not periods:
+        return None
+    nums, dens = [], []
+    for period in periods:
+        ratio = period / periods[0]
+        if ratio.is_Float:
+            # from decimal coefficients, like in sin(0.5*x)
+            ratio = Rational(str(ratio)).limit_denominator(1000)
+        if not ratio.is_Rational:
+            # sin(x)+sin(pi*x) is not periodic
+            return None
+        nums.append(ratio.p)
+        dens.append(ratio.q)
+    return periods[0] * reduce(ilcm, nums, 1) / reduce(igcd, dens)
 
 
 def rfc(x):
@@ -150,11 +339,18 @@ def rfc(x):
         # so in cases where the imaginary part is really small,
         # keep only the real part as a solution
         xe = x.evalf()
-        debug('Checking if this is a complex number: ' + str(xe))
+        debug('Checking if this is a complex number: %s', xe)
         real = re(xe)
         img = im(xe)
-        if abs(img) < 0.00000000000000001 * abs(real):
-            debug(str(real) + ' is actually a real.')
+        try:
+            small = abs(img) < 0.00000000000000001 * abs(real)
+            small = bool(small)
+        # and TypeError again if sympy can't evaluate the parts, as
+        # with some LambertW solutions
+        except TypeError:
+            small = False
+        if small:
+            debug('%s is actually a real.', real)
             xc = round(float(real), 15)
         else:
             debug('Yes, it is probably a complex.')
@@ -164,52 +360,61 @@ def rfc(x):
 
 def percentile(plist, perc):
     '''
-    returns the perc (range 0-100) percentile of plist
+    returns the perc (range 0-100) percentile of plist. perc may be a
+    list of percentiles, in which case a list is returned.
     '''
-    x = sorted(plist)
-    n = len(x)
-    pos = (n + 1) * perc / 100
-    k = int(np.floor(pos))
-    a = pos - k
-    p = x[k - 1] + a * (x[k] - x[k - 1])
-    return p
+    n = len(plist)
+    if n == 1:
+        return np.asarray(perc, dtype=float) * 0 + plist[0]
+    # the k-th of the n sorted values is at the 100k/(n+1) percentile.
+    # numpy puts it at 100(k-1)/(n-1), so convert.
+    q = (np.asarray(perc, dtype=float) * (n + 1) / 100 - 1) * 100 / (n - 1)
+    return np.percentile(np.asarray(plist, dtype=float), q)
 
 
 def remove_outliers(plist):
     '''
     This function takes a list (of floats/ints) and returns the list,
-    having replaced any outliers with the median value of the list.
+    as a numpy array, having replaced any outliers with the median
+    value of the list.
     '''
-    q1 = percentile(plist, 25)
-    q3 = percentile(plist, 75)
+    a = np.array(plist, dtype=float)
+    # m is the median
+    q1, m, q3 = percentile(a, [25, 50, 75])
     iqr = q3 - q1
     # This looks like a nice value. Decrease to make it easier for
     # a value to become an outlier, increase to make it harder.
     k = 18
-    # this is the median
-    m = percentile(plist, 50)
     # these are the limits we don't allow values to go under/over
     min_lim = q1 - k * iqr
     max_lim = q3 + k * iqr
     if min_lim < max_lim:
-        debug('Any values<' + str(min_lim) + ' or >' +
-              str(max_lim) + ' are outliers.')
-        for i in xrange(0, len(plist)):
-            if plist[i] < min_lim or plist[i] > max_lim:
-                debug('Found outlier: ' + str(plist[i]))
-                # if outliers are detected, replace their values with
-                # the median. That way it's easier to just set the
-                # axis limits to the min/max of the remaining values.
-                plist[i] = m
-    return plist
+        debug('Any values<%s or >%s are outliers.', min_lim, max_lim)
+        outliers = (a < min_lim) | (a > max_lim)
+        if outliers.any():
+            debug('Found outliers: %s', a[outliers])
+        # if outliers are detected, replace their values with the
+        # median. That way it's easier to just set the axis limits to
+        # the min/max of the remaining values.
+        a[outliers] = m
+    return a
 
 
 def log10(f):
     return log(f, 10)
 
 
-def sample(npfunc, points, tol=0.001, min_points=16, max_level=32,
-           sample_transform=None):
+def compile_expr(expr):
+    """
+    Compiles a sympy expression of x to a vectorized numpy function.
+    """
+    # e is left as a symbol when simplifying, numpy needs its value
+    expr = expr.subs(Symbol('e'), E)
+    return lambdify(Symbol('x'), expr, modules=[np_namespace, 'numpy'])
+
+
+def sample(func, points, tol=0.001, min_points=16, max_level=32,
+           max_points=50000, sample_transform=None):
     """
     Sample a 1D function to given tolerance by adaptive subdivision.
 
@@ -219,8 +424,9 @@ def sample(npfunc, points, tol=0.001, min_points=16, max_level=32,
 
     Parameters
     ----------
-    npfunc : a string representing a numpy function.
-        Example 'np.sin(x)'
+    func : callable
+        Vectorized function to sample, e.g. as returned by
+        compile_expr.
     points : array-like, 1D
         Initial points to sample, sorted in ascending order.
         These will determine also the bounds of sampling.
@@ -232,6 +438,10 @@ def sample(npfunc, points, tol=0.001, min_points=16, max_level=32,
         Minimum number of points to sample.
     max_level : int, optional
         Maximum subdivision depth.
+    max_points : int, optional
+        Maximum number of points to return. When refining would go
+        over this, only the intervals that need it the most are
+        refined and sampling stops.
     sample_transform : callable, optional
         Function w = g(x, y). The x-samples are generated so that w
         is sampled.
@@ -265,105 +475,253 @@ def sample(npfunc, points, tol=0.001, min_points=16, max_level=32,
     >>> plt.show()
 
     """
-    func = _func(npfunc)
-    return _sample_function(func, points, values=None, mask=None,
-                            depth=0, tol=tol, min_points=min_points,
-                            max_level=max_level,
+    return _sample_function(func, points, tol=tol, min_points=min_points,
+                            max_level=max_level, max_points=max_points,
                             sample_transform=sample_transform)
 
 
-def _sample_function(func, points, values=None, mask=None, tol=0.05,
-                     depth=0, min_points=16, max_level=16,
-                     sample_transform=None):
-    points = np.asarray(points)
-
-    if values is None:
-        values = np.atleast_2d(func(points))
-
-    if mask is None:
-        mask = Ellipsis
-
-    if depth > max_level:
-        # recursion limit
-        return points, values
-
-    x_a = points[..., :-1][..., mask]
-    x_b = points[..., 1:][..., mask]
-
-    x_c = .5 * (x_a + x_b)
-    y_c = np.atleast_2d(func(x_c))
-
-    x_2 = np.r_[points, x_c]
-    y_2 = np.r_['-1', values, y_c]
-    j = np.argsort(x_2)
-
-    x_2 = x_2[..., j]
-    y_2 = y_2[..., j]
-
-    # -- Determine the intervals at which refinement is necessary
+class _SampleBuffer:
+    """
+    Preallocated arrays for the sampler: the points, the length of
+    every segment between them and the bend at every inner point.
+    Grown geometrically when needed.
+    """
 
-    if len(x_2) < min_points:
-        mask = np.ones([len(x_2) - 1], dtype=bool)
-    else:
-        # represent the data as a path in N dimensions
-        # (scaled to unit box)
+    def __init__(self, size):
+        self.x = np.empty(size)
+        self.y = np.empty(size)
+        self.s = np.empty(size)
+        self.d = np.empty(size)
+
+    def reserve(self, size, max_size):
+        if size > len(self.x):
+            self.__init__(min(max(2 * len(self.x), size), max_size))
+
+
+def _path_pieces(x, y, xscale, yscale):
+    # represent the data as a path in 2 dimensions (scaled to unit
+    # box) and compute the length of each line segment in the path
+    # and the angle between consecutive line segments, times the
+    # length of these segments.
+    dpx = np.diff(x / xscale)
+    dpy = np.diff(y / yscale)
+    s = np.sqrt(dpx**2 + dpy**2)
+    dpx /= s
+    dpy /= s
+    dcos = np.arccos(np.clip(dpx[1:] * dpx[:-1] + dpy[1:] * dpy[:-1],
+                             -1, 1))
+    return s, dcos * .5 * (s[1:] + s[:-1])
+
+
+def _bends(x, y, s, xscale, yscale, vert):
+    # same as the bends computed in _path_pieces, but only for the
+    # given inner points
+    px = x[vert - 1] / xscale
+    py = y[vert - 1] / yscale
+    qx = x[vert] / xscale
+    qy = y[vert] / yscale
+    rx = x[vert + 1] / xscale
+    ry = y[vert + 1] / yscale
+    s_0 = s[vert - 1]
+    s_1 = s[vert]
+    dcos = np.arccos(np.clip((rx - qx) / s_1 * ((qx - px) / s_0) +
+                             (ry - qy) / s_1 * ((qy - py) / s_0),
+                             -1, 1))
+    return dcos * .5 * (s_1 + s_0)
+
+
+def _sample_function(func, points, tol=0.05, min_points=16,
+                     max_level=16, max_points=50000,
+                     sample_transform=None):
+    points = np.asarray(points, dtype=float)
+    values = func(points)
+    if np.ndim(values) == 0:
+        # constant functions give back a single value
+        raise IndexError('Function does not depend on x')
+    n = len(points)
+    size = min(4 * n, max_points)
+    cur = _SampleBuffer(max(size, n))
+    new = _SampleBuffer(max(size, n))
+    cur.x[:n] = points
+    cur.y[:n] = values
+    # the first pass refines all intervals
+    mask = np.ones(n - 1, dtype=bool)
+    score = None
+    yscale = None
+    xscale = points[-1] - points[0]
+    for depth in xrange(max_level + 1):
+        # -- Refine the flagged intervals
+        idx = np.nonzero(mask)[0]
+        m = len(idx)
+        over_budget = n + m > max_points
+        if over_budget:
+            m = max_points - n
+            if m <= 0:
+                break
+            if score is None:
+                keep = np.linspace(0, len(idx) - 1, m).astype(int)
+            else:
+                keep = np.argpartition(-score[idx], m - 1)[:m]
+                keep.sort()
+            idx = idx[keep]
+            mask = np.zeros(n - 1, dtype=bool)
+            mask[idx] = True
+        x = cur.x[:n]
+        y = cur.y[:n]
+        x_c = .5 * (x[idx] + x[idx + 1])
+        y_c = func(x_c)
+        # merge the new points in: every point moves right by the
+        # number of refined intervals before it and every midpoint
+        # goes right after the left end of its interval.
+        shift = np.zeros(n, dtype=int)
+        np.cumsum(mask, out=shift[1:])
+        pos = np.arange(n) + shift
+        mid = idx + shift[idx] + 1
+        n_new = n + m
+        new.reserve(n_new, max(max_points, n))
+        x_2 = new.x[:n_new]
+        y_2 = new.y[:n_new]
+        x_2[pos] = x
+        x_2[mid] = x_c
+        y_2[pos] = y
+        y_2[mid] = y_c
+        s_2 = new.s[:n_new - 1]
+        d_2 = new.d[:n_new - 2]
+        if over_budget:
+            cur, new = new, cur
+            n = n_new
+            break
+
+        # -- Determine the intervals at which refinement is necessary
+
+        if n_new < min_points:
+            mask = np.ones(n_new - 1, dtype=bool)
+            score = None
+            yscale = None
+            cur, new = new, cur
+            n = n_new
+            continue
         if sample_transform is not None:
             y_2_val = sample_transform(x_2, y_2)
         else:
             y_2_val = y_2
-
-        p = np.r_['0',
-                  x_2[None, :],
-                  y_2_val.real.reshape(-1, y_2_val.shape[-1]),
-                  y_2_val.imag.reshape(-1, y_2_val.shape[-1])
-                  ]
-
-        sz = (p.shape[0] - 1) // 2
-
-        xscale = x_2.ptp(axis=-1)
-        yscale = abs(y_2_val.ptp(axis=-1)).ravel()
-
-        p[0] /= xscale
-        p[1:sz + 1] /= yscale[:, None]
-        p[sz + 1:] /= yscale[:, None]
-
-        # compute the length of each line segment in the path
-        dp = np.diff(p, axis=-1)
-        s = np.sqrt((dp**2).sum(axis=0))
-        s_tot = s.sum()
-
-        # compute the angle between consecutive line segments
-        dp /= s
-        dcos = np.arccos(np.clip((dp[:, 1:] * dp[:, :-1]).sum(axis=0),
-                                 -1, 1))
+        yscale_2 = abs(y_2_val.ptp())
+        if sample_transform is None and yscale_2 == yscale and \
+                0 < yscale < np.inf:
+            # the scale didn't change, so only the segments and bends
+            # around the new points need to be computed. Everything
+            # else is moved over from the previous pass.
+            keep = np.ones(n - 1, dtype=bool)
+            keep[idx] = False
+            s_2[pos[:-1][keep]] = cur.s[:n - 1][keep]
+            d_2[pos[1:-1] - 1] = cur.d[:n - 2]
+            # the two halves of every refined interval
+            seg = np.r_[mid - 1, mid]
+            s_2[seg] = np.sqrt((x_2[seg + 1] / xscale -
+                                x_2[seg] / xscale)**2 +
+                               (y_2[seg + 1] / yscale -
+                                y_2[seg] / yscale)**2)
+            # the bends at the midpoints and at the interval ends
+            vert = np.unique(np.r_[mid - 1, mid, mid + 1])
+            vert = vert[(vert > 0) & (vert < n_new - 1)]
+            d_2[vert - 1] = _bends(x_2, y_2, s_2, xscale, yscale, vert)
+        else:
+            yscale = yscale_2
+            s, d = _path_pieces(x_2, y_2_val, xscale, yscale)
+            s_2[:] = s
+            d_2[:] = d
+        s_tot = s_2.sum()
 
         # determine where to subdivide: the condition is roughly that
         # the total length of the path (in the scaled data) is
         # computed to accuracy `tol`
-        dp_piece = dcos * .5 * (s[1:] + s[:-1])
-        mask = (dp_piece > tol * s_tot)
-
-        mask = np.r_[mask, False]
-        mask[1:] |= mask[:-1].copy()
-
-    # -- Refine, if necessary
-
-    if mask.any():
-        return _sample_function(func, x_2, y_2, mask, tol=tol,
-                                depth=depth + 1, min_points=min_points,
-                                max_level=max_level,
-                                sample_transform=sample_transform)
-    else:
-        return x_2, y_2
-
-
-def _func(npexpr):
+        dp_mask = d_2 > tol * s_tot
+        mask = np.zeros(n_new - 1, dtype=bool)
+        mask[:-1] = dp_mask
+        mask[1:] |= dp_mask
+        score = np.zeros(n_new - 1)
+        score[:-1] = d_2
+        score[1:] = np.maximum(score[1:], d_2)
+        cur, new = new, cur
+        n = n_new
+        if not mask.any():
+            break
+    return cur.x[:n].copy(), cur.y[:n].copy()[None, :]
+
+
+def add_edge_points(x, y, y_min, y_max):
+    """
+    Takes sampled points of a function, where values that are off
+    the displayed scale have been set to inf or -inf. Removes
+    consecutive inf (or -inf) values and adds points on the top and
+    bottom edge of the graph wherever the function goes off scale,
+    so that the curve is drawn up to the edge.
     """
-    Returns a numpy expression as a callable function
+    y_mean = (y_max + y_min) / 2
+    # delete consecutive inf or -inf values
+    keep = np.ones(len(y), dtype=bool)
+    keep[1:] = ~(np.isinf(y[1:]) & (y[1:] == y[:-1]))
+    x = x[keep]
+    y = y[keep]
+    # every pair of consecutive points where one is off scale and
+    # the other is on the same half of the graph gets an edge point
+    # in between. It takes the x of the point that is on scale.
+    y_prev = y[:-1]
+    y_next = y[1:]
+    top_in = (y_next == np.inf) & (y_prev > y_mean)
+    top_out = (y_next > y_mean) & (y_prev == np.inf)
+    bottom_in = (y_next == -np.inf) & (y_prev < y_mean)
+    bottom_out = (y_next < y_mean) & (y_prev == -np.inf)
+    top = top_in | top_out
+    bottom = bottom_in | bottom_out
+    add_x = np.where(top_in | bottom_in, x[:-1], x[1:])
+    add = top | bottom
+    # add_x[i] goes between points i and i+1
+    index = np.nonzero(add)[0] + 1
+    x = np.insert(x, index, add_x[add])
+    y = np.insert(y, index, np.where(top[add], y_max, y_min))
+    return x, y
+
+
+def decimate(x, y, x_min, x_max, columns, log=False):
     """
-    def f(x):
-        return eval(npexpr)
-    return f
+    Reduces sampled points to what can be seen on a graph that is
+    columns pixels wide. Where the points are finite, only the lowest
+    and the highest one in every pixel column are kept, so peaks stay
+    where they are. Points that are not finite, which break the
+    curve, and the first and last point of every unbroken piece, the
+    ones at the edges of the graph, are all kept. If log is True the
+    columns are spaced logarithmically.
+    """
+    if len(x) <= 4 * columns:
+        return x, y
+    if log:
+        with np.errstate(all='ignore'):
+            pos = (np.log10(x) - np.log10(x_min)) / \
+                (np.log10(x_max) - np.log10(x_min))
+    else:
+        pos = (x - x_min) / (x_max - x_min)
+    finite = np.isfinite(y) & np.isfinite(pos)
+    column = np.clip(np.floor(pos * columns), -1, columns)
+    # every unbroken piece of the curve is numbered. The point that
+    # breaks it starts the next one, in a column of its own.
+    piece = np.cumsum(~finite)
+    column[~finite] = -2
+    # sorted by piece, column and y, the first and the last point of
+    # every piece and column are the lowest and the highest
+    order = np.lexsort((y, column, piece))
+    key = (piece * (columns + 3) + column + 2)[order]
+    first = np.ones(len(x), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    last = np.ones(len(x), dtype=bool)
+    last[:-1] = first[1:]
+    keep = np.zeros(len(x), dtype=bool)
+    keep[order[first | last]] = True
+    # the ends of every piece
+    keep[[0, -1]] = True
+    keep[1:] |= ~finite[:-1]
+    keep[:-1] |= ~finite[1:]
+    return x[keep], y[keep]
 
 
 def keep10(lst):
@@ -373,7 +731,7 @@ def keep10(lst):
     """
     l = len(lst)
     if l > 10:
-        debug('Too many POI in list (' + str(l) + '). Keeping only 10.')
+        debug('Too many POI in list (%s). Keeping only 10.', l)
         lst = [lst[0], lst[int(l / 10)], lst[int(l / 5)],
                lst[int(3 * l / 10)], lst[int(2 * l / 5)],
                lst[int(l / 2)], lst[int(3 * l / 5)],
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# Interval arithmetic root isolation. An expression of x is compiled to
+# a function that takes arrays of interval bounds and returns bounds
+# that enclose the values of the expression over every interval. If
+# an interval's enclosure doesn't contain 0, there's no root in it, so
+# branch and bound finds every root in a window, not just the ones
+# that a sampling grid happens to catch.
+
+from __future__ import division
+import numpy as np
+from sympy import Add, Mul, Pow, Symbol, Number, NumberSymbol, E, \
+    sin, cos, tan, cot, sec, csc, asin, acos, atan, exp, log, Abs
+from roots import refine, find_roots
+
+_two_pi = 2 * np.pi
+_half_pi = np.pi / 2
+
+
+class Unsupported(ValueError):
+    """
+    Raised when an expression has parts that can't be evaluated with
+    intervals.
+    """
+    pass
+
+
+def _out(lo, hi):
+    # rounds outwards, so that rounding errors don't shrink intervals
+    return np.nextafter(lo, -np.inf), np.nextafter(hi, np.inf)
+
+
+def _add(a, b):
+    return _out(a[0] + b[0], a[1] + b[1])
+
+
+def _mul(a, b):
+    p = np.array([a[0] * b[0], a[0] * b[1], a[1] * b[0], a[1] * b[1]])
+    # 0 * inf is 0 as far as bounds go
+    p[np.isnan(p)] = 0
+    lo, hi = p.min(axis=0), p.max(axis=0)
+    empty = np.isnan(a[0]) | np.isnan(b[0])
+    lo[empty] = hi[empty] = np.nan
+    return _out(lo, hi)
+
+
+def _recip(a):
+    lo, hi = a
+    lo_r = np.where(hi == 0, -np.inf, 1 / hi)
+    hi_r = np.where(lo == 0, np.inf, 1 / lo)
+    # across zero the reciprocal is unbounded both ways, and 1/0 is
+    # nothing at all
+    across = (lo < 0) & (hi > 0)
+    lo_r[across] = -np.inf
+    hi_r[across] = np.inf
+    zero = (lo == 0) & (hi == 0)
+    lo_r[zero] = hi_r[zero] = np.nan
+    return _out(lo_r, hi_r)
+
+
+def _int_pow(a, n):
+    if n < 0:
+        return _recip(_int_pow(a, -n))
+    lo, hi = a
+    plo, phi = lo ** n, hi ** n
+    if n % 2:
+        return _out(plo, phi)
+    low = np.where(lo > 0, plo, np.where(hi < 0, phi, 0))
+    return _out(low, np.maximum(plo, phi))
+
+
+def _real_pow(a, p):
+    # like numpy, negative bases are out of the domain
+    lo, hi = a
+    lo = np.maximum(lo, 0)
+    lo[hi < 0] = np.nan
+    if p > 0:
+        return _out(lo ** p, hi ** p)
+    return _out(hi ** p, lo ** p)
+
+
+def _exp(a):
+    return _out(np.exp(a[0]), np.exp(a[1]))
+
+
+def _log(a):
+    lo, hi = a
+    lo_r = np.where(lo > 0, np.log(np.maximum(lo, 0)), -np.inf)
+    hi_r = np.where(hi > 0, np.log(np.maximum(hi, 0)), np.nan)
+    lo_r[np.isnan(hi_r)] = np.nan
+    return _out(lo_r, hi_r)
+
+
+def _sin(a):
+    lo, hi = a
+    slo, shi = np.sin(lo), np.sin(hi)
+    lo_r, hi_r = np.minimum(slo, shi), np.maximum(slo, shi)
+    # the max of sin is at pi/2 + 2kpi and the min at -pi/2 + 2kpi
+    top = _half_pi + _two_pi * np.ceil((lo - _half_pi) / _two_pi)
+    bottom = -_half_pi + _two_pi * np.ceil((lo + _half_pi) / _two_pi)
+    wide = ~(hi - lo < _two_pi)
+    hi_r[(top <= hi) | wide] = 1
+    lo_r[(bottom <= hi) | wide] = -1
+    return _out(lo_r, hi_r)
+
+
+def _cos(a):
+    return _sin(_add(a, (_half_pi, _half_pi)))
+
+
+def _tan(a):
+    lo, hi = a
+    lo_r, hi_r = np.tan(lo), np.tan(hi)
+    pole = _half_pi + np.pi * np.ceil((lo - _half_pi) / np.pi)
+    across = (pole <= hi) | ~(hi - lo < np.pi)
+    lo_r[across] = -np.inf
+    hi_r[across] = np.inf
+    return _out(lo_r, hi_r)
+
+
+def _clip_unit(a):
+    # the domain of asin and acos
+    lo, hi = np.maximum(a[0], -1), np.minimum(a[1], 1)
+    empty = lo > hi
+    lo[empty] = hi[empty] = np.nan
+    return lo, hi
+
+
+def _asin(a):
+    lo, hi = _clip_unit(a)
+    return _out(np.arcsin(lo), np.arcsin(hi))
+
+
+def _acos(a):
+    lo, hi = _clip_unit(a)
+    return _out(np.arccos(hi), np.arccos(lo))
+
+
+def _atan(a):
+    return _out(np.arctan(a[0]), np.arctan(a[1]))
+
+
+def _abs(a):
+    lo, hi = a
+    alo, ahi = np.abs(lo), np.abs(hi)
+    low = np.where((lo <= 0) & (hi >= 0), 0, np.minimum(alo, ahi))
+    return low, np.maximum(alo, ahi)
+
+
+_functions = {
+    sin: _sin,
+    cos: _cos,
+    tan: _tan,
+    cot: lambda a: _recip(_tan(a)),
+    sec: lambda a: _recip(_cos(a)),
+    csc: lambda a: _recip(_sin(a)),
+    asin: _asin,
+    acos: _acos,
+    atan: _atan,
+    exp: _exp,
+    log: _log,
+    Abs: _abs
+}
+
+
+def _constant(value):
+    def f(x):
+        c = np.full_like(x[0], value)
+        return _out(c, c)
+    return f
+
+
+def _compile(expr):
+    if expr == Symbol('x'):
+        return lambda x: x
+    if expr == Symbol('e'):
+        # e is left as a symbol when simplifying
+        return _constant(float(E))
+    if isinstance(expr, (Number, NumberSymbol)):
+        if not expr.is_real:
+            raise Unsupported(expr)
+        return _constant(float(expr))
+    if isinstance(expr, (Add, Mul)):
+        op = _add if isinstance(expr, Add) else _mul
+        args = [_compile(arg) for arg in expr.args]
+
+        def f(x):
+            value = args[0](x)
+            for arg in args[1:]:
+                value = op(value, arg(x))
+            return value
+        return f
+    if isinstance(expr, Pow):
+        base, power = expr.args
+        if power.is_Integer:
+            b, n = _compile(base), int(power)
+            return lambda x: _int_pow(b(x), n)
+        if power.is_real and power.is_number:
+            b, p = _compile(base), float(power)
+            return lambda x: _real_pow(b(x), p)
+        # base ** power = exp(power * log(base))
+        b, p = _compile(base), _compile(power)
+        return lambda x: _exp(_mul(p(x), _log(b(x))))
+    if expr.func in _functions and len(expr.args) == 1:
+        arg, op = _compile(expr.args[0]), _functions[expr.func]
+        return lambda x: op(arg(x))
+    raise Unsupported(expr)
+
+
+def compile_interval(expr):
+    """
+    Compiles a sympy expression of x to a function that takes the
+    lower and upper bounds of intervals, as arrays, and returns the
+    bounds of the values of expr over them. Intervals that are out of
+    the domain of expr come out as nan. Raises Unsupported if expr
+    has functions other than polynomials, trigonometric functions and
+    their inverses, exp, log, powers and abs.
+    """
+    f = _compile(expr)
+    return lambda lo, hi: f((np.asarray(lo, dtype=float),
+                             np.asarray(hi, dtype=float)))
+
+
+def _point(f):
+    # evaluates an interval function at points
+    def value(x):
+        lo, hi = f(x, x)
+        return (lo + hi) / 2
+    return value
+
+
+def _bounded(value, x, span):
+    # tells a jump from a pole. Closing in on a pole, value grows.
+    near = abs(value(np.array([x - 1e-4 * span, x + 1e-4 * span])))
+    far = abs(value(np.array([x - 1e-2 * span, x + 1e-2 * span])))
+    return near.max() <= 10 * far.max()
+
+
+def _spans(a, b):
+    # merges the [a, b] intervals that touch each other
+    order = np.argsort(a)
+    a, b = a[order], b[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = a[1:] > b[:-1]
+    last = np.ones(len(a), dtype=bool)
+    last[:-1] = first[1:]
+    return zip(a[first], b[last])
+
+
+def isolate_roots(expr, x_min, x_max, dexpr=None, max_work=20000,
+                  tol=1e-9, jumps=False):
+    """
+    Returns all the roots of expr in [x_min, x_max], in a sorted array,
+    or None if expr is not supported. Roots where expr touches 0
+    without changing sign are found too. dexpr, the derivative of
+    expr, is optional. Where it doesn't change sign there's at most
+    one root, which is refined without more interval evaluations.
+
+    After max_work interval evaluations, the parts of the window that
+    are still undecided are sampled with find_roots. Interval bounds
+    are poor near removable singularities, like 0 in sin(x)/x.
+
+    If jumps is True, places where expr jumps from one sign to the
+    other count as roots.
+    """
+    if not expr.has(Symbol('x')):
+        # constants have no roots worth reporting
+        return np.array([])
+    try:
+        f = compile_interval(expr)
+    except Unsupported:
+        return None
+    df = None
+    if dexpr is not None:
+        try:
+            df = compile_interval(dexpr)
+        except Unsupported:
+            pass
+    value = _point(f)
+    dvalue = _point(df) if df is not None else None
+    edges = np.linspace(x_min, x_max, 65)
+    lo, hi = edges[:-1], edges[1:]
+    work = 0
+    monotonic = [np.array([])] * 2
+    tiny = [np.array([])] * 2
+    with np.errstate(all='ignore'):
+        while len(lo):
+            work += len(lo)
+            if work > max_work:
+                break
+            flo, fhi = f(lo, hi)
+            keep = (flo <= 0) & (fhi >= 0)
+            lo, hi = lo[keep], hi[keep]
+            if df is not None:
+                flo, fhi = flo[keep], fhi[keep]
+                dlo, dhi = df(lo, hi)
+                # a bounded function that only goes up or down has a
+                # root if it changes sign and none otherwise
+                mono = ((dlo > 0) | (dhi < 0)) & np.isfinite(flo) & \
+                    np.isfinite(fhi)
+                monotonic = [np.concatenate([monotonic[0], lo[mono]]),
+                             np.concatenate([monotonic[1], hi[mono]])]
+                lo, hi = lo[~mono], hi[~mono]
+            small = hi - lo <= tol
+            tiny = [np.concatenate([tiny[0], lo[small]]),
+                    np.concatenate([tiny[1], hi[small]])]
+            lo, hi = lo[~small], hi[~small]
+            mid = (lo + hi) / 2
+            lo, hi = np.concatenate([lo, mid]), np.concatenate([mid, hi])
+        roots = []
+        for l, h in _spans(lo, hi):
+            roots.extend(find_roots(value, l, h, 1000, dvalue, jumps))
+        a, b = monotonic
+        fa, fb = value(a), value(b)
+        roots.extend(a[fa == 0])
+        roots.extend(b[fb == 0])
+        change = fa * fb < 0
+        if change.any():
+            x, fx = refine(value, dvalue, a[change], b[change],
+                           fa[change], fb[change])
+            roots.extend(x[~np.isnan(fx)])
+        # tiny intervals next to each other enclose the same root
+        for l, h in _spans(*tiny):
+            c = (l + h) / 2
+            fl, fc, fh = value(np.array([l, c, h]))
+            if max(abs(fl), abs(fc), abs(fh)) <= 1e-6 or \
+                    (jumps and fl * fh < 0 and
+                     _bounded(value, c, x_max - x_min)):
+                roots.append(c)
+    roots = np.unique(roots)
+    if len(roots):
+        # the same root may come from both sides of an edge
+        roots = roots[np.concatenate([[True], np.diff(roots) > tol])]
+    return roots
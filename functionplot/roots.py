@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+# Numeric root finding, used when sympy can't solve an equation.
+
+from __future__ import division
+import numpy as np
+from sympy import Poly, Rational, Symbol
+
+
+def _evaluate(func, x):
+    # returns func(x) as a float array, or None if func is constant
+    y = func(x)
+    if np.isscalar(y) or np.shape(y) != np.shape(x):
+        return None
+    return np.asarray(y, dtype=float)
+
+
+def refine(func, dfunc, a, b, fa, fb, max_iter=200):
+    """
+    Refines all the [a, b] brackets, where func changes sign, at
+    once. Uses a Newton step with dfunc if it's given and the step
+    stays inside the bracket, and the Illinois variant of false
+    position otherwise. Whenever a step doesn't halve the bracket,
+    the next one bisects it. Returns the roots and func at the roots.
+    """
+    x = (a + b) / 2
+    width = b - a
+    fx = fa
+    # which end of the bracket was moved last: -1 for a, 1 for b
+    moved = np.zeros(len(a), dtype=int)
+    done = np.zeros(len(a), dtype=bool)
+    for i in xrange(max_iter):
+        fx = np.where(done, fx, _evaluate(func, x))
+        same = np.sign(fx) == np.sign(fa)
+        a = np.where(same, x, a)
+        fa = np.where(same, fx, fa)
+        b = np.where(same, b, x)
+        fb = np.where(same, fb, fx)
+        # if the same end moved twice, halve the value at the other
+        # end, so that false position doesn't stall
+        fb = np.where(same & (moved == -1), fb / 2, fb)
+        fa = np.where(~same & (moved == 1), fa / 2, fa)
+        moved = np.where(same, -1, 1)
+        slow = b - a > width / 2
+        width = b - a
+        # near 0 precision is absolute, roots don't get refined down
+        # to denormals
+        xtol = 4 * np.spacing(np.maximum(np.maximum(abs(a), abs(b)), 1))
+        done |= (fx == 0) | np.isnan(fx) | (b - a <= xtol)
+        if done.all():
+            break
+        x_new = a - fa * (b - a) / (fb - fa)
+        if dfunc is not None:
+            d = _evaluate(dfunc, x)
+            if d is not None:
+                newton = x - fx / d
+                x_new = np.where((newton > a) & (newton < b), newton,
+                                 x_new)
+        # bisect if the step failed, or the last one was too slow
+        bad = slow | ~((x_new > a) & (x_new < b))
+        x_new = np.where(bad, (a + b) / 2, x_new)
+        # a step that hardly moves means x is there already. Newton
+        # closes in from one side, so the bracket can stay wide.
+        converged = ~bad & (abs(x_new - x) <= xtol)
+        x = np.where(done, x, x_new)
+        done |= converged
+    return x, fx
+
+
+def find_roots(func, x_min, x_max, points=10000, dfunc=None, jumps=False):
+    """
+    Returns the roots of func in [x_min, x_max], in a sorted array.
+    func is evaluated at points equally spaced points, with numpy.
+    Every place where it changes sign is refined to full precision.
+    Sign changes across poles and jumps are dropped, and so are
+    roots where func touches zero without crossing it, unless they
+    happen to be on one of the points. dfunc, the derivative of
+    func, is optional and speeds up refining. If jumps is True, the
+    places where func jumps from one sign to the other are kept, but
+    poles are still dropped.
+    """
+    x = np.linspace(x_min, x_max, points)
+    with np.errstate(all='ignore'):
+        y = _evaluate(func, x)
+        if y is None:
+            # constant functions have no roots worth reporting
+            return np.array([])
+        zeros = x[y == 0]
+        s = np.sign(y)
+        i = np.nonzero(s[:-1] * s[1:] < 0)[0]
+        if len(i) == 0:
+            return zeros
+        a, b, fa, fb = x[i], x[i + 1], y[i], y[i + 1]
+        roots, froots = refine(func, dfunc, a, b, fa, fb)
+        # at a root func gets a lot closer to 0 than at the ends of
+        # the bracket. At a pole or a jump it doesn't.
+        real = abs(froots) <= 1e-3 * np.minimum(abs(fa), abs(fb))
+        if jumps:
+            # at a pole func grows without bound, at a jump it doesn't
+            real |= abs(froots) <= 2 * np.maximum(abs(fa), abs(fb))
+    roots = np.concatenate([zeros, roots[real]])
+    roots.sort()
+    return roots
+
+
+def _fractions(q):
+    # fractions close to q, the simplest first
+    for n in (10 ** 3, 10 ** 6, 10 ** 9, 10 ** 12):
+        yield q.limit_denominator(n)
+
+
+def _float(q):
+    # correctly rounded, unlike float() of a sympy Rational
+    return q.p / q.q
+
+
+def _rational(c):
+    # the simplest fraction within a few rounding errors of c, so that
+    # coefficients like 0.1 or 1/3 are what they were meant to be
+    for r in _fractions(Rational(c)):
+        if abs(_float(r) - c) <= 4 * abs(np.spacing(c)):
+            return r
+    return Rational(c)
+
+
+def real_roots(coeffs):
+    """
+    Returns the real roots of the polynomial with coeffs, highest
+    power first, in a sorted array. A multiple root is reported once.
+    The coefficients are turned into fractions and the real roots are
+    isolated exactly, so close roots are told apart and complex ones
+    never pass for real, however close to the real axis they are.
+    """
+    coeffs = np.trim_zeros(np.asarray(coeffs, dtype=float), 'f')
+    if len(coeffs) < 2 or not np.isfinite(coeffs).all():
+        return np.array([])
+    p = Poly([_rational(c) for c in coeffs], Symbol('x'))
+    x, a, b, simple = [], [], [], []
+    for (lo, hi), m in p.intervals(eps=1e-10):
+        # roots that are simple fractions are exact
+        for r in _fractions((lo + hi) / 2):
+            if lo <= r <= hi and p.eval(r) == 0:
+                lo = hi = r
+                break
+        x.append(_float((lo + hi) / 2))
+        a.append(_float(lo))
+        b.append(_float(hi))
+        simple.append(m == 1 and lo != hi)
+    x, a, b = np.array(x), np.array(a), np.array(b)
+    simple = np.array(simple, dtype=bool)
+    if len(x):
+        # a few Newton steps fix the last bits of the simple ones,
+        # as long as they stay in their intervals
+        d = np.polyder(coeffs)
+        for i in xrange(3):
+            with np.errstate(all='ignore'):
+                x_new = x - np.polyval(coeffs, x) / np.polyval(d, x)
+                ok = simple & (x_new >= a) & (x_new <= b)
+            x[ok] = x_new[ok]
+    return np.sort(x)
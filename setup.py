@@ -29,7 +29,8 @@ optimal position and zoom scale for the graph.""",
     packages = find_packages(exclude="test"),
  
     entry_points = {
-        'console_scripts': ['functionplot = functionplot.functionplot:main']
+        'console_scripts': ['functionplot = functionplot.functionplot:main',
+            'functionplot-batch = functionplot.batch:main']
                     },
  
     download_url = "https://github.com/gapan/functionplot",
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+import json
+from StringIO import StringIO
+from functionplot.batch import analyse, run
+
+
+class BatchTest(unittest.TestCase):
+
+    def test_analyse(self):
+        r = analyse('x^2-1')
+        self.assertTrue(r['valid'])
+        self.assertEqual(sorted(r['poi']['x_intercept']),
+                         [[-1.0, 0.0], [1.0, 0.0]])
+        self.assertEqual(r['poi']['min_max'], [[0.0, -1.0]])
+        self.assertFalse(r['periodic'])
+        (x_min, x_max), (y_min, y_max) = r['limits']
+        self.assertTrue(x_min < -1 and x_max > 1)
+
+    def test_run(self):
+        out = StringIO()
+        failed = run(['x+1\n', '\n', '# comment\n', 'x+(\n'], out,
+                     processes=2)
+        lines = [json.loads(l) for l in out.getvalue().splitlines()]
+        lines.sort(key=lambda r: r['index'])
+        self.assertEqual(failed, 1)
+        self.assertEqual([r['expr'] for r in lines], ['x+1', 'x+('])
+        self.assertTrue(lines[0]['valid'])
+        self.assertFalse(lines[1]['valid'])
+
+
+if __name__ == '__main__':
+    unittest.main()
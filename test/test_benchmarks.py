@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+from StringIO import StringIO
+from functionplot.WorkerPool import get_pool
+from benchmarks.run import bench_function, compare
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def test_function(self):
+        records = bench_function(get_pool(), 'rational', '1/(x^2+1)')
+        self.assertEqual([r['stage'] for r in records],
+                         ['function', 'sample', 'poi'])
+        for r in records:
+            for k in ['wall', 'cpu', 'worker_cpu', 'peak_rss_kb',
+                      'points', 'sympy_calls']:
+                self.assertTrue(k in r)
+        self.assertEqual(records[0]['sympy_calls'], {'simplify': 1})
+        self.assertTrue(records[2]['sympy_calls']['solve'] > 0)
+
+    def test_compare(self):
+        r = {'kind': 'function', 'name': 'x', 'stage': 'poi'}
+        old = {'results': [dict(r, wall=2.0)]}
+        new = {'results': [dict(r, wall=1.0)]}
+        out = StringIO()
+        compare(old, new, out)
+        self.assertTrue('0.50' in out.getvalue().splitlines()[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
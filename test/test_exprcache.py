@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+import shutil
+import tempfile
+from sympy import sympify
+from functionplot.ExprCache import ExprCache, CacheMiss
+from functionplot import Function
+
+
+class ExprCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.cache = ExprCache()
+        self.dirs = []
+
+    def tearDown(self):
+        for d in self.dirs:
+            shutil.rmtree(d)
+
+    def square(self, expr):
+        self.calls += 1
+        return expr ** 2
+
+    def fail(self, expr):
+        self.calls += 1
+        raise NotImplementedError
+
+    def test_memoize(self):
+        square = self.cache.memoize('square')(self.square)
+        self.assertEqual(square(sympify('x+1')), sympify('(x+1)**2'))
+        self.assertEqual(square(sympify('1+x')), sympify('(x+1)**2'))
+        self.assertEqual(square(sympify('x')), sympify('x**2'))
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()['square'], (1, 2))
+
+    def test_exception(self):
+        fail = self.cache.memoize('fail')(self.fail)
+        self.assertRaises(NotImplementedError, fail, sympify('x'))
+        self.assertRaises(NotImplementedError, fail, sympify('x'))
+        self.assertEqual(self.calls, 1)
+
+    def test_cached_only(self):
+        square = self.cache.memoize('square')(self.square)
+        square(sympify('x'))
+        with self.cache.cached_only():
+            self.assertEqual(square(sympify('x')), sympify('x**2'))
+            self.assertRaises(CacheMiss, square, sympify('y'))
+        self.assertEqual(self.calls, 1)
+
+    def test_lru(self):
+        self.cache.max_entries = 2
+        square = self.cache.memoize('square')(self.square)
+        for e in ['x', 'y', 'x', 'z', 'x', 'y']:
+            square(sympify(e))
+        # y was the least recently used when z came in
+        self.assertEqual(self.calls, 4)
+
+    def test_disk(self):
+        d = tempfile.mkdtemp()
+        self.dirs.append(d)
+        self.cache.set_directory(d)
+        self.cache.memoize('square')(self.square)(sympify('x'))
+        # a new cache, like after a restart
+        other = ExprCache(directory=d)
+        square = other.memoize('square')(self.square)
+        self.assertEqual(square(sympify('x')), sympify('x**2'))
+        self.assertEqual(self.calls, 1)
+
+
+
+class CachedAnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.compile_expr = Function.compile_expr
+        self.compiled = 0
+
+    def tearDown(self):
+        Function.compile_expr = self.compile_expr
+
+    def counted(self, expr):
+        self.compiled += 1
+        return self.compile_expr(expr)
+
+    def test_compiled_once(self):
+        # the second time the jobs all run here, from the cache, and
+        # the expression isn't compiled for every one of them
+        f = Function.Function('x*exp(-x)', [-1.2, 1.2, -1.2, 1.2])
+        Function.compile_expr = self.counted
+        f.calc_poi()
+        self.assertEqual(self.compiled, 0)
+        self.assertTrue(len(f.poi) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import gzip
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from functionplot.FunctionGraph import FunctionGraph as FG
+from functionplot import GraphFile
+
+
+class GraphFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'graph.fplot')
+        self.fg = FG()
+        for expr in ['sin(x)', 'x^2-3', '1/(x-1)']:
+            self.fg.add_function(expr)
+        self.fg.functions[1].visible = False
+        self.fg.update_xylimits()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, d):
+        f = gzip.open(self.filename, 'wb')
+        json.dump(d, f)
+        f.close()
+
+    def read(self):
+        f = gzip.open(self.filename, 'rb')
+        d = json.load(f)
+        f.close()
+        return d
+
+    def test_round_trip(self):
+        GraphFile.save(self.fg, self.filename)
+        fg = GraphFile.load(self.filename)
+        self.assertEqual([fg.x_min, fg.x_max, fg.y_min, fg.y_max],
+                         [self.fg.x_min, self.fg.x_max,
+                          self.fg.y_min, self.fg.y_max])
+        for f, g in zip(self.fg.functions, fg.functions):
+            self.assertEqual(f.simp_expr, g.simp_expr)
+            self.assertEqual(f.period, g.period)
+            self.assertEqual(f.visible, g.visible)
+            self.assertEqual(len(f.poi), len(g.poi))
+            for p in g.poi:
+                self.assertTrue(p.function is g)
+        self.assertEqual(len(fg.intersections), 3)
+        self.assertEqual(len(fg.poi), len(self.fg.poi))
+
+    def test_samples(self):
+        GraphFile.save(self.fg, self.filename, samples=True)
+        fg = GraphFile.load(self.filename)
+        x, y = self.fg.functions[0].graph_points
+        x2, y2 = fg.functions[0].graph_points
+        self.assertEqual(list(x), list(x2))
+        self.assertEqual(list(y), list(y2))
+
+    def test_not_graph_file(self):
+        f = open(self.filename, 'wb')
+        pickle.dump(self.fg.x_min, f)
+        f.close()
+        self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                          self.filename)
+        self.write([1, 2, 3])
+        self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                          self.filename)
+
+    def test_newer_version(self):
+        GraphFile.save(self.fg, self.filename)
+        d = self.read()
+        d['version'] = GraphFile.version + 1
+        self.write(d)
+        self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                          self.filename)
+
+    def test_bad_expression(self):
+        GraphFile.save(self.fg, self.filename)
+        d = self.read()
+        d['functions'][0]['simp_expr'] = "__import__('os').getcwd()"
+        self.write(d)
+        self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                          self.filename)
+
+    def test_malformed(self):
+        GraphFile.save(self.fg, self.filename)
+        good = self.read()
+        for key, value in [('analysis', None), ('functions', {}),
+                           ('intersections', [[0, 5, []]]),
+                           ('graph', {'x_min': 'a'})]:
+            d = json.loads(json.dumps(good))
+            if value is None:
+                del d[key]
+            else:
+                d[key] = value
+            self.write(d)
+            self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                              self.filename)
+        for key, value in [('poi', [[0, 0, 12, 1]]), ('samples', ['?']),
+                           ('settings', {'expr': 'x'})]:
+            d = json.loads(json.dumps(good))
+            d['functions'][0][key] = value
+            self.write(d)
+            self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                              self.filename)
+        # truncated
+        data = open(self.filename, 'rb').read()
+        f = open(self.filename, 'wb')
+        f.write(data[:len(data) // 2])
+        f.close()
+        self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                          self.filename)
+
+    def test_legacy(self):
+        # older versions pickled the graph, with the intersections in
+        # a list
+        f, g, h = self.fg.functions
+        self.fg.intersections = [[f.simp_expr, g.simp_expr, xc, yc]
+                                 for xc, yc in
+                                 self.fg.intersections.values()[0]]
+        out = open(self.filename, 'wb')
+        pickle.dump(self.fg, out)
+        out.close()
+        fg = GraphFile.load(self.filename)
+        self.assertEqual([f.expr for f in fg.functions],
+                         ['sin(x)', 'x^2-3', '1/(x-1)'])
+        self.assertFalse(fg.functions[1].visible)
+        self.assertEqual(len(fg.intersections), 3)
+        self.assertEqual([len(f.poi) for f in fg.functions],
+                         [len(f.poi) for f in self.fg.functions])
+
+    def test_legacy_code(self):
+        # pickles that would run code are not loaded
+        for data in ["cos\nsystem\n(S'true'\ntR.",
+                     "csympy.functions.elementary.trigonometric\nsin\n"
+                     "(S'__import__(\"os\").getcwd()'\ntR."]:
+            f = open(self.filename, 'wb')
+            f.write(data)
+            f.close()
+            self.assertRaises(GraphFile.FormatError, GraphFile.load,
+                              self.filename)
+
+    def test_stale_analysis(self):
+        GraphFile.save(self.fg, self.filename)
+        d = self.read()
+        d['analysis'] = 0
+        d['functions'][2]['poi'] = []
+        self.write(d)
+        fg = GraphFile.load(self.filename)
+        self.assertEqual(len(fg.functions[2].poi),
+                         len(self.fg.functions[2].poi))
+        self.assertFalse(fg.functions[1].visible)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+from functionplot.FunctionGraph import FunctionGraph as FG
+from functionplot.PointOfInterest import PointOfInterest as POI
+
+
+class Visible:
+    visible = True
+
+
+class GroupingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fg = FG()
+        self.fg.x_min, self.fg.x_max = 0, 100
+        self.fg.y_min, self.fg.y_max = 0, 100
+        self.f = Visible()
+
+    def poi(self, x, y):
+        return POI(x, y, 2, function=self.f)
+
+    def test_chain(self):
+        # points close to each other in a chain end up in one group
+        points = [self.poi(10 + 0.9 * i, 10) for i in xrange(5)] + \
+            [self.poi(50, 50), self.poi(50.5, 80)]
+        grouped = self.fg.grouped_poi(points)
+        self.assertEqual(len(grouped), 3)
+        self.assertEqual(grouped[0].point_type, 9)
+        self.assertEqual(grouped[0].size, 5)
+        self.assertAlmostEqual(grouped[0].x, 11.8)
+        self.assertEqual([(p.x, p.y, p.function) for p in grouped[1:]],
+                         [(50, 50, self.f), (50.5, 80, self.f)])
+
+    def test_hidden(self):
+        hidden = Visible()
+        hidden.visible = False
+        points = [self.poi(10, 10), POI(10, 10, 2, function=hidden)]
+        grouped = self.fg.grouped_poi(points)
+        self.assertEqual([p.function for p in grouped], [self.f])
+
+    def test_many(self):
+        # 100 rows, 2 apart, of 200 points 0.5 apart
+        points = []
+        for i in xrange(100):
+            for j in xrange(100):
+                points.append(self.poi(i, 2 * j))
+                points.append(self.poi(i + 0.5, 2 * j))
+        grouped = self.fg.grouped_poi(points)
+        # every row is chained into a group, rows 2 apart are not
+        self.assertEqual(len(grouped), 100)
+        self.assertEqual([p.size for p in grouped], [200] * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+import time
+import numpy as np
+from sympy import sympify, pi
+from functionplot.helpers import add_edge_points, sample, hopeless, \
+    fsolve, solve_deadline, trig_period, percentile, remove_outliers, \
+    decimate
+from functionplot.Function import Function
+from functionplot.Report import Report, recording
+
+inf = np.inf
+
+
+class EdgePointsTest(unittest.TestCase):
+
+    def test_consecutive_inf_removed(self):
+        x = np.arange(6.0)
+        y = np.array([0, inf, inf, inf, -inf, -inf])
+        x, y = add_edge_points(x, y, -1, 1)
+        self.assertEqual(list(y), [0, inf, -inf])
+        self.assertEqual(list(x), [0, 1, 4])
+
+    def test_edge_points(self):
+        x = np.arange(5.0)
+        y = np.array([0.5, inf, 0.8, -0.5, -inf])
+        x, y = add_edge_points(x, y, -1, 1)
+        # the curve goes up to the top edge and comes back, then
+        # goes down to the bottom edge
+        self.assertEqual(list(x), [0, 0, 1, 2, 2, 3, 3, 4])
+        self.assertEqual(list(y), [0.5, 1, inf, 1, 0.8, -0.5, -1, -inf])
+
+
+class SampleTest(unittest.TestCase):
+
+    def test_refines_sharp_features(self):
+        x, y = sample(lambda x: np.sin(1 / x), np.linspace(-1, 1, 1000))
+        self.assertTrue(len(x) > 2000)
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertTrue(np.array_equal(y[0], np.sin(1 / x)))
+
+    def test_point_budget(self):
+        x, y = sample(lambda x: np.sin(1 / x), np.linspace(-1, 1, 1000),
+                      tol=1e-6, max_points=5000)
+        self.assertEqual(len(x), 5000)
+        self.assertTrue(np.all(np.diff(x) > 0))
+
+    def test_constant(self):
+        self.assertRaises(IndexError, sample, lambda x: 2,
+                          np.linspace(-1, 1, 100))
+
+
+class DecimateTest(unittest.TestCase):
+
+    def test_peaks(self):
+        x = np.linspace(-10, 10, 100001)
+        y = np.sin(50 * x)
+        xd, yd = decimate(x, y, -10, 10, 500)
+        # two points per column, and the last one
+        self.assertEqual(len(xd), 1001)
+        self.assertAlmostEqual(yd.max(), 1, 6)
+        self.assertAlmostEqual(yd.min(), -1, 6)
+        self.assertTrue((np.diff(xd) > 0).all())
+
+    def test_breaks(self):
+        x = np.linspace(0, 1, 10001)
+        y = x.copy()
+        y[5000] = np.inf
+        xd, yd = decimate(x, y, 0, 1, 100)
+        # the break and the points next to it are kept
+        self.assertEqual(list(xd[(xd >= x[4999]) & (xd <= x[5001])]),
+                         list(x[4999:5002]))
+
+    def test_few_points(self):
+        x = np.linspace(0, 1, 100)
+        self.assertEqual(len(decimate(x, x, 0, 1, 100)[0]), 100)
+
+
+class PeriodTest(unittest.TestCase):
+
+    def test_trig_period(self):
+        self.assertEqual(trig_period(sympify('sin(2*x)+cos(3*x)')), 2 * pi)
+        self.assertEqual(trig_period(sympify('tan(x/2)')), 2 * pi)
+        self.assertEqual(trig_period(sympify('sin(pi*x)')), 2)
+        self.assertTrue(trig_period(sympify('x*sin(x)')) is None)
+        self.assertTrue(trig_period(sympify('sin(x)+sin(pi*x)')) is None)
+
+    def test_trig_period_constant(self):
+        # trigonometric functions of constants don't change the period
+        self.assertEqual(trig_period(sympify('sin(x)+cos(1)')), 2 * pi)
+        self.assertEqual(trig_period(sympify('sin(x)*cos(2)')), 2 * pi)
+        self.assertTrue(trig_period(sympify('cos(1)')) is None)
+
+    def test_function_period(self):
+        # 2*pi is a period of sin(x)**2, but pi is the smallest one
+        f = Function('sin(x)^2', [-5, 5, -5, 5])
+        self.assertTrue(f.periodic)
+        self.assertEqual(f.period, pi)
+
+
+class OutliersTest(unittest.TestCase):
+
+    def test_percentile(self):
+        # the k-th of n values is at the 100k/(n+1) percentile
+        a = [9, 1, 3, 7, 5, 2, 8, 4, 6]
+        self.assertEqual(list(percentile(a, [10, 50, 75])), [1, 5, 7.5])
+
+    def test_remove_outliers(self):
+        a = [1, 2, 3, 4, 5, 6, 7, 8, 9, 1000, -1000]
+        self.assertEqual(list(remove_outliers(a)), range(1, 10) + [5, 5])
+
+
+class SolveTest(unittest.TestCase):
+
+    def test_hopeless(self):
+        for e in ['x-cos(x)', 'tan(x)-x', 'exp(x)+sin(x)',
+                  '(x*cos(x)-sin(x))/x**2']:
+            self.assertTrue(hopeless(sympify(e)))
+        for e in ['x**2-1', 'sin(x)', 'x*sin(x)', 'sin(x)/x',
+                  'sin(x)+cos(2*x)', 'x*exp(x)-1']:
+            self.assertFalse(hopeless(sympify(e)))
+
+    def test_cancelled(self):
+        report = Report()
+        expr = sympify('x**3-7*x+1')
+        with recording(report), solve_deadline(time.time() - 1):
+            self.assertEqual(fsolve(expr), None)
+        self.assertEqual(report.phases[0].outcome, 'cancelled')
+        # a cancelled solve is not cached
+        self.assertEqual(len(fsolve(expr)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+from functionplot.FunctionGraph import FunctionGraph as FG
+
+
+class IntersectionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fg = FG()
+        self.fg.add_function('2x+5')
+        self.fg.add_function('(x-2)^2-6')
+
+    def points(self):
+        return sorted((round(p.x, 2), round(p.y, 2)) for p in self.fg.poi)
+
+    def test_add(self):
+        self.assertEqual(self.points(), [(-1, 3), (7, 19)])
+        self.fg.add_function('x')
+        self.assertEqual(len(self.fg.intersections), 3)
+        self.assertEqual(self.points(), [(-5, -5), (-1, 3), (-0.37, -0.37),
+                                         (5.37, 5.37), (7, 19)])
+
+    def test_remove(self):
+        self.fg.add_function('x')
+        self.fg.remove_function(0)
+        self.assertEqual(len(self.fg.intersections), 1)
+        self.assertEqual(self.points(), [(-0.37, -0.37), (5.37, 5.37)])
+        for p in self.fg.poi:
+            self.assertTrue(self.fg.functions[0] in p.function)
+
+    def test_recalc(self):
+        # stored intersections are not calculated again
+        self.fg.report.clear()
+        self.fg.calc_intersections()
+        self.assertEqual(self.fg.report.find('fsolve'), [])
+        self.assertEqual(self.points(), [(-1, 3), (7, 19)])
+
+    def test_progress(self):
+        calls = []
+        self.fg.add_function('x', lambda done, total:
+                             calls.append((done, total)))
+        self.assertEqual(calls[0][1], 2)
+        self.assertEqual(calls[-1], (2, 2))
+        # POIs come in the order of the pairs
+        self.assertEqual([p.function[1].expr for p in self.fg.poi],
+                         ['2*x+5'] * 3 + ['(x-2)^2-6'] * 2)
+
+    def test_analyse_function(self):
+        fg = FG()
+        fg.add_function('2x+5')
+        limits = fg.get_limits()
+        f = fg.new_function('exp(x)-3')
+        self.assertEqual(fg.new_function('x+'), None)
+        changes = []
+        fg.analyse_function(f, changes.append)
+        # nothing changes until the changes are made
+        self.assertEqual(len(fg.functions), 1)
+        self.assertEqual(f.poi, [])
+        self.assertEqual(fg.poi, [])
+        self.assertEqual(len(fg.intersections), 0)
+        self.assertEqual(fg.get_limits(), limits)
+        # the function is added before it's analysed, then POIs come
+        # in as they are found
+        self.assertTrue(len(changes) > 3)
+        changes[0]()
+        self.assertEqual(fg.functions[-1], f)
+        self.assertFalse(f.analysed)
+        for change in changes[1:]:
+            change()
+        self.assertTrue(f.analysed)
+        self.fg.add_function('exp(x)-3')
+        g = self.fg.functions[-1]
+        self.assertEqual([(p.x, p.y, p.point_type) for p in f.poi],
+                         [(p.x, p.y, p.point_type) for p in g.poi])
+        for p in f.poi:
+            self.assertTrue(p.function is f)
+        self.assertEqual(len(fg.poi), 1)
+        self.assertEqual(len(fg.intersections), 1)
+
+    def test_old_format(self):
+        f, g = self.fg.functions
+        key = list(self.fg.intersections)[0]
+        state = self.fg.__getstate__()
+        state['intersections'] = [[f.simp_expr, g.simp_expr, xc, yc]
+                                  for xc, yc in self.fg.intersections[key]]
+        fg = FG()
+        fg.__setstate__(state)
+        self.assertEqual(fg.intersections, self.fg.intersections)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+import numpy as np
+from sympy import sympify, diff, Symbol
+from functionplot.intervals import compile_interval, isolate_roots
+from functionplot.helpers import compile_expr
+
+
+class IntervalsTest(unittest.TestCase):
+
+    def test_enclosure(self):
+        # the values at points inside every interval must be inside
+        # the bounds
+        rng = np.random.RandomState(0)
+        lo = rng.uniform(-10, 10, 200)
+        hi = lo + rng.uniform(0, 2, 200)
+        for e in ['x**3 - 2*x', 'sin(x)*cos(2*x)', 'exp(-x**2)',
+                  'Abs(x - 1) + tan(x)', 'sqrt(x) - log(x)', 'atan(x)/x']:
+            expr = sympify(e)
+            f, func = compile_interval(expr), compile_expr(expr)
+            with np.errstate(all='ignore'):
+                flo, fhi = f(lo, hi)
+                for t in np.linspace(0, 1, 7):
+                    y = func(lo + t * (hi - lo))
+                    ok = np.isnan(y) | ((flo <= y) & (y <= fhi))
+                    self.assertTrue(ok.all(), e)
+
+    def test_tangential(self):
+        x = Symbol('x')
+        expr = sympify('(x - 1)**2*(x + 3)')
+        r = isolate_roots(expr, -20, 20, diff(expr, x))
+        self.assertEqual(len(r), 2)
+        self.assertAlmostEqual(r[0], -3)
+        self.assertAlmostEqual(r[1], 1)
+
+    def test_singularity(self):
+        # sin(x)/x can't be bounded well near 0, it's sampled there
+        x = Symbol('x')
+        expr = sympify('sin(x)/x')
+        r = isolate_roots(expr, -10, 10, diff(expr, x), max_work=2000)
+        self.assertEqual(len(r), 6)
+        self.assertAlmostEqual(r[3], np.pi)
+
+    def test_no_roots(self):
+        self.assertEqual(len(isolate_roots(sympify('1/x'), -5, 5)), 0)
+        self.assertEqual(len(isolate_roots(sympify('3'), -5, 5)), 0)
+        self.assertTrue(isolate_roots(sympify('gamma(x)'), -5, 5) is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 
 import unittest
 from functionplot.FunctionGraph import FunctionGraph as FG
+from functionplot.Function import Function
 
 class PoiTest(unittest.TestCase):
 
@@ -120,6 +121,17 @@ class PoiTest(unittest.TestCase):
                    (4.71, 0, 8), (1.57, 0, 8), (0, 1, 3)]
         self.assertPoiAtLeastApprox(poi, correct)
 
+    def test_polynomial(self):
+        # polynomials don't need sympy to solve anything
+        f = Function('x^3-x', [-1.2, 1.2, -1.2, 1.2])
+        self.assertEqual(len(f.report.find('_calc_poi_polynomial')), 1)
+        self.assertEqual(f.report.find('fsolve'), [])
+        poi = [(p.x, p.y, p.point_type) for p in f.poi]
+        correct = [(-1, 0, 2), (0, 0, 2), (1, 0, 2), (-0.58, 0.38, 4),
+                   (0.58, -0.38, 4), (0, 0, 5), (-0.82, 0.27, 8),
+                   (0, 0, 8), (0.82, -0.27, 8), (0, 0, 3)]
+        self.assertPoiApprox(poi, correct)
+
     def test_asymptotes(self):
         self.fg.add_function('(2x+1)/(x+1)')
         poi = self.get_poi(self.fg)
@@ -127,6 +139,39 @@ class PoiTest(unittest.TestCase):
                    (0, 1, 8), (0, 1, 3)]
         self.assertPoi(poi, correct)
 
+    def test_rational(self):
+        # asymptotes of rational functions don't need pod and limit
+        f = Function('(3x^2+1)/(2x^2-8)', [-5, 5, -5, 5])
+        self.assertEqual(len(f.report.find('_calc_asym_rational')), 1)
+        self.assertEqual(f.report.find('pod'), [])
+        asym = sorted((p.x, p.y, p.point_type) for p in f.poi
+                      if p.point_type in (6, 7))
+        self.assertEqual(asym, [(-2, 0, 6), (0, 1.5, 7), (2, 0, 6)])
+
+    def get_asymptotes(self, expr):
+        f = Function(expr, [-5, 5, -5, 5])
+        self.assertEqual(len(f.report.find('_calc_asym_rational')), 1)
+        return sorted((p.x, p.y, p.point_type) for p in f.poi
+                      if p.point_type in (6, 7))
+
+    def test_rational_near_complex(self):
+        # x^2+0.0000001 has no real roots, however close they are
+        self.assertEqual(self.get_asymptotes('1/(x^2+0.0000001)'),
+                         [(0, 0, 7)])
+
+    def test_rational_repeated(self):
+        self.assertEqual(self.get_asymptotes('1/((x-1)^2*(x+2))'),
+                         [(-2, 0, 6), (0, 0, 7), (1, 0, 6)])
+        self.assertEqual(self.get_asymptotes('x/((x-1)*(x-1.0005))'),
+                         [(0, 0, 7), (1, 0, 6), (1.0005, 0, 6)])
+
+    def test_rational_not_numbers(self):
+        # the coefficients of the denominator aren't all numbers
+        f = Function('1/(x^2-pi)', [-5, 5, -5, 5])
+        self.assertEqual(f.report.find('_calc_asym_rational'), [])
+        asym = sorted(round(p.x, 6) for p in f.poi if p.point_type == 6)
+        self.assertEqual(asym, [-1.772454, 1.772454])
+
     def test_intersections(self):
         self.fg.add_function('2x+5')
         self.fg.add_function('-(x-1)^3-2')
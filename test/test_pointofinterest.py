@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import pickle
+import unittest
+from sympy import zoo
+from functionplot.PointOfInterest import PointOfInterest as POI, \
+    POITable, table_of, concat
+
+
+class Function:
+
+    def __init__(self, visible):
+        self.visible = visible
+
+
+class POITableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.f = Function(True)
+        self.g = Function(False)
+        self.points = [POI(0, 0, 0), POI(1, 2, 2, function=self.f),
+                       POI(3, zoo, 6, function=self.f),
+                       POI(4, 5, 1, function=[self.f, self.g]),
+                       POI(6, 7, 4, function=self.g)]
+        self.t = POITable(self.points)
+
+    def test_columns(self):
+        self.assertEqual(self.t.functions, [self.f, self.g])
+        self.assertEqual(self.t.owner.tolist(),
+                         [[-1, -1], [0, 0], [0, 0], [0, 1], [1, 1]])
+        self.assertEqual(self.t.x.tolist(), [0, 1, 3, 4, 6])
+        self.assertEqual(self.t.point_type.tolist(), [0, 2, 6, 1, 4])
+
+    def test_mask(self):
+        enabled = [True] * 10
+        self.assertEqual(self.t.mask(enabled).tolist(),
+                         [True, True, True, False, False])
+        enabled[2] = False
+        t = self.t.take(self.t.mask(enabled))
+        self.assertEqual([(p.x, p.point_type, p.function) for p in t],
+                         [(0, 0, None), (3, 6, self.f)])
+        self.assertEqual(t.y[0], 0)
+        self.assertNotEqual(t.y[1], t.y[1])
+
+    def test_point(self):
+        p = self.t.point(3)
+        self.assertEqual((p.x, p.y, p.point_type, p.size), (4, 5, 1, 1))
+        self.assertEqual(p.function, [self.f, self.g])
+
+    def test_table_of(self):
+        # the table is kept until the POIs change
+        self.f.poi = self.points[1:3]
+        t = table_of(self.f)
+        self.assertTrue(table_of(self.f) is t)
+        self.f.poi.append(POI(8, 9, 2, function=self.f))
+        self.assertEqual(len(table_of(self.f)), 3)
+        self.f.poi = self.points[1:2]
+        self.assertEqual(table_of(self.f).x.tolist(), [1])
+
+    def test_concat(self):
+        t = concat([POITable(self.points[3:]), POITable(self.points[:3])])
+        self.assertEqual(t.functions, [self.f, self.g])
+        self.assertEqual(t.owner.tolist(),
+                         [[0, 1], [1, 1], [-1, -1], [0, 0], [0, 0]])
+        self.assertEqual(t.x.tolist(), [4, 6, 0, 1, 3])
+        self.assertEqual(len(concat([])), 0)
+
+    def test_empty(self):
+        t = POITable()
+        self.assertEqual(len(t.take(t.mask([True] * 10))), 0)
+
+    def test_pickle(self):
+        p = pickle.loads(pickle.dumps(self.points[1]))
+        self.assertEqual((p.x, p.y, p.point_type, p.size, p.color),
+                         (1, 2, 2, 1, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from functionplot.FunctionGraph import FunctionGraph as FG
+from functionplot.Renderer import Renderer
+
+
+class RendererTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fg = FG()
+        self.fg.add_function('x^3-x')
+        self.fg.add_function('2x+5')
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        self.ax = fig.add_subplot(111)
+        self.r = Renderer(self.ax, ['red', 'blue'])
+
+    def offsets(self, name):
+        return len(self.r.collections[name].get_offsets())
+
+    def test_update(self):
+        self.r.update(self.fg)
+        artists = len(self.ax.get_children())
+        self.assertEqual(len(self.r.lines), 2)
+        self.assertEqual(self.offsets('intersections'), 1)
+        self.assertTrue(self.offsets('points') > 0)
+        # nothing new is added when updating again
+        self.fg.functions[1].visible = False
+        self.r.update(self.fg)
+        self.assertEqual(len(self.r.lines), 1)
+        self.assertEqual(self.offsets('intersections'), 0)
+        self.assertEqual(len(self.ax.get_children()), artists - 1)
+
+    def test_hidden_poi(self):
+        self.fg.show_poi = False
+        self.r.update(self.fg)
+        for name in self.r.collections:
+            self.assertEqual(self.offsets(name), 0)
+
+    def test_export(self):
+        f = self.fg.functions[0]
+        f.resolution = 20000
+        self.fg.update_graph_points()
+        self.r.update(self.fg)
+        shown = len(self.r.lines[0].get_xdata())
+        self.assertTrue(shown < len(f.graph_points[0]))
+        self.assertTrue(shown <= 2 * self.ax.bbox.width + 10)
+        # lines are more detailed while exporting
+        lengths = []
+        self.ax.figure.savefig = lambda filename, dpi: lengths.append(
+            len(self.r.lines[0].get_xdata()))
+        self.r.export(self.fg, 'graph.png', 300)
+        self.assertTrue(lengths[0] > shown)
+        self.assertEqual(len(self.r.lines[0].get_xdata()), shown)
+
+    def test_pan(self):
+        self.r.update(self.fg)
+        self.r.start_pan()
+        self.fg.x_min -= 1
+        self.fg.x_max -= 1
+        self.fg.update_graph_points()
+        self.r.pan(self.fg)
+        self.assertEqual(self.ax.get_xlim(),
+                         (self.fg.x_min, self.fg.x_max))
+        x = self.r.lines[0].get_xdata()
+        graph_x = self.fg.functions[0].graph_points[0]
+        self.assertEqual((x[0], x[-1]), (graph_x[0], graph_x[-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+from functionplot.Report import Report, recording, phase, timed, \
+    add_hook, remove_hook
+from functionplot.Function import Function
+
+
+@timed('manual fallback')
+def _manual():
+    return [1, 2, 3]
+
+
+class ReportTest(unittest.TestCase):
+
+    def test_recording(self):
+        report = Report()
+        phases = []
+        add_hook(phases.append)
+        try:
+            # no report to record in
+            with phase('nowhere'):
+                pass
+            with recording(report):
+                with phase('solve', 'x-1') as p:
+                    p.outcome = 'solved'
+                _manual()
+        finally:
+            remove_hook(phases.append)
+        self.assertEqual([p.name for p in report.phases],
+                         ['solve', '_manual'])
+        self.assertEqual(report.phases[1].outcome, 'manual fallback')
+        self.assertEqual(report.phases[1].size, 3)
+        self.assertEqual(len(phases), 3)
+        count, total, outcomes = report.summary()['solve']
+        self.assertEqual((count, outcomes), (1, {'solved': 1}))
+
+    def test_error(self):
+        report = Report()
+        try:
+            with recording(report), phase('fail'):
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(report.find(outcome='error')[0].name, 'fail')
+
+    def test_function(self):
+        f = Function('x*exp(-x)', [-1.2, 1.2, -1.2, 1.2])
+        names = set(p.name for p in f.report.phases)
+        for name in ['_simplify_expr', 'sample', 'fsolve',
+                     '_calc_x_intercepts', '_calc_min_max', 'pod']:
+            self.assertTrue(name in names)
+        solved = f.report.find('fsolve', 'solved')
+        self.assertTrue(len(solved) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
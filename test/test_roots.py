@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+import numpy as np
+from functionplot.roots import find_roots, real_roots
+
+
+class RootsTest(unittest.TestCase):
+
+    def test_sin(self):
+        r = find_roots(np.sin, -10, 10)
+        self.assertEqual(len(r), 7)
+        for i, xc in enumerate(r):
+            self.assertAlmostEqual(xc, (i - 3) * np.pi, places=12)
+
+    def test_derivative(self):
+        f = lambda x: x ** 3 - 7 * x + 1
+        df = lambda x: 3 * x ** 2 - 7
+        r = find_roots(f, -10, 10, dfunc=df)
+        self.assertEqual(len(r), 3)
+        for xc in r:
+            self.assertAlmostEqual(f(xc), 0, places=12)
+
+    def test_multiple_root(self):
+        r = find_roots(lambda x: (x - 1) ** 3, -10, 10)
+        self.assertEqual(len(r), 1)
+        self.assertAlmostEqual(r[0], 1, places=12)
+
+    def test_poles_and_jumps(self):
+        self.assertEqual(len(find_roots(lambda x: 1 / x, -10, 10)), 0)
+        self.assertEqual(len(find_roots(lambda x: x / abs(x), -10, 10)), 0)
+        r = find_roots(np.tan, -5, 5)
+        self.assertEqual(len(r), 3)
+        self.assertAlmostEqual(r[2], np.pi, places=12)
+
+    def test_constant(self):
+        self.assertEqual(len(find_roots(lambda x: 2, -10, 10)), 0)
+
+    def test_real_roots(self):
+        self.assertEqual(list(real_roots([1, 0, -1])), [-1, 1])
+        self.assertEqual(len(real_roots([1, 0, 1])), 0)
+        self.assertEqual(len(real_roots([0, 0, 2])), 0)
+        # a triple root is reported once
+        r = real_roots(np.poly([1, 1, 1, -2]))
+        self.assertEqual(len(r), 2)
+        self.assertAlmostEqual(r[0], -2, places=12)
+        self.assertEqual(r[1], 1)
+
+    def test_real_roots_multiple(self):
+        # (x-1)^12, its root, minimum and inflection point
+        c = np.poly([1] * 12)
+        self.assertEqual(list(real_roots(c)), [1])
+        self.assertEqual(list(real_roots(np.polyder(c))), [1])
+        self.assertEqual(list(real_roots(np.polyder(c, 2))), [1])
+
+    def test_real_roots_close(self):
+        # (x-1)*(x-1.0005)
+        self.assertEqual(list(real_roots([1, -2.0005, 1.0005])),
+                         [1, 1.0005])
+
+    def test_real_roots_near_complex(self):
+        # the roots of x^2+0.0000001 are +-0.000316i
+        self.assertEqual(len(real_roots([1, 0, 0.0000001])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import unittest
+import numpy as np
+from functionplot.SampleCache import SampleCache
+
+
+class SampleCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.cache = SampleCache(max_points=5000)
+
+    def func(self, x):
+        self.calls.append((x[0], x[-1]))
+        return np.sin(x)
+
+    def test_pan(self):
+        x, y = self.cache.get(self.func, -5, 5, 1000)
+        self.calls = []
+        x, y = self.cache.get(self.func, -4, 6, 1000)
+        # only the newly exposed strip is sampled
+        self.assertEqual(self.calls[0], (5, 6))
+        self.assertTrue(min(c[0] for c in self.calls) >= 5)
+        self.assertTrue(x[0] <= -4 and x[-1] >= 6)
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertTrue(np.array_equal(y, np.sin(x)))
+
+    def test_zoom(self):
+        self.cache.get(self.func, -5, 5, 1000)
+        self.calls = []
+        # zooming out reuses the finer samples in the middle
+        self.cache.get(self.func, -20, 20, 1000)
+        self.assertEqual(sorted(self.calls)[0][1], -5)
+        self.calls = []
+        # zooming back in, the coarse samples are not good enough
+        self.cache.get(self.func, -1, 1, 1000)
+        self.assertEqual(self.calls[0], (-1, 1))
+
+    def test_memory_cap(self):
+        for i in xrange(10):
+            self.cache.get(self.func, 100 * i, 100 * i + 10, 1000)
+        self.assertTrue(self.cache.points <= 5000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import threading
+import time
+import unittest
+from functionplot.Scheduler import Scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.runs = []
+        self.results = []
+
+    def job(self, n):
+        self.runs.append(n)
+        time.sleep(0.05)
+        return n * 2
+
+    def done(self, ticket, result):
+        self.results.append((ticket, result))
+
+    def test_coalesce(self):
+        s = Scheduler(self.job, self.done, delay=0.02)
+        for n in xrange(10):
+            s.submit(n)
+        s.wait()
+        self.assertEqual(self.runs, [9])
+        self.assertEqual(self.results, [(10, 18)])
+
+    def test_stale(self):
+        started = threading.Event()
+
+        def job(n):
+            started.set()
+            return self.job(n)
+        s = Scheduler(job, self.done, delay=0)
+        s.submit(1)
+        started.wait()
+        # the first run is stale by the time it ends
+        s.submit(2)
+        s.wait()
+        self.assertEqual(self.runs, [1, 2])
+        self.assertEqual(self.results, [(2, 4)])
+        self.assertTrue(s.is_latest(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
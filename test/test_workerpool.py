@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# vim:et:sta:sts=4:sw=4:ts=8:tw=79:
+
+import time
+import unittest
+from functionplot.WorkerPool import WorkerPool
+
+
+def square(x):
+    return x * x
+
+
+def sleep(t):
+    time.sleep(t)
+    return t
+
+
+def fail():
+    raise ValueError
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_results_in_order(self):
+        tasks = [(square, (i,)) for i in xrange(10)]
+        self.assertEqual(self.pool.run(tasks), [i * i for i in xrange(10)])
+
+    def test_exception(self):
+        self.assertEqual(self.pool.run([(fail, ()), (square, (3,))]),
+                         [None, 9])
+
+    def test_timeout_replaces_worker(self):
+        self.assertEqual(self.pool.apply(sleep, (10,), timeout=0.5), None)
+        # the stuck worker was killed, the pool still works
+        self.assertEqual(self.pool.run([(square, (2,)), (square, (4,))],
+                                       timeout=5), [4, 16])
+
+if __name__ == '__main__':
+    unittest.main()